@@ -6,11 +6,11 @@
 """
 
 # internal modules
-import argparse, asyncio, concurrent.futures, configparser, csv, datetime
+import argparse, asyncio, base64, collections, concurrent.futures, configparser, csv, datetime
 import fnmatch, functools, getpass, grp, hashlib, importlib.metadata, inspect
 import io, itertools, json, linecache, math, os, pathlib, platform, pwd, random
-import re, shlex, shutil, socket, stat, string, subprocess, sys, tarfile
-import tempfile, textwrap, time, traceback, tqdm
+import re, shlex, shutil, socket, sqlite3, stat, string, subprocess, sys, tarfile
+import tempfile, textwrap, threading, time, traceback, tqdm
 
 # external modules
 from textual.widgets import DataTable, Footer, Button
@@ -30,6 +30,12 @@ import tqdm
 logger = ""
 current_aws_profile = None
 
+# The command line parser, used to rebuild the command line of Slurm jobs
+cli_parser = None
+
+# Per thread log capture, keeps the output of concurrent jobs together
+log_capture = threading.local()
+
 PROVIDERS_LIST = [
     'AWS',
     'GCS',
@@ -124,6 +130,27 @@ IDRIVE_REGIONS = [
     "in-bn"
 ]
 
+# Column layout of the CSV written by 'pwalk --header'
+PWALK_COLUMNS = {
+    'inode': 'UBIGINT',
+    'parent_inode': 'UBIGINT',
+    'depth': 'INTEGER',
+    'filename': 'VARCHAR',
+    'extension': 'VARCHAR',
+    'UID': 'BIGINT',
+    'GID': 'BIGINT',
+    'st_size': 'BIGINT',
+    'st_dev': 'UBIGINT',
+    'st_blocks': 'BIGINT',
+    'st_nlink': 'BIGINT',
+    'st_mode': 'VARCHAR',
+    'st_atime': 'BIGINT',
+    'st_mtime': 'BIGINT',
+    'st_ctime': 'BIGINT',
+    'pw_fcount': 'BIGINT',
+    'pw_dirsum': 'BIGINT'
+}
+
 
 class ConfigManager:
     ''' Froster configuration manager
@@ -168,6 +195,11 @@ class ConfigManager:
 
             self.slurm_dir = os.path.join(self.data_dir, 'slurm')
 
+            # Checksums of files that did not change since they were hashed. One database
+            # per host, jobs on other nodes never share it over the network file system
+            self.checksum_cache_file = os.path.join(
+                self.data_dir, f'checksums-{socket.gethostname()}.db')
+
             # Froster's configuration directory
             xdg_config_home = os.environ.get('XDG_CONFIG_HOME')
 
@@ -197,6 +229,10 @@ class ConfigManager:
 
             # Basic setup, focus the indexer on larger folders and file sizes
             self.max_small_file_size_kib = 1024
+            self.max_tar_readahead_mib = 64
+            self.max_checksum_cache_entries = 10000000
+            self.max_hash_inflight_mib = 1024
+            self.fast_hash_algorithm = 'auto'
             self.min_index_folder_size_gib = 1
             self.min_index_folder_size_avg_mib = 10
             self.max_hotspots_display_entries = 5000
@@ -3574,569 +3610,2278 @@ class AWSBoto:
             user_monthly_unit, user_daily_cost, user_daily_unit, user_name
 
 
-class Archiver:
+class IDNameCache:
+    ''' Process-wide uid/gid to name cache
 
-    def __init__(self, args: argparse.Namespace, cfg: ConfigManager):
-        self.args = args
+    Resolving ids on LDAP/SSSD backed systems costs a network round trip per lookup.
+    This bounded (LRU) cache remembers resolved names and also failed lookups
+    (negative caching), so every id is resolved at most once per process.'''
 
-        self.cfg = cfg
+    def __init__(self, lookup, database, maxsize=65536):
+        ''' Initialize the cache with the lookup function (pwd.getpwuid or grp.getgrgid)
+        and the getent database (passwd or group) used for the bulk preload'''
 
-        self.archive_json = cfg.archive_json
+        self.lookup = lookup
+        self.database = database
+        self.maxsize = maxsize
+        self.names = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.is_preloaded = False
 
-        x = cfg.max_small_file_size_kib
-        self.thresholdKB = int(x) if x else 1024
+    def _add(self, id, name):
+        ''' Add an entry evicting the least recently used ones'''
+        self.names[id] = name
+        self.names.move_to_end(id)
+        while len(self.names) > self.maxsize:
+            self.names.popitem(last=False)
 
-        x = cfg.min_index_folder_size_gib
-        self.thresholdGB = int(x) if x else 10
+    def get(self, id):
+        ''' Get the name of the given id, None if the id cannot be resolved'''
 
-        x = cfg.min_index_folder_size_avg_mib
-        self.thresholdMB = int(x) if x else 10
+        with self.lock:
+            if id in self.names:
+                self.names.move_to_end(id)
+                return self.names[id]
 
-        x = cfg.max_hotspots_display_entries
-        global MAXHOTSPOTS
-        MAXHOTSPOTS = int(x) if x else 5000
+        try:
+            name = self.lookup(id)[0]
+        except (KeyError, OverflowError, TypeError, ValueError):
+            # Unknown id, remember the miss as well
+            name = None
 
-        self.smallfiles_tar_filename = 'Froster.smallfiles.tar'
-        self.allfiles_csv_filename = 'Froster.allfiles.csv'
-        self.md5sum_filename = '.froster.md5sum'
-        self.md5sum_restored_filename = '.froster-restored.md5sum'
-        self.where_did_the_files_go_filename = 'Where-did-the-files-go.txt'
+        with self.lock:
+            self._add(id, name)
 
-        self.dirmetafiles = [self.allfiles_csv_filename,
-                             self.md5sum_filename,
-                             self.md5sum_restored_filename,
-                             self.where_did_the_files_go_filename]
+        return name
 
-        self.grants = []
+    def preload(self):
+        ''' Bulk load all the entries of the getent database with a single call'''
 
-        # this is suppress verbose output when not in terminal
-        self.output_disable = False
-        if not sys.stdin.isatty():
-            self.output_disable = True
+        if self.is_preloaded:
+            return True
 
-    def _index_locally(self, folder):
-        '''Index the given folder for archiving'''
         try:
-            permission_denied_found = False
+            ret = subprocess.run(['getent', self.database], capture_output=True,
+                                 text=True, errors='ignore', timeout=300)
+            if ret.returncode != 0:
+                return False
 
-            # move down to class
-            daysaged = [5475, 3650, 1825, 1095, 730, 365, 90, 30]
-            TiB = 1099511627776
-            # GiB=1073741824
-            # MiB=1048576
+            with self.lock:
+                for line in ret.stdout.splitlines():
+                    # name:password:id:...
+                    fields = line.split(':')
+                    if len(fields) > 2 and fields[2].isdigit():
+                        self._add(int(fields[2]), fields[0])
 
-            # If pwalkcopy location provided, run pwalk and copy the output to the specified location every time
-            if self.args.pwalkcopy:
-                log(
-                    f'\nINDEXING {folder}" and copying output to {self.args.pwalkcopy}', flush=True)
-            else:
-                log(f'\nINDEXING {folder}', flush=True)
+            self.is_preloaded = True
+            return True
 
-                # Get the path to the hotspots CSV file
-                folder_hotspot = self.get_hotspots_path(folder)
+        except Exception:
+            return False
 
-                # If the folder is already indexed don't run pwalk again
-                if os.path.isfile(folder_hotspot):
-                    if self.args.force:
-                        # Ignore the existing file and re-index the folder
-                        pass
-                    else:
-                        log(f'FOLDER ALREADY INDEXED at {folder_hotspot}')
-                        log(f'\nUse "-f" or "--force" flag to force indexing again.\n')
-                        return True
 
-            locked_dirs = ''
+# Process-wide caches of user and group names
+user_names = IDNameCache(pwd.getpwuid, 'passwd')
+group_names = IDNameCache(grp.getgrgid, 'group')
 
-            # Run pwalk on given folder
-            with tempfile.NamedTemporaryFile() as pwalk_output:
-                with tempfile.NamedTemporaryFile() as pwalk_output_folders:
-                    with tempfile.NamedTemporaryFile() as pwalk_output_folders_converted:
 
-                        # Build the pwalk command
-                        pwalk_bin = os.path.join(self.cfg.froster_dir, 'pwalk')
-                        pwalkcmd = f'{pwalk_bin} --NoSnap --one-file-system --header'
-                        mycmd = f'{pwalkcmd} "{folder}" > {pwalk_output.name}'
+# Fast hashes of the manifest. All but sha256 need an optional module (blake3,
+# xxhash or crc32c), auto uses the first of these that is installed
+FAST_HASH_ALGORITHMS = ('blake3', 'xxh3', 'crc32c', 'sha256')
 
-                        # Add conditional logging for pwalk start
-                        if not use_slurm(self.args.noslurm):
-                            log(f'  Running pwalk filesystem scan on "{folder}"...')
 
-                        # Run the pwalk command
-                        ret = subprocess.run(mycmd, shell=True,
-                                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+def new_hash(algorithm):
+    ''' Get a hashlib like object of a checksum algorithm, None if its module is not installed'''
 
-                        # Add conditional logging for pwalk end
-                        if not use_slurm(self.args.noslurm):
-                            log(f'    ...pwalk scan complete.')
+    try:
+        if algorithm == 'md5':
+            return hashlib.md5()
+        if algorithm == 'sha256':
+            # Hardware accelerated by OpenSSL on most CPUs
+            return hashlib.sha256()
+        if algorithm == 'blake3':
+            import blake3
+            return blake3.blake3()
+        if algorithm == 'xxh3':
+            import xxhash
+            return xxhash.xxh3_128()
+        if algorithm == 'crc32c':
+            import crc32c
+            return crc32c.CRC32CHash()
+    except ImportError:
+        return None
 
-                        # Check if the pwalk command was successful
-                        if ret.returncode != 0:
-                            log(
-                                f"\nError: command {mycmd} failed with returncode {ret.returncode}\n", file=sys.stderr)
-                            return False
+    raise ValueError(f'Unknown checksum algorithm {algorithm}')
 
-                        # Get pwalk errors
-                        lines = ret.stderr.decode(
-                            'utf-8', errors='ignore').splitlines()
-
-                        # Get the locked folders
-                        locked_dirs = '\n'.join(
-                            [l for l in lines if "Locked Dir:" in l])
-
-                        # Get the permission denied errors
-                        for item in lines:
-                            if "Permission denied" in item:
-                                log(textwrap.dedent(f'''
-                                WARNING:
-                                    You don't have enough permissions in one or more files or folders.
-                                    First error message with permission denied:
-
-                                        "{item}"
-
-                                    You can check the permissions of the folders using the command:
-                                        froster index --permissions "/your/folder"
-                                '''))
-                                permission_denied_found = True
-                                break
-
-                        if locked_dirs:
-                            log('\n'+locked_dirs)
-                            log(textwrap.dedent(f'''
-                            WARNING:
-                                You cannot access the locked folder(s) 
-                                above, because you don't have permissions to see
-                                their content. You will not be able to archive these
-                                folders until you have the permissions granted.
-                                
-                                You can check the permissions of the folders using the command:
-                                  froster index --permissions "/your/folder"
-                                                
-                            '''))
 
-                            return False
+def get_fast_hash(algorithm='auto'):
+    ''' Get the fast hash algorithm to use, None for none
 
-                        # If pwalkcopy location provided, then copy the pwalk output file to the specified location
-                        if self.args.pwalkcopy:
+    auto is the first installed optional module. sha256 is slower than MD5 without
+    hardware support, it is never used by auto.'''
 
-                            copy_filename = folder.replace('/', '+') + '.csv'
-                            copy_file_path = os.path.join(
-                                self.args.pwalkcopy, copy_filename)
+    if not algorithm or algorithm == 'none':
+        return None
 
-                            # Build the copy command
-                            iconv = 'iconv'
-                            if os.path.exists('/usr/bin/iconv'):
-                                iconv = '/usr/bin/iconv'
-                            mycmd = f'{iconv} -f ISO-8859-1 -t UTF-8 {pwalk_output.name} > {copy_file_path}'
+    if algorithm == 'auto':
+        return next((a for a in FAST_HASH_ALGORITHMS
+                     if a != 'sha256' and new_hash(a) is not None), None)
 
-                            # Run the copy command
-                            result = subprocess.run(mycmd, shell=True)
+    if algorithm not in FAST_HASH_ALGORITHMS:
+        log(f'\nWarning: unknown fast hash {algorithm}, use one of {", ".join(FAST_HASH_ALGORITHMS)}, ' +
+            'auto or none. Using sha256.\n')
+        return 'sha256'
 
-                            # Check if the copy command was successful
-                            if result.returncode != 0:
-                                log(
-                                    f"\nError: command {mycmd} failed with returncode {result.returncode}\n", file=sys.stderr)
-                                return False
+    if new_hash(algorithm) is None:
+        log(f'\nWarning: the module of the fast hash {algorithm} is not installed, using sha256.\n')
+        return 'sha256'
 
-                        # Build the files removing command
-                        mycmd = f'grep -v ",-1,0$" "{pwalk_output.name}" > {pwalk_output_folders.name}'
+    return algorithm
 
-                        # Add conditional logging for grep start
-                        if not use_slurm(self.args.noslurm):
-                            log(f'  Filtering pwalk output (removing directories)...')
 
-                        # Run the files removing command
-                        result = subprocess.run(mycmd, shell=True)
+class HashEngine:
+    ''' Parallel checksums of files with bounded memory
 
-                        # Add conditional logging for grep end
-                        if not use_slurm(self.args.noslurm):
-                            log(f'    ...filtering complete.')
+    Each file is read once for all the algorithms asked for (MD5 and a fast hash).
+    Small files are hashed whole by a pool of workers. Each large file is hashed
+    sequentially (MD5 cannot be split) by a worker of a separate pool, while its
+    next chunks are read ahead by a third pool. The chunks read ahead are bounded
+    per file (readahead) and for all files together (max_inflight bytes), and no
+    pool ever waits on a task of its own pool.'''
 
-                        # Check if the files removing command was successful
-                        if result.returncode != 0:
-                            log(
-                                f"\nError: command {mycmd} failed with returncode {result.returncode}\n", file=sys.stderr)
-                            return False
+    def __init__(self, workers=8, large_workers=4, chunk_size=16*1048576, readahead=4,
+                 max_inflight=1024*1048576, large_file_size=64*1048576):
+        ''' Initialize the pools, files of large_file_size bytes or more are large'''
 
-                        # WORKAROUND: Converting file from ISO-8859-1 to utf-8 to avoid DuckDB import error
-                        # pwalk does already output UTF-8, weird, probably duckdb error
+        self.chunk_size = chunk_size
+        self.readahead = max(1, readahead)
+        self.large_file_size = large_file_size
 
-                        # Build the file conversion command
-                        mycmd = f'iconv -f ISO-8859-1 -t UTF-8 {pwalk_output_folders.name} > {pwalk_output_folders_converted.name}'
+        self.small_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers)
+        self.large_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=large_workers)
+        self.read_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=large_workers * self.readahead)
 
-                        # Add conditional logging for iconv start
-                        if not use_slurm(self.args.noslurm):
-                            log(f'  Converting character encoding...')
+        # Chunks read ahead but not hashed yet, for all large files together
+        self.budget = threading.Semaphore(
+            max(large_workers, max_inflight // chunk_size))
 
-                        # Run the file conversion command
-                        result = subprocess.run(mycmd, shell=True)
+    def __enter__(self):
+        return self
 
-                        # Add conditional logging for iconv end
-                        if not use_slurm(self.args.noslurm):
-                            log(f'    ...conversion complete.')
+    def __exit__(self, *exc):
+        self.shutdown()
 
-                        # Check if the file conversion command was successful
-                        if result.returncode != 0:
-                            log(
-                                f"\nError: command {mycmd} failed with returncode {result.returncode}\n", file=sys.stderr)
-                            return False
+    def shutdown(self):
+        ''' Wait for the pending checksums and stop the pools'''
 
-                        # Build the SQL query on the CSV file
-                        sql_query = f"""SELECT UID as User,
-                                        st_atime as AccD, st_mtime as ModD,
-                                        pw_dirsum/1073741824 as GiB,
-                                        pw_dirsum/1048576/pw_fcount as MiBAvg,
-                                        filename as Folder, GID as Group,
-                                        pw_dirsum/1099511627776 as TiB,
-                                        pw_fcount as FileCount, pw_dirsum as DirSize
-                                    FROM read_csv_auto('{pwalk_output_folders_converted.name}',
-                                            ignore_errors=1)
-                                    WHERE pw_fcount > -1 AND pw_dirsum > 0
-                                    ORDER BY pw_dirsum Desc
-                                """  # pw_dirsum > 1073741824
-
-                        # Connect to an in-memory DuckDB instance
-                        duckdb_connection = duckdb.connect(':memory:')
-
-                        # Set the number of threads to use
-                        duckdb_connection.execute(
-                            f'PRAGMA threads={self.args.cores};')
-
-                        # Add conditional logging for DuckDB start
-                        if not use_slurm(self.args.noslurm):
-                            log(f'  Analyzing folder data with DuckDB...')
-
-                        # Execute the SQL query
-                        rows = duckdb_connection.execute(sql_query).fetchall()
-
-                        # Add conditional logging for DuckDB end
-                        if not use_slurm(self.args.noslurm):
-                            log(f'    ...analysis complete.')
-
-                        # Get the column names
-                        header = duckdb_connection.execute(
-                            sql_query).description
-
-                        # Close the DuckDB connection
-                        duckdb_connection.close()
-
-            # Set up variables for the hotspots
-            totalbytes = 0
-            numhotspots = 0
-            agedbytes = [0] * len(daysaged)
+        self.small_pool.shutdown()
+        self.large_pool.shutdown()
+        self.read_pool.shutdown()
 
-            # Get the path to the hotspots CSV file
-            mycsv = self.get_hotspots_path(folder)
+    def submit(self, path, size=None, progress=None, algorithms=('md5',)):
+        ''' Hash a file in the background, returns a future of the checksums (hex) by algorithm
 
-            # Add conditional logging for CSV writing start
-            if not use_slurm(self.args.noslurm):
-                log(f'  Processing and writing hotspots CSV ({mycsv})...')
+        progress (if given) is called with the number of bytes hashed.'''
 
-            # Write the hotspots to the CSV file
-            with open(mycsv, 'w') as f:
-                writer = csv.writer(f, dialect='excel')
-                writer.writerow([col[0] for col in header])
-                # 0:Usr,1:AccD,2:ModD,3:GiB,4:MiBAvg,5:Folder,6:Grp,7:TiB,8:FileCount,9:DirSize
-                
-                # Use tqdm only if not running under Slurm and rows exist
-                iterable = rows
-                if not use_slurm(self.args.noslurm) and rows:
-                    iterable = tqdm.tqdm(rows, total=len(rows), desc="    Writing hotspots", unit="hotspot", disable=self.output_disable)
-                
-                for r in iterable:
-                    row = list(r)
-                    if row[3] >= self.thresholdGB and row[4] >= self.thresholdMB:
-                        atime = self._get_newest_file_atime(row[5], row[1])
-                        mtime = self._get_newest_file_mtime(row[5], row[2])
-                        row[0] = self.uid2user(row[0])
-                        row[1] = self.daysago(atime)
-                        row[2] = self.daysago(mtime)
-                        row[3] = int(row[3])
-                        row[4] = int(row[4])
-                        row[6] = self.gid2group(row[6])
-                        row[7] = int(row[7])
-                        writer.writerow(row)
-                        numhotspots += 1
-                        totalbytes += row[9]
-                        for i in range(0, len(daysaged)):
-                            if row[1] > daysaged[i]:
-                                if i == 0:
-                                    # Is this really 15 years ?
-                                    printdbg(
-                                        f'  {row[5]} has not been accessed for {row[1]} days. (atime = {atime})')
-                                agedbytes[i] += row[9]
-
-            # Add conditional logging for CSV writing end
-            if not use_slurm(self.args.noslurm):
-                log(f'    ...hotspots CSV written.')
+        if size is None:
+            size = os.stat(path).st_size
 
-            log(textwrap.dedent(f'''
-                Hotspots file: {mycsv}
-                    with {numhotspots} hotspots >= {self.thresholdGB} GiB
-                    with a total disk use of {round(totalbytes/TiB,3)} TiB
-                '''))
+        if size >= self.large_file_size:
+            return self.large_pool.submit(self._hash_large, path, progress, algorithms)
 
-            log(f'Total folders processed: {len(rows)}')
+        return self.small_pool.submit(self._hash_small, path, progress, algorithms)
 
-            log(f'\nINDEXING SUCCESSFULLY COMPLETED')
+    def md5sum(self, path):
+        ''' Hash a file and wait for its MD5 (hex)'''
 
-            lastagedbytes = 0
-            for i in range(0, len(daysaged)):
-                if agedbytes[i] > 0 and agedbytes[i] != lastagedbytes:
-                    # dedented multi-line removing \n
-                    log(textwrap.dedent(f'''
-                    {round(agedbytes[i]/TiB,3)} TiB have not been accessed 
-                    for {daysaged[i]} days (or {round(daysaged[i]/365,1)} years)
-                    ''').replace('\n', ''))
-                lastagedbytes = agedbytes[i]
+        return self.submit(path).result()['md5']
 
-            # Output decoration print
-            log()
+    def _hash_small(self, path, progress, algorithms):
+        ''' Checksums of a file read in one go'''
 
-            if permission_denied_found:
-                return False
-            else:
-                return True
+        hashes = [new_hash(a) for a in algorithms]
+        with open(path, 'rb') as f:
+            while chunk := f.read(1048576):
+                for h in hashes:
+                    h.update(chunk)
+                if progress:
+                    progress(len(chunk))
 
-        except Exception:
-            print_error()
-            return False
+        return {a: h.hexdigest() for a, h in zip(algorithms, hashes)}
 
-    def _slurm_cmd(self, folders, cmd_type, scheduled=None):
-        '''Execute the current command using SLURM'''
+    def _hash_large(self, path, progress, algorithms):
+        ''' Checksums of a file hashed chunk by chunk while the next chunks are read ahead'''
 
+        hashes = [new_hash(a) for a in algorithms]
+        pending = collections.deque()
+        offset = 0
+        is_eof = False
+
+        fd = os.open(path, os.O_RDONLY)
         try:
-            # Create a SlurmEssentials object
-            se = Slurm(self.args, self.cfg)
+            while not is_eof:
 
-            # Get the label for the job
-            label = self._get_hotspots_filename(
-                folders[0]).replace('.csv', '').replace(' ', '_')
+                # Read ahead, waiting for the budget only if there is nothing to hash meanwhile
+                while not is_eof and len(pending) < self.readahead and \
+                        self.budget.acquire(blocking=not pending):
+                    pending.append(self.read_pool.submit(
+                        os.pread, fd, self.chunk_size, offset))
+                    offset += self.chunk_size
 
-            # Get the shortlabel for the Slurm job
-            shortlabel = os.path.basename(folders[0])
+                future = pending.popleft()
+                try:
+                    chunk = future.result()
+                finally:
+                    self.budget.release()
 
-            # Add the original cmdline to the Slurm script
-            cmd = " ".join(map(shlex.quote, sys.argv))
+                # A short chunk is the end of the file, the chunks read beyond it are empty
+                if len(chunk) < self.chunk_size:
+                    is_eof = True
 
-            # Submit the job
-            return se.submit_job(cmd=cmd,
-                                 cmd_type=cmd_type,
-                                 label=label,
-                                 shortlabel=shortlabel,
-                                 scheduled=scheduled)
+                for h in hashes:
+                    h.update(chunk)
+                if progress:
+                    progress(len(chunk))
 
-        except Exception:
-            print_error()
-            return False
+                if is_eof:
+                    break
+        finally:
+            # The reads still running use the file descriptor
+            for future in pending:
+                future.cancel()
+            concurrent.futures.wait(pending)
+            for future in pending:
+                self.budget.release()
+            os.close(fd)
 
-    def index(self, folders):
-        '''Index the given folders for archiving'''
-        try:
-            if self._is_recursive_collision(folders):
-                log(
-                    f'\nError: You cannot index folders if there is a dependency between them. Specify only the parent folder.\n')
-                return False
+        return {a: h.hexdigest() for a, h in zip(algorithms, hashes)}
 
-            if use_slurm(self.args.noslurm):
-                return self._slurm_cmd(folders=folders, cmd_type='index')
-            else:
-                res = True
-                for folder in folders:
-                    if not self._index_locally(folder):
-                        res = False
 
-                if not res:
-                    log(f'\nWARNING: Some folders may have permission issues or are locked. Check the output above.\n')
-                    return False
+class ChecksumCache:
+    ''' Persistent (SQLite) cache of file checksums
 
-            return True
+    A checksum is reused while the file has the same device, inode, size,
+    modification and change time (ctime changes with any write, even if the
+    modification time is set back). Writes are batched, the least recently used
+    entries are evicted when the cache is closed with more than max_entries.
 
-        except Exception:
-            print_error()
-            return False
+    The cache is only an optimization: after any database error (e.g. locked)
+    it is disabled, get finds nothing and put does nothing, so all files are
+    hashed.'''
 
-    def archive_select_hotspots(self):
+    def __init__(self, path, max_entries=10000000):
+        ''' Open (or create) the cache database at path'''
 
-        # Check if the Hotspots directory exists
-        if not self.cfg.hotspots_dir or not os.path.exists(self.cfg.hotspots_dir):
-            log(
-                '\nNo folders to archive in arguments and no Hotspots CSV files found.')
+        self.path = path
+        self.max_entries = max_entries
 
-            log('\nFor archive a specific folder run:')
-            log('    froster archive "/your/folder/to/archive"')
+        os.makedirs(os.path.dirname(path), exist_ok=True, mode=0o775)
 
-            log('\n For index a folder a find hotspots run:')
-            log('    froster index "/your/folder/to/index"\n')
+        # Several archive jobs of this host may use the cache at the same time. The
+        # default rollback journal, WAL does not work on network file systems
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS checksums (
+                                       dev INTEGER, ino INTEGER, size INTEGER,
+                                       mtime_ns INTEGER, ctime_ns INTEGER,
+                                       algorithm TEXT, checksum TEXT, used REAL,
+                                       PRIMARY KEY (dev, ino, algorithm))''')
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS checksums_used ON checksums (used)')
+        self.connection.commit()
 
-            return True
+        self.new_entries = []
+        self.used_entries = []
 
-        # Get all the hotspot CSV files in the hotspots directory
-        hotspots_files = [f for f in os.listdir(
-            self.cfg.hotspots_dir) if fnmatch.fnmatch(f, '*.csv')]
+        self.hits = 0
+        self.misses = 0
 
-        # Check if there are CSV files, if don't there are no folders to archive
-        if not hotspots_files:
-            log('\nNo hotposts found. \n')
+        self.is_disabled = False
 
-            log(
-                f'You can search for hotspot by indexing folders using command:')
-            log('    froster index "/your/folder/to/index"\n')
+    def _disable(self, error):
+        ''' Stop using the cache after a database error'''
 
-            log('For archive a specific folder run:')
-            log('    froster archive "/your/folder/to/archive"\n')
+        if not self.is_disabled:
+            printdbg(f'Checksum cache {self.path} disabled: {error}')
+        self.is_disabled = True
+        self.new_entries = []
+        self.used_entries = []
 
-            return True
+    def get(self, file_stat, algorithm='md5'):
+        ''' Get the checksum of a file from its stat result, None if it is not cached or changed'''
 
-        # Sort the CSV files by their modification time in descending order (newest first)
-        hotspots_files.sort(key=lambda x: os.path.getmtime(
-            os.path.join(self.cfg.hotspots_dir, x)), reverse=True)
+        if self.is_disabled:
+            return None
 
-        # Ask the user to select a Hotspot file
-        ret = TextualStringListSelector(
-            title="Select a Hotspot file", items=hotspots_files).run()
+        try:
+            row = self.connection.execute('''SELECT size, mtime_ns, ctime_ns, checksum FROM checksums
+                                             WHERE dev = ? AND ino = ? AND algorithm = ?''',
+                                          (file_stat.st_dev, file_stat.st_ino, algorithm)).fetchone()
+        except sqlite3.Error as e:
+            self._disable(e)
+            return None
 
-        # No file selected
-        if not ret:
-            return False
+        if row is None or tuple(row[:3]) != (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ctime_ns):
+            self.misses += 1
+            return None
 
-        # Get the selected CSV file path from the first selector result
-        hotspot_selected = os.path.join(self.cfg.hotspots_dir, ret[0])
+        self.hits += 1
+        self.used_entries.append(
+            (time.time(), file_stat.st_dev, file_stat.st_ino, algorithm))
+        if len(self.used_entries) >= 1000:
+            self.flush()
 
-        # Get the path to the user-specific CSV file containing only writable folders
-        path_result, filtering_skipped = self.get_hotspot_folders(hotspot_selected)
+        return row[3]
 
-        # Determine the actual path to display in the table
-        if path_result:
-            path_to_display = path_result
-        elif filtering_skipped:
-            # Filtering skipped, use the original selected file
-            path_to_display = hotspot_selected
-        else:
-            # Filtering attempted but failed or no writable folders found
-            log(f'\nNo writable hotspots found or accessible in {hotspot_selected}.\n')
-            return True # Indicate completion, even if nothing was archived
+    def put(self, file_stat, checksum, algorithm='md5'):
+        ''' Add the checksum of a file with its stat result taken before hashing it'''
 
-        # Use TableHotspots to display the filtered list and select the specific folder row
-        app = TableHotspots(path_to_display)
-        ret = app.run() # ret can be (row_data, action) or []
+        if self.is_disabled:
+            return
 
-        if not ret:
-            # No row selected in TableHotspots or user quit
-            return False
-        elif isinstance(ret, tuple):
-            row_data, action = ret
-            # Extract the folder path from the selected row
-            if len(row_data) < 6:
-                log('Error: Hotspots table did not return all expected columns.', file=sys.stderr)
-                return False
-            # Assuming the folder path is the 6th element (index 5)
-            folder_to_archive = row_data[5]
+        self.new_entries.append((file_stat.st_dev, file_stat.st_ino, file_stat.st_size,
+                                 file_stat.st_mtime_ns, file_stat.st_ctime_ns,
+                                 algorithm, checksum, time.time()))
+        if len(self.new_entries) >= 1000:
+            self.flush()
 
-            # Permission check if filtering was skipped
-            if filtering_skipped:
-                log(f"Checking write permission for selected folder: {folder_to_archive}")
-                has_permission = self._check_path_permissions(folder_to_archive, write_only=True)
-                if not has_permission:
-                    log(f'\nError: Write permission denied for selected folder: {folder_to_archive}\n')
-                    # Ideally, we'd go back to the table here, but for simplicity, we exit.
-                    return False # Indicate failure
-                else:
-                    log("  Permission granted.")
+    def flush(self):
+        ''' Write the batched entries'''
 
-            if action == "continue":
-                # Archive the selected folders
-                return self.archive([folder_to_archive])
-            elif action == "quit":
-                # Construct the command line string
-                # Add profile if it's not the default one implicitly used
-                profile_arg = f' --profile "{self.cfg.profile.replace("profile ", "")}"' if self.cfg.profile else ""
-                # Add recursive flag if it was set
-                recursive_arg = " --recursive" if self.args.recursive else ""
-                # Add notar flag if it was set
-                notar_arg = " --no-tar" if self.args.notar else ""
-                # Add nihref if it was set
-                nih_arg = f' --nih-ref "{self.args.nihref}"' if self.args.nihref else ""
-                # Add filtering flags if they were used
-                larger_arg = f' --larger {self.args.larger}' if self.args.larger > 0 else ""
-                older_arg = f' --older {self.args.older}' if self.args.older > 0 else ""
-                newer_arg = f' --newer {self.args.newer}' if self.args.newer > 0 else ""
-                mtime_arg = " --mtime" if self.args.agemtime else ""
+        if self.is_disabled:
+            return
 
-                cmd_str = f'froster archive{profile_arg}{recursive_arg}{notar_arg}{nih_arg}{larger_arg}{older_arg}{newer_arg}{mtime_arg} "{folder_to_archive}"'
-                log(f'\nTo archive this folder later, run:\n\n    {cmd_str}\n')
-                return True # Indicate successful completion without archiving
-            else:
-                 # Should not happen with current logic, but handle defensively
-                 log(f"Internal Error: Unknown action '{action}' received.", file=sys.stderr)
-                 return False
-        else:
-            # Handle unexpected return type from app.run()
-            log(f"Internal Error: Unexpected return type from TableHotspots: {type(ret)}", file=sys.stderr)
-            return False
+        try:
+            with self.connection:
+                if self.new_entries:
+                    self.connection.executemany(
+                        'INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?, ?, ?, ?, ?)', self.new_entries)
+                if self.used_entries:
+                    self.connection.executemany('UPDATE checksums SET used = ? WHERE dev = ? AND ino = ? AND algorithm = ?',
+                                                self.used_entries)
+        except sqlite3.Error as e:
+            self._disable(e)
 
-    def _is_recursive_collision(self, folders):
-        '''Check if there is a collision between folders and recursive flag'''
-        is_collision = False
+        self.new_entries = []
+        self.used_entries = []
 
-        try:
-            for i in range(len(folders)):
-                for j in range(i + 1, len(folders)):
-                    # Check if folders[j] is a subdirectory of folders[i]
-                    if os.path.commonpath([folders[i], folders[j]]) == folders[i]:
-                        is_collision = True
-                        log(
-                            f'Folder {folders[j]} is a subdirectory of folder {folders[i]}.\n', file=sys.stderr)
+    def evict(self):
+        ''' Remove the least recently used entries above max_entries'''
 
-                    # Check if folders[i] is a subdirectory of folders[j]
-                    elif os.path.commonpath([folders[i], folders[j]]) == folders[j]:
-                        is_collision = True
-                        log(
-                            f'Folder {folders[i]} is a subdirectory of folder {folders[j]}.\n')
-        except Exception as e:
-            print_error()
-            is_collision = True
+        if self.is_disabled:
+            return
 
-        return is_collision
+        try:
+            count = self.connection.execute(
+                'SELECT count(*) FROM checksums').fetchone()[0]
 
-    def _archive_locally(self, folder_to_archive, s3_dest, is_tar, is_force):
-        '''Archive the given folder'''
+            if count > self.max_entries:
+                with self.connection:
+                    self.connection.execute('''DELETE FROM checksums WHERE rowid IN
+                                               (SELECT rowid FROM checksums ORDER BY used LIMIT ?)''',
+                                            (count - self.max_entries,))
+        except sqlite3.Error as e:
+            self._disable(e)
+
+    def close(self):
+        ''' Write the batched entries, evict and close the database'''
 
         try:
+            self.flush()
+            self.evict()
+        finally:
+            try:
+                self.connection.close()
+            except sqlite3.Error as e:
+                self._disable(e)
 
-            hashfile = os.path.join(folder_to_archive, self.md5sum_filename)
 
-            # Force flag provided, reset the folder and continue the archive process
-            if is_force:
-                if self.reset_folder(folder_to_archive):
-                    # Reset folder successful. Continue the archive process
-                    pass
-                else:
-                    # Reset folder failed. Exiting...
-                    return False
-            else:
-                # If hash file exists, check if the folder is already archived
-                if os.path.exists(hashfile):
-                    # Check if folder is archived according to our database
-                    archived_folder_info = self.froster_archives_get_entry(
-                        folder_to_archive)
+class PermissionEvaluator:
+    ''' Evaluate read and write access from stat data (mode, uid, gid)
 
-                    # Check if folder is already archived in S3
-                    rclone = Rclone(self.args, self.cfg)
-                    checksum = rclone.checksum(
-                        hashfile, s3_dest, '--max-depth', '1')
+    The user ids and the group list are resolved once, so the permissions of the
+    folders of an index need no file system calls. Only the classic mode bits are
+    evaluated: ACLs and NFS root squashing are not, so a final live check
+    (os.access) is still needed before acting on a folder.'''
 
-                    if archived_folder_info and checksum:
-                        # Folder is already archived. Print error message
-                        log(
-                            f'\nThe folder {folder_to_archive} is already archived in S3 bucket.\n')
-                        log(f'{archived_folder_info}\n')
+    def __init__(self):
+        ''' Resolve the effective user and its groups once'''
 
-                    elif archived_folder_info and not checksum:
-                        # Folder is archived in our database but checksums do not match in the S3 bucket. Print error message
-                        log(
-                            f'\nThe folder {folder_to_archive} is already archived in our database but checksums do not match in the S3 bucket.\n')
-                        log(f'{archived_folder_info}\n')
-                        log(f'\nIf you want to force the archiving process again on this folder, please us the -f or --force flag\n')
+        self.uid = os.geteuid()
+        self.groups = set(os.getgroups())
+        self.groups.add(os.getegid())
+
+    def _mode_bits(self, mode, uid, gid):
+        ''' Get the permission bits (rwx) that apply to the user'''
+
+        # pwalk stores the mode as an octal string
+        if isinstance(mode, str):
+            mode = int(mode, 8)
+
+        if uid == self.uid:
+            return (mode >> 6) & 7
+        if gid in self.groups:
+            return (mode >> 3) & 7
+        return mode & 7
+
+    def can_read(self, mode, uid, gid):
+        ''' Check the read access of the user'''
+
+        if self.uid == 0:
+            return True
+        return bool(self._mode_bits(mode, uid, gid) & 4)
+
+    def can_write(self, mode, uid, gid):
+        ''' Check the write access of the user'''
+
+        if self.uid == 0:
+            return True
+        return bool(self._mode_bits(mode, uid, gid) & 2)
+
+    def sql_can_write(self, mode='st_mode', uid='UID', gid='GID'):
+        ''' SQL expression of the write access for the octal mode string column of an index store'''
+
+        if self.uid == 0:
+            return 'TRUE'
+
+        groups = ', '.join(str(g) for g in sorted(self.groups))
+
+        return f'''(CASE WHEN {uid} = {self.uid} THEN substr({mode}, -3, 1)
+                         WHEN {gid} IN ({groups}) THEN substr({mode}, -2, 1)
+                         ELSE substr({mode}, -1, 1) END) IN ('2', '3', '6', '7')'''
+
+
+class FileSystemScanner:
+    ''' Parallel file system scanner based on os.scandir
+
+    The folders are listed by a thread pool so the metadata round trips of network
+    file systems (NFS) overlap. scan() writes the same CSV as pwalk and walk() is a
+    parallel replacement of os.walk.'''
+
+    # Same header as the pwalk output
+    PWALK_HEADER = b'inode,parent-inode,directory-depth,"filename","fileExtension",UID,GID,st_size,st_dev,st_blocks,st_nlink,"st_mode",st_atime,st_mtime,st_ctime,pw_fcount,pw_dirsum\n'
+
+    def __init__(self, threads=None, one_file_system=True, skipdirs=None, stats=None):
+        ''' Initialize the scanner with the number of threads listing folders, the
+        folder names to skip (.snapshot by default) and optionally the IndexStats
+        updated by scan_folder'''
+
+        self.threads = threads or min(64, 4 * (os.cpu_count() or 1))
+        self.one_file_system = one_file_system
+        self.skipdirs = set(skipdirs) if skipdirs is not None else {'.snapshot'}
+        self.stats = stats
+
+        # Error messages, in the same format as the pwalk errors
+        self.errors = []
+
+        self.stopped = threading.Event()
+
+    def stop(self):
+        ''' Stop a running scan or walk'''
+        self.stopped.set()
+
+    def parallel(self, task, children, top, *args):
+        ''' Run task(top, *args) and then task on the subfolders in the thread pool
+
+        Yields the results of task in top down order, a folder result is always
+        yielded before the results of its subfolders. The subfolders are taken from
+        children(result), which returns a list of argument tuples for task. It is
+        only called once the consumer is done with the result, so subfolders can be
+        pruned (like os.walk) and are never listed before their parent is processed.
+        Results of None are skipped.
+
+        Note that asking for the next result submits the subfolders of the current
+        one: a consumer that breaks on the second result (like "if root != top")
+        has up to threads subfolders listed for nothing. Closing the generator
+        drops the queued folders and does not wait for the ones being listed.'''
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.threads)
+
+        pending = {executor.submit(task, top, *args)}
+
+        try:
+            while pending and not self.stopped.is_set():
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    result = future.result()
+                    if result is None:
+                        continue
+
+                    yield result
+
+                    if self.stopped.is_set():
+                        break
+
+                    for child_args in children(result):
+                        pending.add(executor.submit(task, *child_args))
+        finally:
+            # Walk abandoned by the consumer or stopped, nothing is left running otherwise
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def list_folder(self, path, dev=None):
+        ''' List a folder, returns two lists (subfolders, files) of (path, stat) tuples
+
+        Subfolders on another device than dev (if given) and skipdirs are left out.
+        Symlinks to folders are files.'''
+
+        subfolders = []
+        files = []
+
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    entry_stat = entry.stat(follow_symlinks=False)
+                except OSError as e:
+                    self.errors.append(str(e))
+                    continue
+
+                if stat.S_ISDIR(entry_stat.st_mode):
+                    if entry.name in self.skipdirs:
+                        continue
+                    if dev is not None and entry_stat.st_dev != dev:
+                        continue
+                    subfolders.append((entry.path, entry_stat))
+                else:
+                    files.append((entry.path, entry_stat))
+
+        return subfolders, files
+
+    def scan_folder(self, path, dir_stat, parent_inode, depth):
+        ''' Scan a folder, returns its pwalk rows and the arguments to scan its subfolders'''
+
+        try:
+            subfolders, files = self.list_folder(
+                path, dir_stat.st_dev if self.one_file_system else None)
+        except PermissionError:
+            self.errors.append(f'Locked Dir: {path}')
+            return None
+        except OSError as e:
+            self.errors.append(str(e))
+            return None
+
+        rows = [self.pwalk_row(file_path, file_stat, dir_stat.st_ino, depth)
+                for file_path, file_stat in files]
+
+        dirsum = sum(file_stat.st_size for _, file_stat in files)
+        rows.append(self.pwalk_row(path, dir_stat, parent_inode,
+                                   depth, len(files), dirsum))
+
+        if self.stats is not None:
+            self.stats.add(dirs=1, files=len(files), nbytes=dirsum, depth=depth)
+
+        return b''.join(rows), [(subfolder_path, subfolder_stat, dir_stat.st_ino, depth + 1)
+                                for subfolder_path, subfolder_stat in subfolders]
+
+    def scan(self, top, out):
+        ''' Scan the top folder and write its pwalk CSV to the binary file out'''
+
+        out.write(self.PWALK_HEADER)
+
+        results = self.parallel(self.scan_folder, lambda result: result[1],
+                                top, os.lstat(top), 0, 0)
+        try:
+            batch = []
+            batch_bytes = 0
+
+            for rows, _ in results:
+                batch.append(rows)
+                batch_bytes += len(rows)
+
+                if batch_bytes >= 1024*1024:
+                    self._write(out, b''.join(batch))
+                    batch = []
+                    batch_bytes = 0
+
+            self._write(out, b''.join(batch))
+        finally:
+            results.close()
+
+    def _write(self, out, data):
+        ''' Write to out, the time blocked by the reader is added to the stats'''
+
+        start = time.perf_counter()
+        out.write(data)
+        if self.stats is not None:
+            self.stats.add_time('duckdb_wait', time.perf_counter() - start)
+
+    def _walk_folder(self, path, dev, onerror):
+        ''' List a folder for walk()'''
+
+        try:
+            with os.scandir(path) as entries:
+                dirs = []
+                files = []
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        is_dir = False
+
+                    if is_dir and dev is not None:
+                        try:
+                            if entry.stat(follow_symlinks=False).st_dev != dev:
+                                continue
+                        except OSError:
+                            continue
+
+                    if is_dir:
+                        if entry.name not in self.skipdirs:
+                            dirs.append(entry.name)
+                    else:
+                        files.append(entry.name)
+
+        except OSError as e:
+            if onerror is not None:
+                onerror(e)
+            return None
+
+        return path, dirs, files
+
+    def walk(self, top, onerror=None):
+        ''' Parallel os.walk(top, topdown=True, followlinks=False)
+
+        Yields (root, dirs, files) tuples, the top folder first and every folder
+        before its subfolders. Symlinks to folders are in files, the dirs list can be
+        modified in place to prune the walk.'''
+
+        dev = os.lstat(top).st_dev if self.one_file_system else None
+
+        return self.parallel(self._walk_folder,
+                             lambda result: [(os.path.join(result[0], d), dev, onerror)
+                                             for d in result[1]],
+                             top, dev, onerror)
+
+    @staticmethod
+    def index_name(path):
+        ''' Get the name of a path in the index (see Archiver._pwalk_feed)
+
+        A name that is valid UTF-8 is stored as is, the bytes of any other name
+        are decoded as latin-1 (DuckDB only stores valid UTF-8).'''
+
+        try:
+            path.encode('utf-8')
+            return path
+        except UnicodeEncodeError:
+            # Undecodable bytes of os.fsdecode (surrogateescape)
+            return os.fsencode(path).decode('latin-1')
+
+    @staticmethod
+    def index_path(name):
+        ''' Get the path of a name of the index, the reverse of index_name
+
+        A name whose characters are all latin-1 may come from either encoding, the
+        file system decides. Indexes written before names were stored as UTF-8 hold
+        UTF-8 bytes decoded as latin-1, they are decoded too.'''
+
+        if name.isascii():
+            return name
+
+        try:
+            raw = name.encode('latin-1')
+        except UnicodeEncodeError:
+            # Not latin-1, a UTF-8 name
+            return name
+
+        if os.path.lexists(name):
+            return name
+
+        try:
+            # Index of an older version
+            return raw.decode('utf-8')
+        except UnicodeDecodeError:
+            return os.fsdecode(raw)
+
+    @staticmethod
+    def pwalk_row(path, st, parent_inode, depth, fcount=-1, dirsum=0):
+        ''' Format a file or folder as a pwalk CSV line (folders have a file count)'''
+
+        name = FileSystemScanner.index_name(path).replace('"', '""')
+        ext = ''
+        if fcount == -1:
+            ext = os.path.splitext(name)[1].lstrip('.')
+
+        return (f'{st.st_ino},{parent_inode},{depth},"{name}","{ext}",'
+                f'{st.st_uid},{st.st_gid},{st.st_size},{st.st_dev},{st.st_blocks},'
+                f'{st.st_nlink},"{st.st_mode:07o}",{int(st.st_atime)},{int(st.st_mtime)},'
+                f'{int(st.st_ctime)},{fcount},{dirsum}\n').encode('utf-8')
+
+
+class IndexStats:
+    ''' Progress and throughput telemetry of an index run
+
+    The scanners update the counters while a background thread writes them
+    periodically as JSON (next to the hotspots file) and logs the progress.
+    Stage times are wall clock seconds of: scan or refresh (walk, convert and
+    store), export, analyze (DuckDB) and write (hotspots CSV). The time the scan
+    spent converting pwalk lines and waiting for DuckDB is also reported.'''
+
+    def __init__(self, folder, stats_path, scanner=None, interval=10):
+        ''' Initialize the stats of an index run of folder written to stats_path
+        every interval seconds'''
+
+        self.folder = folder
+        self.stats_path = stats_path
+        self.scanner = scanner
+        self.interval = interval
+
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+        self.started = time.time()
+        self.finished = None
+        self.status = 'running'
+
+        self.dirs = 0
+        self.files = 0
+        self.bytes = 0
+        self.depth = 0
+        self.max_depth = 0
+
+        self.stage = None
+        self.stage_started = None
+        self.stages = {}
+
+        # The folder count of the last completed run gives an estimate of the progress
+        self.expected_dirs = None
+        try:
+            with open(stats_path, 'r') as f:
+                last_run = json.load(f)
+            if last_run.get('status') == 'completed':
+                self.expected_dirs = last_run.get('dirs')
+        except Exception:
+            pass
+
+    def add(self, dirs=0, files=0, nbytes=0, depth=None):
+        ''' Add scanned folders, files and bytes, depth is the current folder depth'''
+
+        with self.lock:
+            self.dirs += dirs
+            self.files += files
+            self.bytes += nbytes
+            if depth is not None:
+                self.depth = depth
+                self.max_depth = max(self.max_depth, depth)
+
+    def add_time(self, stage, seconds):
+        ''' Add seconds to a stage measured by the caller'''
+
+        with self.lock:
+            self.stages[stage] = self.stages.get(stage, 0) + seconds
+
+    def begin(self, stage):
+        ''' End the current stage and begin a new one (None to end only)'''
+
+        now = time.time()
+
+        with self.lock:
+            if self.stage:
+                self.stages[self.stage] = self.stages.get(
+                    self.stage, 0) + now - self.stage_started
+            self.stage = stage
+            self.stage_started = now
+
+    def to_dict(self):
+        ''' Get the stats as a dictionary'''
+
+        now = self.finished or time.time()
+        elapsed = max(now - self.started, 1e-6)
+
+        with self.lock:
+            stages = dict(self.stages)
+            if self.stage:
+                stages[self.stage] = stages.get(
+                    self.stage, 0) + now - self.stage_started
+
+            # Rates are per second of scanning
+            scan_time = stages.get('scan', 0) + stages.get('refresh', 0) or elapsed
+
+            return {
+                'folder': self.folder,
+                'scanner': self.scanner,
+                'status': self.status,
+                'stage': self.stage,
+                'started': datetime.datetime.fromtimestamp(self.started).isoformat(),
+                'updated': datetime.datetime.fromtimestamp(now).isoformat(),
+                'elapsed': round(elapsed, 3),
+                'dirs': self.dirs,
+                'files': self.files,
+                'bytes': self.bytes,
+                'depth': self.depth,
+                'max_depth': self.max_depth,
+                'dirs_per_second': round(self.dirs / scan_time, 1),
+                'files_per_second': round(self.files / scan_time, 1),
+                'bytes_per_second': round(self.bytes / scan_time, 1),
+                'expected_dirs': self.expected_dirs,
+                'stages': {k: round(v, 3) for k, v in stages.items()},
+            }
+
+    def write(self):
+        ''' Write the stats file, never fails the index run'''
+
+        try:
+            stats_path_tmp = f'{self.stats_path}.tmp'
+            with open(stats_path_tmp, 'w') as f:
+                json.dump(self.to_dict(), f, indent=4)
+            os.replace(stats_path_tmp, self.stats_path)
+            return True
+        except Exception:
+            return False
+
+    def log_progress(self):
+        ''' Log the scan progress'''
+
+        stats = self.to_dict()
+
+        if stats['stage'] not in ('scan', 'refresh'):
+            return
+
+        progress = ''
+        if self.expected_dirs:
+            percent = min(100 * stats['dirs'] / self.expected_dirs, 100)
+            eta = ''
+            if stats['dirs_per_second'] > 0:
+                remaining = max(self.expected_dirs - stats['dirs'], 0)
+                eta = f', ETA {datetime.timedelta(seconds=int(remaining / stats["dirs_per_second"]))}'
+            progress = f' (~{percent:.0f}% of the last index{eta})'
+
+        log(f'    {stats["dirs"]} folders, {stats["files"]} files, '
+            f'{round(stats["bytes"]/1073741824, 1)} GiB{progress}, '
+            f'{stats["dirs_per_second"]:.0f} folders/s, {stats["files_per_second"]:.0f} files/s, '
+            f'depth {stats["depth"]}')
+
+    def _run(self, is_logged):
+        ''' Write (and log) the stats every interval seconds'''
+
+        while not self.stopped.wait(self.interval):
+            self.write()
+            if is_logged:
+                self.log_progress()
+
+    def start(self):
+        ''' Start writing the stats periodically'''
+
+        # Concurrent index runs capture their output, their progress is only written to the file
+        is_logged = getattr(log_capture, 'buffer', None) is None
+
+        self.write()
+
+        self.thread = threading.Thread(
+            target=self._run, args=(is_logged,), daemon=True)
+        self.thread.start()
+
+    def finish(self, status):
+        ''' Stop the periodic writes and write the final stats'''
+
+        self.begin(None)
+        self.finished = time.time()
+        self.status = status
+
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+
+        self.write()
+
+
+class Archiver:
+
+    def __init__(self, args: argparse.Namespace, cfg: ConfigManager):
+        self.args = args
+
+        self.cfg = cfg
+
+        self.archive_json = cfg.archive_json
+
+        x = cfg.max_small_file_size_kib
+        self.thresholdKB = int(x) if x else 1024
+
+        # Bytes of small files read ahead while building the tar file
+        x = cfg.max_tar_readahead_mib
+        self.readaheadMB = int(x) if x else 64
+
+        # Bytes of large files read ahead while hashing them
+        x = cfg.max_hash_inflight_mib
+        self.hashinflightMB = int(x) if x else 1024
+
+        x = cfg.min_index_folder_size_gib
+        self.thresholdGB = int(x) if x else 10
+
+        x = cfg.min_index_folder_size_avg_mib
+        self.thresholdMB = int(x) if x else 10
+
+        self.smallfiles_tar_filename = 'Froster.smallfiles.tar'
+        self.allfiles_csv_filename = 'Froster.allfiles.csv'
+        self.md5sum_filename = '.froster.md5sum'
+        self.md5sum_restored_filename = '.froster-restored.md5sum'
+        self.manifest_filename = '.froster.manifest'
+        self.where_did_the_files_go_filename = 'Where-did-the-files-go.txt'
+
+        self.dirmetafiles = [self.allfiles_csv_filename,
+                             self.md5sum_filename,
+                             self.md5sum_restored_filename,
+                             self.manifest_filename,
+                             self.where_did_the_files_go_filename]
+
+        # Fast hash of the manifest next to the MD5 that rclone needs
+        x = cfg.fast_hash_algorithm
+        self.fast_hash = get_fast_hash(x if x else 'auto')
+
+        self.grants = []
+
+        # Ages (in days) reported by the index
+        self.daysaged = [5475, 3650, 1825, 1095, 730, 365, 90, 30]
+
+        # this is suppress verbose output when not in terminal
+        self.output_disable = False
+        if not sys.stdin.isatty():
+            self.output_disable = True
+
+    def _index_locally(self, folder, summary=None, threads=None):
+        '''Index the given folder for archiving
+
+        If a summary dictionary is given it is filled with the number of folders,
+        hotspots, total bytes and aged bytes of this folder.'''
+        try:
+            # The full scan is kept in a Parquet file next to the hotspots file
+            index_store = self.get_index_store_path(folder)
+
+            # If pwalkcopy location provided, run pwalk and copy the output to the specified location every time
+            if self.args.pwalkcopy:
+                log(
+                    f'\nINDEXING {folder}" and copying output to {self.args.pwalkcopy}', flush=True)
+            else:
+                log(f'\nINDEXING {folder}', flush=True)
+
+                # Get the path to the hotspots CSV file
+                folder_hotspot = self.get_hotspots_path(folder)
+
+                # If the folder is already indexed don't run pwalk again
+                if os.path.isfile(folder_hotspot):
+                    if self.args.force or self.args.refresh:
+                        # Ignore the existing file and re-index the folder
+                        pass
+                    elif os.path.isfile(index_store):
+                        # Regenerate the hotspots with the current thresholds from the stored scan
+                        log(f'FOLDER ALREADY INDEXED at {index_store}')
+                        log(f'  Using the stored index, use "-f" or "--force" flag to scan the folder again.')
+                        return self._index_hotspots(folder, index_store, summary, threads)
+                    else:
+                        log(f'FOLDER ALREADY INDEXED at {folder_hotspot}')
+                        log(f'\nUse "-f" or "--force" flag to force indexing again.\n')
+                        return True
+
+            # Progress and throughput of this run, written periodically next to the hotspots file
+            stats = IndexStats(folder, self.get_index_stats_path(folder))
+            stats.start()
+
+            status = 'failed'
+
+            # Refreshed indexes are marked, their file times may be those of the last full scan
+            refreshed_marker = self._index_refreshed_marker(
+                self.get_hotspots_path(folder))
+
+            try:
+                # A refresh only rescans the folders that changed since the last scan
+                if self.args.refresh and os.path.isfile(index_store):
+                    stats.begin('refresh')
+                    scanned, permission_denied_found = self._index_refresh(
+                        folder, index_store, stats)
+                    if scanned:
+                        with open(refreshed_marker, 'w') as f:
+                            f.write(f'{datetime.datetime.now().isoformat()}\n')
+                else:
+                    if self.args.refresh:
+                        log(f'  No previous index of "{folder}" found, running a full scan...')
+
+                    stats.begin('scan')
+                    scanned, permission_denied_found = self._index_scan(
+                        folder, index_store, threads, stats)
+                    if scanned and os.path.exists(refreshed_marker):
+                        os.remove(refreshed_marker)
+
+                if not scanned:
+                    return False
+
+                # If pwalkcopy location provided, export the stored scan as pwalk CSV
+                if self.args.pwalkcopy:
+                    stats.begin('export')
+                    copy_filename = folder.replace('/', '+') + '.csv'
+                    self._index_export_pwalk(
+                        index_store, os.path.join(self.args.pwalkcopy, copy_filename))
+
+                if not self._index_hotspots(folder, index_store, summary, threads, stats):
+                    return False
+
+                status = 'completed'
+
+            finally:
+                stats.finish(status)
+
+            if not use_slurm(self.args.noslurm):
+                log(f'Index stats: {stats.stats_path}\n')
+
+            if permission_denied_found:
+                return False
+            else:
+                return True
+
+        except Exception:
+            print_error()
+            return False
+
+    def _index_scan(self, folder, index_store, threads=None, stats=None):
+        '''Scan the given folder with pwalk and store the result in the index store
+
+        Returns a tuple (success, permission_denied_found)'''
+
+        # Build the pwalk command
+        pwalk_bin = os.path.join(self.cfg.froster_dir, 'pwalk')
+        mycmd = [pwalk_bin, '--NoSnap',
+                 '--one-file-system', '--header', folder]
+
+        # Use the built-in scanner if asked for or if pwalk is not installed
+        scanner = self.args.scanner
+        if scanner == 'pwalk' and not os.access(pwalk_bin, os.X_OK):
+            log(f'  pwalk not found at {pwalk_bin}, using the built-in scanner instead.')
+            scanner = 'python'
+
+        if stats is not None:
+            stats.scanner = scanner
+
+        # Run the scan on given folder. The scan output is streamed through a named pipe
+        # straight into DuckDB, so the (huge) CSV never lands on the local disk
+        with tempfile.TemporaryDirectory(prefix='froster-index-') as tmpdir, \
+                tempfile.TemporaryFile() as pwalk_stderr:
+
+            pwalk_fifo = os.path.join(tmpdir, 'pwalk.csv')
+            os.mkfifo(pwalk_fifo)
+
+            feed_errors = []
+
+            if scanner == 'python':
+                # Add conditional logging for scan start
+                if not use_slurm(self.args.noslurm):
+                    log(f'  Running built-in filesystem scan on "{folder}" and streaming it into DuckDB...')
+
+                # Same as pwalk --one-file-system --NoSnap
+                fs_scanner = FileSystemScanner(stats=stats)
+
+                # Scan in a background thread while DuckDB reads it
+                feeder = threading.Thread(target=self._scanner_feed,
+                                          args=(fs_scanner, folder,
+                                                pwalk_fifo, feed_errors),
+                                          daemon=True)
+            else:
+                # Add conditional logging for pwalk start
+                if not use_slurm(self.args.noslurm):
+                    log(f'  Running pwalk filesystem scan on "{folder}" and streaming it into DuckDB...')
+
+                # Run the pwalk command
+                pwalk_proc = subprocess.Popen(mycmd, stdout=subprocess.PIPE,
+                                              stderr=pwalk_stderr, bufsize=1024*1024)
+
+                # Convert the pwalk output in a background thread while DuckDB reads it
+                feeder = threading.Thread(target=self._pwalk_feed,
+                                          args=(pwalk_proc, pwalk_fifo,
+                                                feed_errors, stats),
+                                          daemon=True)
+            feeder.start()
+
+            # The new store is only swapped in once the scan is complete
+            index_store_tmp = f'{index_store}.tmp'
+
+            # Connect to an in-memory DuckDB instance
+            duckdb_connection = duckdb.connect(':memory:')
+
+            # Set the number of threads to use
+            duckdb_connection.execute(
+                f'PRAGMA threads={threads or self.args.cores};')
+
+            # The scan progress is logged by IndexStats
+            duckdb_connection.execute('PRAGMA disable_progress_bar;')
+
+            try:
+                # Store the raw scan as compressed Parquet
+                duckdb_connection.execute(f"""COPY (SELECT *
+                                                    FROM read_csv('{pwalk_fifo}',
+                                                          header=true, auto_detect=false,
+                                                          columns={PWALK_COLUMNS},
+                                                          ignore_errors=true))
+                                              TO {self._sql_string(index_store_tmp)}
+                                              (FORMAT parquet, COMPRESSION zstd)
+                                           """)
+            finally:
+                # Make sure the feeder is never left blocked on a pipe nobody reads
+                self._pwalk_release_fifo(pwalk_fifo, feeder)
+
+                feeder.join()
+                if scanner == 'pwalk':
+                    pwalk_proc.wait()
+
+                duckdb_connection.close()
+
+            # Add conditional logging for scan end
+            if not use_slurm(self.args.noslurm):
+                log(f'    ...{scanner} scan complete.')
+
+            # Check if the pwalk command and the stream were successful
+            if scanner == 'pwalk' and pwalk_proc.returncode != 0:
+                log(
+                    f"\nError: command {' '.join(mycmd)} failed with returncode {pwalk_proc.returncode}\n", file=sys.stderr)
+                os.remove(index_store_tmp)
+                return False, False
+
+            if feed_errors:
+                log(
+                    f"\nError: streaming {scanner} output failed: {feed_errors[0]}\n", file=sys.stderr)
+                os.remove(index_store_tmp)
+                return False, False
+
+            # Get the scan errors
+            if scanner == 'python':
+                lines = fs_scanner.errors
+            else:
+                pwalk_stderr.seek(0)
+                lines = pwalk_stderr.read().decode(
+                    'utf-8', errors='ignore').splitlines()
+
+            # Get the locked folders
+            locked_dirs = [l for l in lines if "Locked Dir:" in l]
+
+            # Get the permission denied errors
+            permission_denied = [l for l in lines if "Permission denied" in l]
+
+        if not self._index_scan_warnings(permission_denied, locked_dirs):
+            os.remove(index_store_tmp)
+            return False, bool(permission_denied)
+
+        os.replace(index_store_tmp, index_store)
+
+        return True, bool(permission_denied)
+
+    def _index_refresh(self, folder, index_store, stats=None):
+        '''Rescan only the folders of the index store that changed since the last scan
+
+        A folder is unchanged if its inode and modification time are the same as in
+        the store. Its stored rows are reused and only its subfolders are checked,
+        without listing its content. The folders are compared with the store in DuckDB,
+        a chunk of folders at a time. Note that reading a file or changing its content
+        does not change the folder modification time: the size, access and
+        modification time of the files of unchanged folders (and so the AccD, ModD
+        and aged bytes of the hotspots) are those of the last full scan (--force).
+        The index is marked as refreshed, archive --batch does not use it.
+
+        Returns a tuple (success, permission_denied_found)'''
+
+        if not use_slurm(self.args.noslurm):
+            log(f'  Refreshing the index of "{folder}", rescanning changed folders only...')
+
+        duckdb_connection = duckdb.connect(':memory:')
+
+        # Folders of the last scan, they stay in DuckDB (see FileSystemScanner.index_name)
+        duckdb_connection.execute(f"""CREATE TABLE folders AS
+                                      SELECT filename, inode, parent_inode, st_mtime, pw_fcount, pw_dirsum
+                                      FROM read_parquet({self._sql_string(index_store)})
+                                      WHERE pw_fcount > -1""")
+
+        # Same as pwalk --one-file-system --NoSnap
+        fs_scanner = FileSystemScanner(stats=stats)
+
+        if stats is not None:
+            stats.scanner = 'refresh'
+
+        def stat_folder(item):
+            '''Stat of a folder to check, None if it is gone (run in the scanner threads)'''
+
+            path, _, _, dir_stat = item
+            if dir_stat is not None:
+                return dir_stat
+
+            try:
+                return os.lstat(path)
+            except FileNotFoundError:
+                # Removed while we were walking
+                return None
+            except OSError as e:
+                fs_scanner.errors.append(str(e))
+                return None
+
+        numrescanned = 0
+        numunchanged = 0
+
+        # Folders to check: (path, parent inode, depth, stat of the parent listing or None)
+        pending = collections.deque([(folder, 0, 0, None)])
+
+        # The folders are joined with the store in chunks, only a chunk is held in memory
+        chunk_size = 10000
+
+        with tempfile.TemporaryDirectory(prefix='froster-index-') as tmpdir, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=fs_scanner.threads) as executor:
+
+            rows_path = os.path.join(tmpdir, 'rescanned.csv')
+            unchanged_path = os.path.join(tmpdir, 'unchanged.csv')
+            chunk_path = os.path.join(tmpdir, 'chunk.csv')
+
+            with open(rows_path, 'wb') as rows_file, \
+                    open(unchanged_path, 'w') as unchanged_file:
+
+                rows_file.write(FileSystemScanner.PWALK_HEADER)
+                unchanged_file.write('inode\n')
+
+                while pending:
+                    chunk = [pending.popleft() for _ in range(min(len(pending), chunk_size))]
+                    chunk = [(path, parent_inode, depth, dir_stat)
+                             for (path, parent_inode, depth, _), dir_stat in zip(chunk, executor.map(stat_folder, chunk))
+                             if dir_stat is not None]
+
+                    with open(chunk_path, 'w', newline='', encoding='utf-8') as chunk_file:
+                        writer = csv.writer(chunk_file)
+                        writer.writerow(['id', 'filename', 'inode', 'mtime'])
+                        writer.writerows((i, FileSystemScanner.index_name(path), dir_stat.st_ino, int(dir_stat.st_mtime))
+                                         for i, (path, _, _, dir_stat) in enumerate(chunk))
+
+                    # A folder is unchanged if its name, inode and modification time are those of the store
+                    duckdb_connection.execute(f"""CREATE OR REPLACE TEMP TABLE unchanged AS
+                                                  SELECT c.id, f.inode, f.pw_fcount, f.pw_dirsum
+                                                  FROM read_csv('{chunk_path}', header=true, auto_detect=false,
+                                                        quote='"', escape='"',
+                                                        columns={{'id': 'INTEGER', 'filename': 'VARCHAR',
+                                                                  'inode': 'UBIGINT', 'mtime': 'BIGINT'}}) c
+                                                      JOIN folders f
+                                                      ON f.filename = c.filename AND f.inode = c.inode
+                                                          AND f.st_mtime = c.mtime""")
+
+                    # Unchanged folders reuse their stored rows and file counts
+                    unchanged = set()
+                    for i, inode, fcount, dirsum in duckdb_connection.execute(
+                            'SELECT id, inode, pw_fcount, pw_dirsum FROM unchanged').fetchall():
+                        unchanged.add(i)
+                        unchanged_file.write(f'{inode}\n')
+                        numunchanged += 1
+                        if stats is not None:
+                            stats.add(dirs=1, files=fcount, nbytes=dirsum, depth=chunk[i][2])
+
+                    # Their subfolders are checked without listing their content
+                    for filename, parent_inode, i in duckdb_connection.execute(
+                            """SELECT f.filename, f.parent_inode, u.id
+                               FROM folders f JOIN unchanged u ON f.parent_inode = u.inode""").fetchall():
+                        pending.append((FileSystemScanner.index_path(filename), parent_inode, chunk[i][2] + 1, None))
+
+                    # New or changed folders are listed again
+                    changed = [item for i, item in enumerate(chunk) if i not in unchanged]
+                    for result in executor.map(lambda item: fs_scanner.scan_folder(item[0], item[3], item[1], item[2]),
+                                               changed):
+                        if result is None:
+                            continue
+
+                        rows, subfolder_args = result
+                        rows_file.write(rows)
+                        numrescanned += 1
+                        pending.extend((subfolder_path, inode, depth, subfolder_stat)
+                                       for subfolder_path, subfolder_stat, inode, depth in subfolder_args)
+
+            if not use_slurm(self.args.noslurm):
+                log(f'    ...{numrescanned} folders rescanned, {numunchanged} folders unchanged.')
+
+            # Get the locked folders and the permission denied errors
+            locked_dirs = [l for l in fs_scanner.errors if "Locked Dir:" in l]
+            permission_denied = [
+                l for l in fs_scanner.errors if "Permission denied" in l]
+
+            if not self._index_scan_warnings(permission_denied, locked_dirs):
+                duckdb_connection.close()
+                return False, bool(permission_denied)
+
+            # Merge the rows of the unchanged folders with the rescanned ones
+            index_store_tmp = f'{index_store}.tmp'
+            duckdb_connection.execute(f"""COPY (SELECT *
+                                                FROM read_parquet({self._sql_string(index_store)})
+                                                WHERE (CASE WHEN pw_fcount = -1 THEN parent_inode ELSE inode END)
+                                                    IN (SELECT inode
+                                                        FROM read_csv('{unchanged_path}', header=true,
+                                                              auto_detect=false, columns={{'inode': 'UBIGINT'}}))
+                                                UNION ALL
+                                                SELECT *
+                                                FROM read_csv('{rows_path}',
+                                                      header=true, auto_detect=false,
+                                                      columns={PWALK_COLUMNS},
+                                                      ignore_errors=true))
+                                          TO {self._sql_string(index_store_tmp)}
+                                          (FORMAT parquet, COMPRESSION zstd)
+                                       """)
+
+        duckdb_connection.close()
+
+        os.replace(index_store_tmp, index_store)
+
+        return True, bool(permission_denied)
+
+    def _index_export_pwalk(self, index_store, copy_path):
+        '''Export the index store as a pwalk CSV file'''
+
+        if not use_slurm(self.args.noslurm):
+            log(f'  Exporting the index to {copy_path}...')
+
+        duckdb_connection = duckdb.connect(':memory:')
+
+        # Same columns and header as the pwalk output
+        duckdb_connection.execute(f"""COPY (SELECT inode, parent_inode as "parent-inode",
+                                                   depth as "directory-depth", filename,
+                                                   extension as "fileExtension", UID, GID,
+                                                   st_size, st_dev, st_blocks, st_nlink, st_mode,
+                                                   st_atime, st_mtime, st_ctime, pw_fcount, pw_dirsum
+                                            FROM read_parquet({self._sql_string(index_store)}))
+                                      TO {self._sql_string(copy_path)}
+                                      (HEADER, DELIMITER ',', FORCE_QUOTE (filename, "fileExtension", st_mode))
+                                   """)
+
+        duckdb_connection.close()
+
+    def _index_scan_warnings(self, permission_denied, locked_dirs):
+        '''Warn about permission errors of a scan, return False if folders are locked'''
+
+        # Get the permission denied errors
+        for item in permission_denied:
+            log(textwrap.dedent(f'''
+            WARNING:
+                You don't have enough permissions in one or more files or folders.
+                First error message with permission denied:
+
+                    "{item}"
+
+                You can check the permissions of the folders using the command:
+                    froster index --permissions "/your/folder"
+            '''))
+            break
+
+        if locked_dirs:
+            log('\n'+'\n'.join(locked_dirs))
+            log(textwrap.dedent(f'''
+            WARNING:
+                You cannot access the locked folder(s)
+                above, because you don't have permissions to see
+                their content. You will not be able to archive these
+                folders until you have the permissions granted.
+
+                You can check the permissions of the folders using the command:
+                  froster index --permissions "/your/folder"
+
+            '''))
+            return False
+
+        return True
+
+    def _index_hotspots(self, folder, index_store, summary=None, threads=None, stats=None):
+        '''Write the hotspots CSV file of the given folder from its index store'''
+
+        if stats is not None:
+            stats.begin('analyze')
+
+        daysaged = self.daysaged
+        TiB = 1099511627776
+        GiB = 1073741824
+        MiB = 1048576
+
+        # Connect to an in-memory DuckDB instance
+        duckdb_connection = duckdb.connect(':memory:')
+
+        # Set the number of threads to use
+        duckdb_connection.execute(
+            f'PRAGMA threads={threads or self.args.cores};')
+
+        # Add conditional logging for DuckDB start
+        if not use_slurm(self.args.noslurm):
+            log(f'  Analyzing folder data with DuckDB...')
+
+        # Aggregate the stored scan into one row per folder
+        duckdb_connection.execute(
+            f'CREATE TABLE pwalk AS {self._sql_index_folders(index_store)}')
+
+        # Keep only the folders above the size thresholds, the rest never leaves DuckDB
+        sql_query = f"""CREATE TEMP TABLE hotspots_csv AS
+                        SELECT {self._sql_hotspot_columns(time.time())}
+                        FROM pwalk
+                        WHERE pw_fcount > 0
+                            AND pw_dirsum >= {self.thresholdGB * GiB}
+                            AND pw_dirsum / pw_fcount >= {self.thresholdMB * MiB}
+                        ORDER BY pw_dirsum DESC
+                    """
+
+        # Execute the SQL query
+        duckdb_connection.execute(sql_query)
+
+        # Add conditional logging for DuckDB end
+        if not use_slurm(self.args.noslurm):
+            log(f'    ...analysis complete.')
+
+        # Get the path to the hotspots CSV file
+        mycsv = self.get_hotspots_path(folder)
+
+        # Add conditional logging for CSV writing start
+        if not use_slurm(self.args.noslurm):
+            log(f'  Processing and writing hotspots CSV ({mycsv})...')
+
+        if stats is not None:
+            stats.begin('write')
+
+        # Sum the hotspots and the bytes that have not been accessed for each age
+        aged_sums = ', '.join(
+            [f'coalesce(sum(DirSize) FILTER (WHERE AccD > {days}), 0)' for days in daysaged])
+        numhotspots, totalbytes, *agedbytes = duckdb_connection.execute(
+            f'SELECT count(*), coalesce(sum(DirSize), 0), {aged_sums} FROM hotspots_csv').fetchone()
+
+        numfolders = duckdb_connection.execute(
+            'SELECT count(*) FROM pwalk WHERE pw_fcount > -1 AND pw_dirsum > 0').fetchone()[0]
+
+        # Resolve the owner and group names once per distinct id of the surviving hotspots
+        self._sql_add_names(duckdb_connection, 'hotspots_csv')
+
+        # Write the hotspots to the CSV file straight from DuckDB
+        duckdb_connection.execute(f"""COPY ({self._sql_named_hotspots('hotspots_csv')}
+                                            ORDER BY h.DirSize DESC)
+                                      TO {self._sql_string(mycsv)} (HEADER, DELIMITER ',')
+                                   """)
+
+        if os.environ.get('DEBUG') == '1':
+            for folder, accd in duckdb_connection.execute(
+                    f'SELECT Folder, AccD FROM hotspots_csv WHERE AccD > {daysaged[0]}').fetchall():
+                # Is this really 15 years ?
+                printdbg(
+                    f'  {folder} has not been accessed for {accd} days.')
+
+        # Close the DuckDB connection
+        duckdb_connection.close()
+
+        # Add conditional logging for CSV writing end
+        if not use_slurm(self.args.noslurm):
+            log(f'    ...hotspots CSV written.')
+
+        log(textwrap.dedent(f'''
+            Hotspots file: {mycsv}
+                with {numhotspots} hotspots >= {self.thresholdGB} GiB
+                with a total disk use of {round(totalbytes/TiB,3)} TiB
+            '''))
+
+        log(f'Total folders processed: {numfolders}')
+
+        log(f'\nINDEXING SUCCESSFULLY COMPLETED')
+
+        self._log_aged_bytes(agedbytes)
+
+        # Output decoration print
+        log()
+
+        if summary is not None:
+            summary['folders'] = numfolders
+            summary['hotspots'] = numhotspots
+            summary['totalbytes'] = totalbytes
+            summary['agedbytes'] = agedbytes
+
+        return True
+
+    def _sql_index_folders(self, index_store):
+        '''SQL query of the folders of an index store with the newest times of their files'''
+
+        # Froster metadata files do not count for the newest file times
+        is_metafile = ' OR '.join(
+            [f"suffix(filename, '/{f}')" for f in self.dirmetafiles])
+
+        # One row per folder in a single pass. File rows (pw_fcount=-1) are grouped
+        # by their parent inode to get the newest file times
+        return f"""SELECT CASE WHEN pw_fcount = -1 THEN parent_inode ELSE inode END as dir_inode,
+                          any_value(UID) FILTER (WHERE pw_fcount > -1) as UID,
+                          any_value(GID) FILTER (WHERE pw_fcount > -1) as GID,
+                          any_value(st_atime) FILTER (WHERE pw_fcount > -1) as st_atime,
+                          any_value(st_mtime) FILTER (WHERE pw_fcount > -1) as st_mtime,
+                          any_value(filename) FILTER (WHERE pw_fcount > -1) as filename,
+                          any_value(pw_fcount) FILTER (WHERE pw_fcount > -1) as pw_fcount,
+                          any_value(pw_dirsum) FILTER (WHERE pw_fcount > -1) as pw_dirsum,
+                          max(st_atime) FILTER (WHERE pw_fcount = -1 AND NOT ({is_metafile})) as newest_atime,
+                          max(st_mtime) FILTER (WHERE pw_fcount = -1 AND NOT ({is_metafile})) as newest_mtime
+                   FROM read_parquet({self._sql_string(index_store)})
+                   GROUP BY dir_inode"""
+
+    def _sql_hotspot_columns(self, now):
+        '''SQL columns of a hotspot from the folders of _sql_index_folders (ids instead of names)'''
+
+        TiB = 1099511627776
+        GiB = 1073741824
+        MiB = 1048576
+
+        # Ages are the days since the newest file access and modification in each folder
+        return f"""UID as User,
+                   {self._sql_daysago('coalesce(newest_atime, st_atime)', now)} as AccD,
+                   {self._sql_daysago('coalesce(newest_mtime, st_mtime)', now)} as ModD,
+                   CAST(floor(pw_dirsum / {GiB}) AS BIGINT) as GiB,
+                   CAST(floor(pw_dirsum / {MiB} / pw_fcount) AS BIGINT) as MiBAvg,
+                   filename as Folder, GID as Group,
+                   CAST(floor(pw_dirsum / {TiB}) AS BIGINT) as TiB,
+                   pw_fcount as FileCount, pw_dirsum as DirSize"""
+
+    def _sql_add_names(self, duckdb_connection, table):
+        '''Create the user_names and group_names tables for the User and Group ids of a table'''
+
+        uids = [r[0] for r in duckdb_connection.execute(
+            f'SELECT DISTINCT User FROM {table}').fetchall()]
+        gids = [r[0] for r in duckdb_connection.execute(
+            f'SELECT DISTINCT "Group" FROM {table}').fetchall()]
+
+        # Many owners, a single getent call is cheaper than one lookup per id
+        if len(uids) > 100:
+            user_names.preload()
+        if len(gids) > 100:
+            group_names.preload()
+
+        duckdb_connection.execute(
+            'CREATE OR REPLACE TEMP TABLE user_names (id BIGINT, name VARCHAR)')
+        duckdb_connection.execute(
+            'CREATE OR REPLACE TEMP TABLE group_names (id BIGINT, name VARCHAR)')
+        if uids:
+            duckdb_connection.executemany('INSERT INTO user_names VALUES (?, ?)',
+                                          [(uid, str(self.uid2user(uid))) for uid in uids])
+        if gids:
+            duckdb_connection.executemany('INSERT INTO group_names VALUES (?, ?)',
+                                          [(gid, str(self.gid2group(gid))) for gid in gids])
+
+    def _sql_named_hotspots(self, table):
+        '''SQL query of the hotspots of a table with the names of _sql_add_names'''
+
+        # 0:Usr,1:AccD,2:ModD,3:GiB,4:MiBAvg,5:Folder,6:Grp,7:TiB,8:FileCount,9:DirSize
+        return f"""SELECT u.name as User, h.AccD, h.ModD, h.GiB, h.MiBAvg,
+                          h.Folder, g.name as Group, h.TiB,
+                          h.FileCount, h.DirSize
+                   FROM {table} h
+                       JOIN user_names u ON h.User = u.id
+                       JOIN group_names g ON h.Group = g.id"""
+
+    def hotspots(self, folders):
+        '''Query the hotspots of the index stores of the given folders (all stores if none)
+
+        The thresholds, ages, owners and sort order are taken from the hotspots
+        command arguments and applied to the stored scans, without indexing again.'''
+
+        try:
+            TiB = 1099511627776
+            GiB = 1073741824
+            MiB = 1048576
+
+            # Without output file the hotspots are printed, keep the messages out of them
+            msgfile = sys.stderr if not self.args.output else sys.stdout
+
+            # Get the index stores to query
+            if folders:
+                index_stores = []
+                for folder in folders:
+                    index_store = self.get_index_store_path(folder)
+                    if not index_store or not os.path.isfile(index_store):
+                        log(f'\nError: Folder "{folder}" has no index, run first:', file=msgfile)
+                        log(f'    froster index "{folder}"\n', file=msgfile)
+                        return False
+                    index_stores.append(index_store)
+            else:
+                index_stores = []
+                if self.cfg.hotspots_dir and os.path.isdir(self.cfg.hotspots_dir):
+                    index_stores = sorted(os.path.join(self.cfg.hotspots_dir, f) for f in os.listdir(
+                        self.cfg.hotspots_dir) if fnmatch.fnmatch(f, '*.parquet'))
+                if not index_stores:
+                    log('\nNo indexed folders found. You can index a folder using the command:', file=msgfile)
+                    log('    froster index "/your/folder/to/index"\n', file=msgfile)
+                    return False
+
+            # Default to the thresholds of the index
+            larger = self.thresholdGB if self.args.larger is None else self.args.larger
+            avg = self.thresholdMB if self.args.avg is None else self.args.avg
+
+            age = 'ModD' if self.args.agemtime else 'AccD'
+
+            conditions = ['pw_fcount > 0',
+                          f'pw_dirsum >= {int(larger * GiB)}',
+                          f'pw_dirsum / pw_fcount >= {int(avg * MiB)}']
+
+            hotspot_conditions = []
+            if self.args.older > 0:
+                hotspot_conditions.append(f'{age} > {self.args.older}')
+            if self.args.newer > 0:
+                hotspot_conditions.append(f'{age} < {self.args.newer}')
+
+            # Owners are given as names or ids
+            for option, column, lookup in ((self.args.user, 'User', lambda name: pwd.getpwnam(name).pw_uid),
+                                           (self.args.group, 'Group', lambda name: grp.getgrnam(name).gr_gid)):
+                if not option:
+                    continue
+                try:
+                    owner_id = int(option) if option.isdigit() else lookup(option)
+                except KeyError:
+                    log(f'\nError: Unknown {column.lower()} "{option}"\n', file=msgfile)
+                    return False
+                hotspot_conditions.append(f'"{column}" = {owner_id}')
+
+            order = {'size': 'h.DirSize',
+                     'avg': 'h.DirSize / h.FileCount',
+                     'age': f'h.{age}',
+                     'files': 'h.FileCount',
+                     'folder': 'h.Folder'}[self.args.sort]
+            # Largest, oldest first, folders by name
+            descending = self.args.sort != 'folder'
+            if self.args.reverse:
+                descending = not descending
+
+            duckdb_connection = duckdb.connect(':memory:')
+            duckdb_connection.execute(f'PRAGMA threads={self.args.cores};')
+
+            # Aggregate the stores into one row per folder, each store has its own inodes
+            now = time.time()
+            duckdb_connection.execute(f"""CREATE TEMP TABLE hotspots_query AS
+                                          SELECT * FROM ({' UNION ALL '.join(
+                                              f'SELECT {self._sql_hotspot_columns(now)} FROM ({self._sql_index_folders(index_store)}) WHERE {" AND ".join(conditions)}'
+                                              for index_store in index_stores)})
+                                          {'WHERE ' + ' AND '.join(hotspot_conditions) if hotspot_conditions else ''}
+                                       """)
+
+            self._sql_add_names(duckdb_connection, 'hotspots_query')
+
+            query = f"""{self._sql_named_hotspots('hotspots_query')}
+                          ORDER BY {order} {'DESC' if descending else 'ASC'}, h.Folder
+                          {f'LIMIT {self.args.limit}' if self.args.limit > 0 else ''}"""
+
+            cursor = duckdb_connection.execute(query)
+            columns = [c[0] for c in cursor.description]
+
+            output = open(self.args.output, 'w', newline='') if self.args.output else sys.stdout
+
+            numhotspots = 0
+            totalbytes = 0
+            try:
+                if self.args.format == 'json':
+                    output.write('[')
+                else:
+                    writer = csv.writer(output)
+                    writer.writerow(columns)
+
+                while rows := cursor.fetchmany(10000):
+                    if self.args.format == 'json':
+                        for row in rows:
+                            output.write(',\n' if numhotspots else '\n')
+                            output.write(json.dumps(dict(zip(columns, row))))
+                            numhotspots += 1
+                    else:
+                        writer.writerows(rows)
+                        numhotspots += len(rows)
+                    totalbytes += sum(row[9] for row in rows)
+
+                if self.args.format == 'json':
+                    output.write('\n]\n' if numhotspots else ']\n')
+            finally:
+                if output is not sys.stdout:
+                    output.close()
+                duckdb_connection.close()
+
+            log(f'\n{numhotspots} hotspots with a total disk use of {round(totalbytes/TiB,3)} TiB' +
+                (f' written to {self.args.output}\n' if self.args.output else '\n'), file=msgfile)
+
+            return True
+
+        except Exception:
+            print_error()
+            return False
+
+    def _log_aged_bytes(self, agedbytes):
+        '''Print the amount of data that has not been accessed for each age'''
+
+        TiB = 1099511627776
+
+        lastagedbytes = 0
+        for i in range(0, len(self.daysaged)):
+            if agedbytes[i] > 0 and agedbytes[i] != lastagedbytes:
+                # dedented multi-line removing \n
+                log(textwrap.dedent(f'''
+                {round(agedbytes[i]/TiB,3)} TiB have not been accessed 
+                for {self.daysaged[i]} days (or {round(self.daysaged[i]/365,1)} years)
+                ''').replace('\n', ''))
+            lastagedbytes = agedbytes[i]
+
+    def _sql_string(self, value):
+        '''Quote a string as a SQL literal'''
+
+        return "'" + str(value).replace("'", "''") + "'"
+
+    def _sql_daysago(self, column, now):
+        '''SQL expression for the number of days ago of a unixtime column (see daysago)'''
+
+        return f'''CASE WHEN {column} IS NULL OR {column} = 0 THEN 0
+                        ELSE CAST(floor(({now} - {column}) / 86400) AS BIGINT) END'''
+
+    def _pwalk_feed(self, pwalk_proc, fifo_path, errors=None, stats=None):
+        '''Stream the pwalk output into the named pipe read by DuckDB
+
+        If stats are given the folders, files and bytes of the pwalk lines are counted.'''
+
+        try:
+            with open(fifo_path, 'wb') as fifo:
+
+                batch = []
+                batch_bytes = 0
+
+                numdirs = 0
+                numfiles = 0
+                numbytes = 0
+                depth = None
+                convert_time = 0
+
+                for line in pwalk_proc.stdout:
+
+                    # DuckDB only reads valid UTF-8, the names that are not are converted
+                    # from ISO-8859-1 (see FileSystemScanner.index_name)
+                    if not line.isascii():
+                        start = time.perf_counter()
+                        try:
+                            line.decode('utf-8')
+                        except UnicodeDecodeError:
+                            line = line.decode('latin-1').encode('utf-8')
+                        convert_time += time.perf_counter() - start
+
+                    if stats is not None:
+                        # File lines end with pw_fcount=-1 and pw_dirsum=0, folder lines
+                        # end with the number and size of their files
+                        if line.endswith(b',-1,0\n'):
+                            numfiles += 1
+                        else:
+                            try:
+                                numbytes += int(line.rsplit(b',', 1)[1])
+                                depth = int(line.split(b',', 3)[2])
+                                numdirs += 1
+                            except (IndexError, ValueError):
+                                # The header line
+                                pass
+
+                    batch.append(line)
+                    batch_bytes += len(line)
+
+                    if batch_bytes >= 1024*1024:
+                        start = time.perf_counter()
+                        fifo.write(b''.join(batch))
+
+                        if stats is not None:
+                            stats.add_time('duckdb_wait', time.perf_counter() - start)
+                            stats.add_time('convert', convert_time)
+                            stats.add(numdirs, numfiles, numbytes, depth)
+                            numdirs = numfiles = numbytes = convert_time = 0
+
+                        batch = []
+                        batch_bytes = 0
+
+                fifo.write(b''.join(batch))
+
+                if stats is not None:
+                    stats.add_time('convert', convert_time)
+                    stats.add(numdirs, numfiles, numbytes, depth)
+
+        except BrokenPipeError:
+            # DuckDB stopped reading, there is no point in continuing the scan
+            pwalk_proc.kill()
+            if errors is not None:
+                errors.append('DuckDB stopped reading the pwalk output')
+
+        except Exception as e:
+            pwalk_proc.kill()
+            if errors is not None:
+                errors.append(str(e))
+
+        finally:
+            # Drain pwalk output so the process is never blocked on a full pipe
+            try:
+                for _ in pwalk_proc.stdout:
+                    pass
+            except Exception:
+                pass
+
+    def _scanner_feed(self, fs_scanner, folder, fifo_path, errors=None):
+        '''Stream the built-in scanner output into the named pipe read by DuckDB'''
+
+        try:
+            with open(fifo_path, 'wb') as fifo:
+                fs_scanner.scan(folder, fifo)
+
+        except BrokenPipeError:
+            # DuckDB stopped reading, there is no point in continuing the scan
+            fs_scanner.stop()
+            if errors is not None:
+                errors.append('DuckDB stopped reading the scanner output')
+
+        except Exception as e:
+            fs_scanner.stop()
+            if errors is not None:
+                errors.append(str(e))
+
+    def _pwalk_release_fifo(self, fifo_path, feeder):
+        '''Unblock a feeder thread still waiting for a reader on the named pipe'''
+
+        if not feeder.is_alive():
+            return
+
+        try:
+            # Opening and closing the read end makes the writer fail with a broken pipe
+            fd = os.open(fifo_path, os.O_RDONLY | os.O_NONBLOCK)
+            os.close(fd)
+        except OSError:
+            pass
+
+    def _slurm_cmd(self, folders, cmd_type, scheduled=None):
+        '''Execute the current command using SLURM'''
+
+        try:
+            # Create a SlurmEssentials object
+            se = Slurm(self.args, self.cfg)
+
+            # Get the label for the job
+            label = self._get_hotspots_filename(
+                folders[0]).replace('.csv', '').replace(' ', '_')
+
+            # Get the shortlabel for the Slurm job
+            shortlabel = os.path.basename(folders[0])
+
+            cmdlist = sys.argv
+            folders_file = None
+
+            # Long folder lists are passed to the job in a file, not on the command line
+            if len(folders) > 10 or getattr(self.args, 'fromfile', ''):
+                folders_file = os.path.join(
+                    self.cfg.slurm_dir, f'froster-{cmd_type}@{label}-{time.time_ns()}.folders')
+                with open(folders_file, 'wb') as f:
+                    f.write(b''.join(os.fsencode(folder) + b'\0' for folder in folders))
+
+                # Remove the folders and the --from-file option (and its value) given
+                # after the subcommand, everything after "--" is a folder
+                listed = set(folders)
+                argl = ['--from-file']
+                subcmd_index = sys.argv.index(self.args.subcmd) if self.args.subcmd in sys.argv else 0
+                argv_end = sys.argv.index('--') if '--' in sys.argv else len(sys.argv)
+                cmdlist = sys.argv[:subcmd_index + 1] + \
+                    [x for i, x in enumerate(sys.argv[:argv_end]) if i > subcmd_index
+                     and x not in argl and sys.argv[i-1] not in argl
+                     and not x.startswith('--from-file=')
+                     and (x.startswith('-') or clean_path(x) not in listed)]
+                cmdlist += ['--from-file', folders_file]
+
+            # Add the original cmdline to the Slurm script
+            cmd = " ".join(map(shlex.quote, cmdlist))
+
+            # The job removes the folder list once the command has finished. It is not
+            # removed if the job is killed, so a requeued job can still read it
+            if folders_file:
+                cmd += f'\nrm -f {shlex.quote(folders_file)}'
+
+            # Submit the job
+            if se.submit_job(cmd=cmd,
+                             cmd_type=cmd_type,
+                             label=label,
+                             shortlabel=shortlabel,
+                             scheduled=scheduled):
+                return True
+
+            if folders_file and os.path.exists(folders_file):
+                os.remove(folders_file)
+            return False
+
+        except Exception:
+            print_error()
+            return False
+
+    def index(self, folders):
+        '''Index the given folders for archiving'''
+        try:
+            if self._is_recursive_collision(folders):
+                log(
+                    f'\nError: You cannot index folders if there is a dependency between them. Specify only the parent folder.\n')
+                return False
+
+            if use_slurm(self.args.noslurm):
+                return self._slurm_cmd(folders=folders, cmd_type='index')
+            else:
+                # Run several scans at once, bounded by the number of cores
+                workers = min(len(folders), max(1, self.args.cores))
+
+                if workers > 1:
+                    res = self._index_concurrently(folders, workers)
+                else:
+                    res = True
+                    for folder in folders:
+                        if not self._index_locally(folder):
+                            res = False
+
+                if not res:
+                    log(f'\nWARNING: Some folders may have permission issues or are locked. Check the output above.\n')
+                    return False
+
+            return True
+
+        except Exception:
+            print_error()
+            return False
+
+    def _index_folder_captured(self, folder, summary, threads):
+        '''Index a folder capturing its log output, returns the result and the output'''
+
+        log_capture.buffer = []
+
+        try:
+            try:
+                res = self._index_locally(folder, summary=summary, threads=threads)
+            except Exception:
+                # The error is reported with the rest of the output of the folder
+                print_error()
+                res = False
+            return res, log_capture.buffer
+        finally:
+            log_capture.buffer = None
+
+    def _index_concurrently(self, folders, workers):
+        '''Index several folders in parallel and print an aggregated summary'''
+
+        TiB = 1099511627776
+
+        # Share the cores between the DuckDB instances of the concurrent scans
+        threads = max(1, self.args.cores // workers)
+
+        log(f'\nINDEXING {len(folders)} folders, {workers} at a time')
+
+        res = True
+        summaries = {folder: {} for folder in folders}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+
+            tasks = {executor.submit(self._index_folder_captured, folder, summaries[folder], threads): folder
+                     for folder in folders}
+
+            # Print the output of each folder as one block once it is done, the
+            # errors and warnings go to stderr as they would without the capture
+            for future in concurrent.futures.as_completed(tasks):
+                folder_res, output = future.result()
+                for stream, text in output:
+                    log(text, end='', file=stream)
+                if not folder_res:
+                    res = False
+
+        # Aggregate the summaries of all the folders
+        indexed = [summary for summary in summaries.values() if summary]
+        numhotspots = sum(summary['hotspots'] for summary in indexed)
+        numfolders = sum(summary['folders'] for summary in indexed)
+        totalbytes = sum(summary['totalbytes'] for summary in indexed)
+        agedbytes = [sum(summary['agedbytes'][i] for summary in indexed)
+                     for i in range(len(self.daysaged))]
+
+        log(textwrap.dedent(f'''
+            INDEXING SUMMARY
+                Folders indexed: {len(indexed)} of {len(folders)}
+                Total folders processed: {numfolders}
+                with {numhotspots} hotspots >= {self.thresholdGB} GiB
+                with a total disk use of {round(totalbytes/TiB,3)} TiB
+            '''))
+
+        self._log_aged_bytes(agedbytes)
+
+        # Output decoration print
+        log()
+
+        return res
+
+    def archive_select_hotspots(self):
+
+        # Check if the Hotspots directory exists
+        if not self.cfg.hotspots_dir or not os.path.exists(self.cfg.hotspots_dir):
+            log(
+                '\nNo folders to archive in arguments and no Hotspots CSV files found.')
+
+            log('\nFor archive a specific folder run:')
+            log('    froster archive "/your/folder/to/archive"')
+
+            log('\n For index a folder a find hotspots run:')
+            log('    froster index "/your/folder/to/index"\n')
+
+            return True
+
+        # Get all the hotspot CSV files in the hotspots directory
+        hotspots_files = [f for f in os.listdir(
+            self.cfg.hotspots_dir) if fnmatch.fnmatch(f, '*.csv')]
+
+        # Check if there are CSV files, if don't there are no folders to archive
+        if not hotspots_files:
+            log('\nNo hotposts found. \n')
+
+            log(
+                f'You can search for hotspot by indexing folders using command:')
+            log('    froster index "/your/folder/to/index"\n')
+
+            log('For archive a specific folder run:')
+            log('    froster archive "/your/folder/to/archive"\n')
+
+            return True
+
+        # Sort the CSV files by their modification time in descending order (newest first)
+        hotspots_files.sort(key=lambda x: os.path.getmtime(
+            os.path.join(self.cfg.hotspots_dir, x)), reverse=True)
+
+        # Ask the user to select a Hotspot file
+        ret = TextualStringListSelector(
+            title="Select a Hotspot file", items=hotspots_files).run()
+
+        # No file selected
+        if not ret:
+            return False
+
+        # Get the selected CSV file path from the first selector result
+        hotspot_selected = os.path.join(self.cfg.hotspots_dir, ret[0])
+
+        # Get the path to the user-specific CSV file containing only writable folders
+        path_result, filtering_skipped = self.get_hotspot_folders(hotspot_selected)
+
+        # Determine the actual path to display in the table
+        if path_result:
+            path_to_display = path_result
+        elif filtering_skipped:
+            # Filtering skipped, use the original selected file
+            path_to_display = hotspot_selected
+        else:
+            # Filtering attempted but failed or no writable folders found
+            log(f'\nNo writable hotspots found or accessible in {hotspot_selected}.\n')
+            return True # Indicate completion, even if nothing was archived
+
+        # Preselect the hotspots matching the --larger, --older and --newer flags
+        age = 'ModD' if self.args.agemtime else 'AccD'
+        filter_terms = []
+        if self.args.larger > 0:
+            filter_terms.append(f'GiB>={self.args.larger}')
+        if self.args.older > 0:
+            filter_terms.append(f'{age}>{self.args.older}')
+        if self.args.newer > 0:
+            filter_terms.append(f'{age}<{self.args.newer}')
+
+        # Use TableHotspots to display the filtered list and select the specific folder row
+        app = TableHotspots(path_to_display, filter_text=' '.join(filter_terms))
+        ret = app.run() # ret can be (row_data, action) or []
+
+        if not ret:
+            # No row selected in TableHotspots or user quit
+            return False
+        elif isinstance(ret, tuple):
+            row_data, action = ret
+            # Extract the folder path from the selected row
+            if len(row_data) < 6:
+                log('Error: Hotspots table did not return all expected columns.', file=sys.stderr)
+                return False
+            # Assuming the folder path is the 6th element (index 5)
+            folder_to_archive = row_data[5]
+
+            # The filtering may be based on the stat data of the index, check the selected folder live
+            log(f"Checking write permission for selected folder: {folder_to_archive}")
+            has_permission = self._check_path_permissions(folder_to_archive, write_only=True)
+            if not has_permission:
+                log(f'\nError: Write permission denied for selected folder: {folder_to_archive}\n')
+                # Ideally, we'd go back to the table here, but for simplicity, we exit.
+                return False # Indicate failure
+            else:
+                log("  Permission granted.")
+
+            if action == "continue":
+                # Archive the selected folders
+                return self.archive([folder_to_archive])
+            elif action == "quit":
+                # Construct the command line string
+                # Add profile if it's not the default one implicitly used
+                profile_arg = f' --profile "{self.cfg.profile.replace("profile ", "")}"' if self.cfg.profile else ""
+                # Add recursive flag if it was set
+                recursive_arg = " --recursive" if self.args.recursive else ""
+                # Add notar flag if it was set
+                notar_arg = " --no-tar" if self.args.notar else ""
+                # Add nihref if it was set
+                nih_arg = f' --nih-ref "{self.args.nihref}"' if self.args.nihref else ""
+                # Add filtering flags if they were used
+                larger_arg = f' --larger {self.args.larger}' if self.args.larger > 0 else ""
+                older_arg = f' --older {self.args.older}' if self.args.older > 0 else ""
+                newer_arg = f' --newer {self.args.newer}' if self.args.newer > 0 else ""
+                mtime_arg = " --mtime" if self.args.agemtime else ""
+
+                cmd_str = f'froster archive{profile_arg}{recursive_arg}{notar_arg}{nih_arg}{larger_arg}{older_arg}{newer_arg}{mtime_arg} "{folder_to_archive}"'
+                log(f'\nTo archive this folder later, run:\n\n    {cmd_str}\n')
+                return True # Indicate successful completion without archiving
+            else:
+                 # Should not happen with current logic, but handle defensively
+                 log(f"Internal Error: Unknown action '{action}' received.", file=sys.stderr)
+                 return False
+        else:
+            # Handle unexpected return type from app.run()
+            log(f"Internal Error: Unexpected return type from TableHotspots: {type(ret)}", file=sys.stderr)
+            return False
+
+    def archive_batch(self):
+        '''Archive all writable hotspots matching the --larger, --older and --newer policy at once'''
+
+        try:
+            GiB = 1073741824
+            TiB = 1099511627776
+
+            if not (self.args.larger > 0 or self.args.older > 0 or self.args.newer > 0):
+                log('\nError: Set the batch policy with --larger <GiB>, --older <days> or --newer <days>.\n')
+                return False
+
+            # Get the hotspot files to evaluate, all of them by default
+            if self.args.hotspotsfile:
+                hotspots_files = [self.args.hotspotsfile]
+            elif self.cfg.hotspots_dir and os.path.isdir(self.cfg.hotspots_dir):
+                hotspots_files = sorted(os.path.join(self.cfg.hotspots_dir, f) for f in os.listdir(
+                    self.cfg.hotspots_dir) if fnmatch.fnmatch(f, '*.csv'))
+            else:
+                hotspots_files = []
+
+            if not hotspots_files:
+                log('\nNo hotspots found. You can search for hotspots by indexing folders using command:')
+                log('    froster index "/your/folder/to/index"\n')
+                return False
+
+            # Keep only the folders the user can write to
+            writable_files = []
+            for hotspots_file in hotspots_files:
+                if not os.path.isfile(hotspots_file):
+                    log(f'\nError: Hotspots file not found: {hotspots_file}\n')
+                    return False
+
+                # The ages of a refreshed index can be stale, data in use would look old
+                if os.path.isfile(self._index_refreshed_marker(hotspots_file)):
+                    log(f'\nError: The hotspots file {hotspots_file} comes from a refreshed index (--refresh),')
+                    log(f'its access and modification times may be those of the last full scan.')
+                    log(f'Index the folder again with "froster index --force" before archiving in batch.\n')
+                    return False
+                path_result, _ = self.get_hotspot_folders(hotspots_file)
+                if path_result:
+                    writable_files.append(path_result)
+
+            if not writable_files:
+                log('\nNo writable hotspots found.\n')
+                return True
+
+            age = 'ModD' if self.args.agemtime else 'AccD'
+            conditions = []
+            if self.args.larger > 0:
+                conditions.append(f'DirSize >= {self.args.larger * GiB}')
+            if self.args.older > 0:
+                conditions.append(f'{age} > {self.args.older}')
+            if self.args.newer > 0:
+                conditions.append(f'{age} < {self.args.newer}')
+
+            duckdb_connection = duckdb.connect(':memory:')
+            rows = duckdb_connection.execute(f"""SELECT Folder, max(DirSize)
+                                                 FROM read_csv([{', '.join(self._sql_string(f) for f in writable_files)}],
+                                                      header=true, union_by_name=true)
+                                                 WHERE {' AND '.join(conditions)}
+                                                 GROUP BY Folder
+                                                 ORDER BY Folder
+                                              """).fetchall()
+            duckdb_connection.close()
+
+            # The write access may come from the stat data of the index, check it live
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(64, max(8, 4 * int(self.args.cores)))) as executor:
+                is_writable = list(executor.map(
+                    lambda row: self._check_path_permissions(row[0], write_only=True), rows))
+            sizes = {folder: dirsize for (folder, dirsize), writable in zip(rows, is_writable) if writable}
+
+            # A recursive archive of a folder includes its subfolders, archive the outermost folders only
+            if self.args.recursive:
+                for ancestor, folder in self._nested_folders(list(sizes)):
+                    log(f'  Skipping {folder}, it is archived recursively with {ancestor}')
+                    sizes.pop(folder, None)
+
+            folders = list(sizes)
+
+            if not folders:
+                log(f'\nNo writable hotspots match the policy ({" AND ".join(conditions)}).\n')
+                return True
+
+            log(f'\n{len(folders)} hotspots match the policy ({" AND ".join(conditions)}), '
+                f'{round(sum(sizes.values())/TiB, 3)} TiB:\n')
+            for folder in folders:
+                log(f'    {folder}')
+            log()
+
+            if self.args.dryrun:
+                log('Dry run, nothing archived.\n')
+                return True
+
+            # The Slurm job archives the selected folders, it does not evaluate the policy again
+            # Rebuild the command line from the parsed arguments, without --batch and
+            # --hotspots-file, so that combined short flags (e.g. -fb) are handled too
+            if use_slurm(self.args.noslurm):
+                self.args.batch = False
+                self.args.hotspotsfile = ''
+                self.args.folders = folders
+                sys.argv = [sys.argv[0]] + args_to_argv(
+                    cli_parser, self.args, exclude=('fromfile',))
+
+            return self.archive(folders)
+
+        except Exception:
+            print_error()
+            return False
+
+    def _is_recursive_collision(self, folders):
+        '''Check if there is a collision between folders and recursive flag'''
+        is_collision = False
+
+        try:
+            # Sorted prefixes instead of comparing every pair, all the nested folders are reported
+            for ancestor, folder in self._nested_folders(folders):
+                is_collision = True
+                log(
+                    f'Folder {folder} is a subdirectory of folder {ancestor}.\n', file=sys.stderr)
+        except Exception as e:
+            print_error()
+            is_collision = True
+
+        return is_collision
+
+    def _archive_locally(self, folder_to_archive, s3_dest, is_tar, is_force):
+        '''Archive the given folder'''
+
+        try:
+
+            hashfile = os.path.join(folder_to_archive, self.md5sum_filename)
+
+            # Force flag provided, reset the folder and continue the archive process
+            if is_force:
+                if self.reset_folder(folder_to_archive):
+                    # Reset folder successful. Continue the archive process
+                    pass
+                else:
+                    # Reset folder failed. Exiting...
+                    return False
+            else:
+                # If hash file exists, check if the folder is already archived
+                if os.path.exists(hashfile):
+                    # Check if folder is archived according to our database
+                    archived_folder_info = self.froster_archives_get_entry(
+                        folder_to_archive)
+
+                    # Check if folder is already archived in S3
+                    rclone = Rclone(self.args, self.cfg)
+                    checksum = rclone.checksum(
+                        hashfile, s3_dest, '--max-depth', '1')
+
+                    if archived_folder_info and checksum:
+                        # Folder is already archived. Print error message
+                        log(
+                            f'\nThe folder {folder_to_archive} is already archived in S3 bucket.\n')
+                        log(f'{archived_folder_info}\n')
+
+                    elif archived_folder_info and not checksum:
+                        # Folder is archived in our database but checksums do not match in the S3 bucket. Print error message
+                        log(
+                            f'\nThe folder {folder_to_archive} is already archived in our database but checksums do not match in the S3 bucket.\n')
+                        log(f'{archived_folder_info}\n')
+                        log(f'\nIf you want to force the archiving process again on this folder, please us the -f or --force flag\n')
 
                     else:
                         # Folder has a hashfile and is not archived. Print error message
@@ -4175,18 +5920,46 @@ class Archiver:
             else:
                 log(f'\n    Generating Froster.allfiles.csv...')
 
+            # Stream the tar of the small files to S3 instead of writing it to the folder.
+            # The small files are kept until the whole archive is verified
+            tar_upload = None
+            tarred_paths = []
+            if is_tar and self.args.stream:
+                tar_upload = self._s3_upload(
+                    s3_dest, self.smallfiles_tar_filename)
+                if tar_upload is None:
+                    return False
+
             # Generate Froster.allfiles.csv and if is_tar tar small files
-            if self._gen_allfiles_and_tar(folder_to_archive, self.thresholdKB, is_tar):
+            if self._gen_allfiles_and_tar(folder_to_archive, self.thresholdKB, is_tar, tar_upload, tarred_paths):
                 log(f'        ...done')
             else:
                 return False
 
-            # Generate md5 checksums for all files in the folder
-            log(f'\n    Generating checksums...\n')
-            if self._gen_md5sums(folder_to_archive, self.md5sum_filename):
-                log('        ...done')
+            # The streamed tar is not in the folder, its MD5 was computed during the upload
+            tar_hashes = []
+            if tar_upload is not None and tar_upload.md5:
+                tar_hashes.append(
+                    f"{tar_upload.md5}  {self.smallfiles_tar_filename}\n")
+
+            # The tarred small files are neither hashed nor uploaded on their own
+            tarred_files = [os.path.basename(file_path) for file_path in tarred_paths]
+
+            if self.args.stream:
+                # Read each file only once, it is hashed while it is uploaded
+                log(f'\n    Uploading files and generating checksums...\n')
+                if self._stream_files(folder_to_archive, s3_dest, self.md5sum_filename, tar_hashes,
+                                      tarred_files):
+                    log('        ...done')
+                else:
+                    return False
             else:
-                return False
+                # Generate md5 checksums for all files in the folder
+                log(f'\n    Generating checksums...\n')
+                if self._gen_md5sums(folder_to_archive, self.md5sum_filename):
+                    log('        ...done')
+                else:
+                    return False
 
             # Create an Rclone object
             rclone = Rclone(self.args, self.cfg)
@@ -4205,6 +5978,7 @@ class Archiver:
             ret = rclone.copy(allfiles_source, s3_dest, '--max-depth', '1', '--links',
                               '--exclude', self.md5sum_filename,
                               '--exclude', self.md5sum_restored_filename,
+                              '--exclude', self.manifest_filename,
                               '--exclude', self.allfiles_csv_filename,
                               '--exclude', self.where_did_the_files_go_filename
                               )
@@ -4218,17 +5992,33 @@ class Archiver:
                 log('        ...FAILED\n')
                 return False
 
+            # The tarred small files still in the folder are left out, one filter rule each
+            exclude_args = []
+            if tarred_files:
+                with tempfile.NamedTemporaryFile('w', prefix='froster-exclude-', suffix='.txt',
+                                                 delete=False) as f:
+                    for file in tarred_files:
+                        # Anchored to the folder, the glob characters escaped
+                        f.write('/' + re.sub(r'([\\*?\[\]{}])', r'\\\1', file) + '\n')
+                exclude_args = ['--exclude-from', f.name]
+
             # Archive the folder to S3
             log(f'\n    Uploading files...')
-            ret = rclone.copy(folder_to_archive, s3_dest, '--max-depth', '1', '--links',
-                              '--exclude', self.md5sum_filename,
-                              '--exclude', self.md5sum_restored_filename,
-                              '--exclude', self.allfiles_csv_filename,
-                              '--exclude', self.where_did_the_files_go_filename,
-                              '--transfers', str(self.args.cores),
-                              '--checkers', str(self.args.cores//2),
-                              '--multi-thread-streams', '4'
-                              )
+            try:
+                ret = rclone.copy(folder_to_archive, s3_dest, '--max-depth', '1', '--links',
+                                  '--exclude', self.md5sum_filename,
+                                  '--exclude', self.md5sum_restored_filename,
+                                  '--exclude', self.manifest_filename,
+                                  '--exclude', self.allfiles_csv_filename,
+                                  '--exclude', self.where_did_the_files_go_filename,
+                                  *exclude_args,
+                                  '--transfers', str(self.args.cores),
+                                  '--checkers', str(self.args.cores//2),
+                                  '--multi-thread-streams', '4'
+                                  )
+            finally:
+                if exclude_args:
+                    os.remove(exclude_args[1])
 
             # Check if the folder was archived successfully
             if ret:
@@ -4248,6 +6038,15 @@ class Archiver:
                 log('        ...FAILED\n')
                 return False
 
+            # The streamed tar is verified with all the other files, the small files can go
+            if tarred_paths:
+                log(f'\n    Removing the tarred small files...')
+                for file_path in tarred_paths:
+                    try:
+                        os.remove(file_path)
+                    except FileNotFoundError:
+                        pass
+                log('        ...done')
 
             # Print the final message
             log(f'\nARCHIVING SUCCESSFULLY COMPLETED\n')
@@ -4263,6 +6062,160 @@ class Archiver:
             print_error()
             return False
 
+    def _s3_upload(self, s3_dest, filename, **kwargs):
+        '''Get the S3MultipartUpload of a file of the given rclone destination, None without S3 session'''
+
+        # One session for all the uploads
+        if getattr(self, 's3_client', None) is None:
+            aws = AWSBoto(self.args, self.cfg, self)
+            if not aws.is_session_set:
+                log('\nError: Cannot stream to S3, no S3 session.\n')
+                return None
+            self.s3_client = aws.s3_client
+
+        # :s3:bucket/archive_dir/folder
+        bucket, _, prefix = s3_dest[len(':s3:'):].partition('/')
+        key = f'{prefix}/{filename}' if prefix else filename
+
+        return S3MultipartUpload(self.s3_client, bucket, key,
+                                 storage_class=self.cfg.storage_class, **kwargs)
+
+    def _stream_files(self, directory, s3_dest, hash_file, extra_hashes=None, excluded=()):
+        '''Upload the files of a directory to S3 while they are hashed, and write their hash file
+
+        Each file is read only once. Its MD5 is written to the hash file and to the
+        object metadata, with its modification time in the rclone format, so the
+        rclone copy that follows skips it. Symlinks and the allfiles CSV are left to
+        rclone and only hashed. extra_hashes are lines of files not in the directory,
+        the excluded files are skipped.'''
+
+        try:
+            hashpath = os.path.join(directory, hash_file)
+
+            _, entries = FileSystemScanner(
+                one_file_system=False, skipdirs=[]).list_folder(directory)
+
+            # Skip froster files
+            skipped = {hash_file, self.where_did_the_files_go_filename,
+                       self.md5sum_filename, self.md5sum_restored_filename, self.manifest_filename}
+            skipped.update(excluded)
+
+            uploads = []
+            hashes = []
+            for file_path, file_stat in entries:
+                file = os.path.basename(file_path)
+                if file in skipped:
+                    continue
+                if stat.S_ISREG(file_stat.st_mode) and file != self.allfiles_csv_filename:
+                    uploads.append((file_path, file_stat))
+                elif os.path.isfile(file_path):
+                    hashes.append(file_path)
+
+            # Each upload holds up to 2 parts of 16 MiB
+            part_size = 16 * 1048576
+            max_workers = min(16, max(4, int(self.args.cores)))
+
+            # MD5 for rclone and the fast hash for the local checks
+            algorithms = ('md5',) + ((self.fast_hash,) if self.fast_hash else ())
+
+            def upload_file(file_path, file_stat, pbar):
+                '''Upload a file and get its checksums (run in the upload threads)'''
+
+                ns = file_stat.st_mtime_ns
+                upload = self._s3_upload(s3_dest, os.path.basename(file_path),
+                                         part_size=part_size, max_inflight=2,
+                                         metadata={'mtime': f'{ns // 1000000000}.{ns % 1000000000:09d}'})
+                if upload is None:
+                    raise RuntimeError(f'Cannot upload {file_path}, no S3 session')
+                fast_hash = new_hash(self.fast_hash) if self.fast_hash else None
+                try:
+                    with open(file_path, 'rb') as f:
+                        while chunk := f.read(part_size):
+                            upload.write(chunk)
+                            if fast_hash:
+                                fast_hash.update(chunk)
+                            pbar.update(len(chunk))
+                    upload.close()
+                except Exception:
+                    upload.abort()
+                    raise
+
+                checksums = {'md5': upload.md5}
+                if fast_hash:
+                    checksums[self.fast_hash] = fast_hash.hexdigest()
+                return checksums
+
+            cache = self._checksum_cache()
+
+            manifest = []
+
+            with open(hashpath, "w") as out_f, \
+                    concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor, \
+                    HashEngine(workers=4, large_workers=2,
+                               max_inflight=self.hashinflightMB * 1048576) as engine, \
+                    tqdm.tqdm(total=sum(file_stat.st_size for _, file_stat in uploads), unit='B',
+                              disable=self.output_disable, unit_scale=True, desc="    Overall Progress") as pbar:
+
+                tasks = {executor.submit(upload_file, file_path, file_stat, pbar): (file_path, file_stat)
+                         for file_path, file_stat in uploads}
+                tasks.update({engine.submit(file_path, algorithms=algorithms): (file_path, None)
+                              for file_path in hashes})
+
+                for future in concurrent.futures.as_completed(tasks):
+                    file_path, file_stat = tasks[future]
+                    checksums = future.result()
+                    file = os.path.basename(file_path)
+                    out_f.write(f"{checksums['md5']}  {file}\n")
+                    manifest.append(self._manifest_row(
+                        file, file_stat or os.stat(file_path), checksums))
+
+                    # Later archives of the same files do not hash them again
+                    if cache and file_stat and self._same_file_stat(file_stat, os.stat(file_path)):
+                        for algorithm, checksum in checksums.items():
+                            cache.put(file_stat, checksum, algorithm)
+
+                for line in extra_hashes or []:
+                    out_f.write(line)
+
+            if cache:
+                cache.close()
+
+            # Check we generated the hash file
+            if os.path.getsize(hashpath) == 0:
+                os.remove(hashpath)
+                return False
+
+            with open(os.path.join(directory, self.manifest_filename), 'w', newline='') as manifest_f:
+                manifest_writer = csv.writer(manifest_f)
+                manifest_writer.writerow(self._manifest_header())
+                manifest_writer.writerows(manifest)
+
+            return True
+
+        except Exception:
+            print_error()
+            return False
+
+    def _nested_folders(self, folders):
+        '''Get the folders that are inside another of the given folders
+
+        Returns a list of (ancestor, folder) pairs with the closest ancestor of each
+        nested folder. After sorting, the folders inside a folder directly follow it,
+        so a single pass with a stack of the current ancestors finds all of them.'''
+
+        nested = []
+        ancestors = []
+
+        for key, folder in sorted((os.path.normpath(folder).rstrip(os.path.sep) + os.path.sep, folder)
+                                  for folder in folders):
+            while ancestors and not key.startswith(ancestors[-1][0]):
+                ancestors.pop()
+            if ancestors:
+                nested.append((ancestors[-1][1], folder))
+            ancestors.append((key, folder))
+
+        return nested
+
     def archive(self, folders):
         '''Archive the given folders'''
         try:
@@ -4291,9 +6244,10 @@ class Archiver:
                 nih = app.run()
 
                 if nih:
-                    # Add the nihref to arguments for slurm script execution
-                    sys.argv.append('--nih-ref')
-                    sys.argv.append(nih[0])
+                    # Add the nihref to arguments for slurm script execution, before the
+                    # folders given after "--"
+                    argv_end = sys.argv.index('--') if '--' in sys.argv else len(sys.argv)
+                    sys.argv[argv_end:argv_end] = ['--nih-ref', nih[0]]
                     self.args.nihref = nih[0]
 
                 else:
@@ -4507,21 +6461,6 @@ class Archiver:
     def _filter_hotspots_by_write_access(self, hotspot_csv):
         # Helper function to filter hotspots based on write access and return user-specific CSV path
         try:
-            # Count lines in the original file first
-            line_count = 0
-            try:
-                with open(hotspot_csv, 'r') as f_count:
-                    # Simple line count, including header
-                    line_count = sum(1 for _ in f_count)
-            except Exception as e:
-                 log(f"Warning: Could not count lines in {hotspot_csv}: {e}", file=sys.stderr)
-                 # Proceed assuming fewer than 5000 lines
-
-            # If line count is too high, skip filtering
-            if line_count >= 5000:
-                log(f"Skipping proactive write permission check for large file ({line_count} lines): {hotspot_csv}")
-                return (None, True) # Return None path, indicate filtering skipped
-
             hsdir, hsfile = os.path.split(hotspot_csv)
             # Ensure user-specific directory exists within the main hotspots dir
             hsdiruser = os.path.join(self.cfg.hotspots_dir, self.cfg.whoami)
@@ -4537,74 +6476,128 @@ class Archiver:
                     log(f"Re-filtering hotspots due to --force flag: {hotspot_csv}")
 
             log('Filtering hotspots for folders with write permissions ...')
-            writable_folders_data = []
-            fieldnames = []
-            total_lines = 0 # For progress bar
+            numwritable = 0
 
-            try:
-                # First pass to get header and count lines for tqdm
-                with open(hotspot_csv, mode='r', newline='') as infile_count:
-                    reader_count = csv.reader(infile_count)
-                    header_list = next(reader_count, None)
-                    if not header_list:
-                         log(f"Error: Hotspot file is empty or has no header: {hotspot_csv}", file=sys.stderr)
-                         return (None, False)
-                    fieldnames = header_list
-                    try:
-                        # Count remaining lines
-                        total_lines = sum(1 for _ in reader_count)
-                    except Exception:
-                         total_lines = 0 # Fallback if counting fails
+            # The folders writable from the stat data of the index store need no file system
+            # call, the others are checked live as ACLs or group changes may still allow writing
+            stored_writable = self._stored_write_access(hotspot_csv)
 
-                # Second pass to read data and check permissions
-                with open(hotspot_csv, mode='r', newline='') as infile:
-                    reader = csv.DictReader(infile)
-                    # Ensure fieldnames match if DictReader didn't get them correctly (e.g., empty file)
-                    if not reader.fieldnames:
-                         reader.fieldnames = fieldnames
+            # The checks are mostly waiting for the file server (NFS), many run at once
+            max_workers = min(64, max(8, 4 * int(self.args.cores)))
+
+            # Rows are checked in chunks, the chunks in flight are bounded so huge hotspot files are streamed
+            chunk_size = 256
+            window = max_workers * 4
+
+            # Write to a temporary file, an interrupted run never leaves a partial user CSV
+            user_csv_tmp = f'{user_csv}.tmp'
+
+            def check_chunk(paths):
+                return [path in stored_writable
+                        or self._check_path_permissions(path, write_only=True)
+                        for path in paths]
+
+            try:
+                with open(hotspot_csv, mode='r', newline='') as infile, \
+                        open(user_csv_tmp, mode='w', newline='') as outfile, \
+                        concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+                    reader = csv.reader(infile)
+                    fieldnames = next(reader, None)
+                    if not fieldnames:
+                        log(f"Error: Hotspot file is empty or has no header: {hotspot_csv}", file=sys.stderr)
+                        return (None, False)
 
                     if 'Folder' not in fieldnames:
                         log(f"Error: 'Folder' column not found in hotspot file: {hotspot_csv}", file=sys.stderr)
                         return (None, False)
+                    folder_index = fieldnames.index('Folder')
+
+                    writer = csv.writer(outfile)
+                    writer.writerow(fieldnames)
+
+                    # Check the folders in parallel and write the writable ones in the original order
+                    pending = collections.deque()
+
+                    def write_oldest():
+                        nonlocal numwritable
+                        rows, future = pending.popleft()
+                        writable_rows = [row for row, is_writable in zip(rows, future.result()) if is_writable]
+                        writer.writerows(writable_rows)
+                        numwritable += len(writable_rows)
+
+                    def submit(rows):
+                        paths = [row[folder_index] if len(row) > folder_index else None for row in rows]
+                        pending.append((rows, executor.submit(check_chunk, paths)))
+                        if len(pending) >= window:
+                            write_oldest()
 
                     # Use tqdm for progress indication
-                    for row in tqdm.tqdm(reader, total=total_lines, desc="Checking write access", unit="folder", disable=self.output_disable):
-                        folder_path = row.get('Folder')
-                        # Check if folder_path exists and has write permission
-                        if folder_path and self._check_path_permissions(folder_path, write_only=True):
-                            writable_folders_data.append(row)
+                    rows = []
+                    for row in tqdm.tqdm(reader, desc="Checking write access", unit="folder", disable=self.output_disable):
+                        rows.append(row)
+                        if len(rows) >= chunk_size:
+                            submit(rows)
+                            rows = []
+
+                    if rows:
+                        submit(rows)
+
+                    while pending:
+                        write_oldest()
+
+                os.replace(user_csv_tmp, user_csv)
 
             except FileNotFoundError:
                 log(f"Error: Hotspot file not found: {hotspot_csv}", file=sys.stderr)
                 return (None, False)
             except Exception as e:
-                print_error(f"Error reading hotspot file {hotspot_csv}: {e}")
+                print_error(f"Error filtering hotspot file {hotspot_csv}: {e}")
                 return (None, False)
+            finally:
+                if os.path.exists(user_csv_tmp):
+                    os.remove(user_csv_tmp)
 
-            # Write the filtered data (or just header if no writable folders found)
-            try:
-                with open(user_csv, mode='w', newline='') as outfile:
-                    if not fieldnames: # Should have fieldnames if we got here
-                        log("Error: Missing fieldnames for writing user hotspot file.", file=sys.stderr)
-                        return (None, False)
-                    writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-                    writer.writeheader()
-                    if writable_folders_data:
-                        writer.writerows(writable_folders_data)
-                        log(f"Filtered hotspots written to: {user_csv}")
-                    else:
-                         log(f"No writable folders found. Empty file created: {user_csv}")
-
-                return (user_csv, False) # Return path even if only header was written
+            if numwritable:
+                log(f"Filtered hotspots written to: {user_csv}")
+            else:
+                log(f"No writable folders found. Empty file created: {user_csv}")
 
-            except Exception:
-                print_error(f"Error writing user hotspot file: {user_csv}")
-                return (None, False)
+            return (user_csv, False) # Return path even if only header was written
 
         except Exception:
             print_error("Error in _filter_hotspots_by_write_access")
             return (None, False)
 
+    def _stored_write_access(self, hotspot_csv):
+        '''Get the write access of the hotspot folders from the index store of the hotspots file
+
+        Returns the set of folders writable from their mode bits, empty if there is no index
+        store. The mode bits ignore ACLs, so a folder not in the set may still be writable.'''
+
+        index_store = os.path.splitext(hotspot_csv)[0] + '.parquet'
+        if not os.path.isfile(index_store):
+            return set()
+
+        try:
+            duckdb_connection = duckdb.connect(':memory:')
+
+            rows = duckdb_connection.execute(f"""SELECT s.filename
+                                                FROM read_csv({self._sql_string(hotspot_csv)}, header=true, all_varchar=true) h
+                                                    JOIN read_parquet({self._sql_string(index_store)}) s
+                                                    ON s.filename = h.Folder AND s.pw_fcount > -1
+                                                WHERE {PermissionEvaluator().sql_can_write('s.st_mode', 's.UID', 's.GID')}
+                                             """).fetchall()
+
+            duckdb_connection.close()
+
+            return {row[0] for row in rows}
+
+        except Exception:
+            # Not fatal, the folders are checked on the file system
+            printdbg(f'Cannot read the index store {index_store}')
+            return set()
+
     def get_hotspot_folders(self, hotspot_file):
         # This function now filters the hotspot file for writable folders
         # and returns the path to the new user-specific CSV file and a flag
@@ -4651,6 +6644,13 @@ class Archiver:
             printdbg(f"Invalid path provided (empty string)")
             return False
 
+        # Only the write access is needed, a single call that also fails for missing paths
+        if write_only:
+            can_write = os.access(path, os.W_OK)
+            if not can_write:
+                printdbg(f"Cannot write: {path}")
+            return can_write
+
         # Check if path exists before checking permissions
         if not os.path.exists(path):
              printdbg(f"Path does not exist: {path}")
@@ -4662,16 +6662,13 @@ class Archiver:
 
         # Print error messages if the user does not have read or write permissions
         # Only print if debug is enabled to avoid cluttering the output during filtering
-        if not can_read and not write_only:
+        if not can_read:
             printdbg(f"Cannot read: {path}")
         if not can_write:
             printdbg(f"Cannot write: {path}")
 
         # Return True if the user has the required permissions, otherwise return False
-        if write_only:
-            return can_write
-        else:
-            return can_read and can_write
+        return can_read and can_write
 
     def _is_correct_files_folders_permissions(self, folders, is_recursive=False):
         '''Check if the user has read and write permissions to the given folders'''
@@ -4762,8 +6759,7 @@ class Archiver:
 
                 # Checking if the user is in the file's group
                 is_group_member = file_stat.st_gid == current_gid or \
-                    any(grp.getgrgid(g).gr_gid ==
-                        file_stat.st_gid for g in os.getgroups())
+                    file_stat.st_gid in os.getgroups()
 
             except Exception as e:
                 print_error()
@@ -4817,8 +6813,13 @@ class Archiver:
             log(f'\ncan_read: {can_read}')
             log(f'can_write: {can_write}\n')
 
-    def _gen_allfiles_and_tar(self, directory, smallsize=1024, is_tar=True):
-        '''Tar small files in a directory'''
+    def _gen_allfiles_and_tar(self, directory, smallsize=1024, is_tar=True, tar_upload=None, tarred_paths=None):
+        '''Tar small files in a directory
+
+        If tar_upload (a S3MultipartUpload) is given the tar is streamed to S3 instead
+        of written to the directory. The small files are then left in place and
+        added to the list tarred_paths, the caller removes them once the whole
+        archive is verified.'''
 
         try:
             tar_path = os.path.join(directory, self.smallfiles_tar_filename)
@@ -4827,92 +6828,228 @@ class Archiver:
             if os.path.exists(tar_path):
                 return True
 
-            for root, dirs, files in self._walker(directory):
+            # List the directory in a single pass, the stat of each file (one lstat) is
+            # reused for the CSV and the tar header. We only want the files in the
+            # directory itself. Avoid recursion.
+            _, files = FileSystemScanner(
+                one_file_system=False, skipdirs=[]).list_folder(directory)
 
-                # We only want to tar the files in the root directory. Avoid recursion.
-                if root != directory:
-                    break
+            # Flag to check if any files were tarred
+            didtar = False
+
+            # Rows are written in batches
+            rows = []
 
-                # Flag to check if any files were tarred
-                didtar = False
+            # The small files are read by a thread pool ahead of the tar writer (this thread)
+            is_small = [is_tar and stat.S_ISREG(file_stat.st_mode) and file_stat.st_size < smallsize*1024
+                        and file_path != csv_path for file_path, file_stat in files]
+            prefetched = self._prefetch_files([(file_path, file_stat.st_size)
+                                               for (file_path, file_stat), small in zip(files, is_small) if small])
 
-                # Create tar file and csv file
-                with tarfile.open(tar_path, "w") as tar_file, open(csv_path, 'w', newline='') as csv_file:
+            # Small files of the streamed tar, removed by the caller
+            if tarred_paths is None:
+                tarred_paths = []
 
-                    # Create csv writer
-                    writer = csv.writer(csv_file)
+            if tar_upload is not None:
+                tar_file = tarfile.open(fileobj=tar_upload, mode="w|")
+            else:
+                tar_file = tarfile.open(tar_path, "w")
 
-                    # Write the header
-                    writer.writerow(["File", "Size(bytes)", "Date-Modified",
-                                    "Date-Accessed", "Owner", "Group", "Permissions", "Tarred"])
+            # Create tar file and csv file
+            with tar_file, open(csv_path, 'w', newline='') as csv_file:
 
-                    for file in files:
-                        # Get the file path
-                        file_path = os.path.join(root, file)
+                # Create csv writer
+                writer = csv.writer(csv_file)
 
-                        # Skip the csv file
-                        if file_path == csv_path:
-                            continue
+                # Write the header
+                writer.writerow(["File", "Size(bytes)", "Date-Modified",
+                                "Date-Accessed", "Owner", "Group", "Permissions", "Tarred"])
 
-                        # Check if it's a regular file or a symlink
-                        if os.path.isfile(file_path) or os.path.islink(file_path):
-                            # Check if file is larger than X MB
-                            size, mtime, atime = self._get_file_stats(file_path)
-
-                            # Get last modified date
-                            mdate = datetime.datetime.fromtimestamp(
-                                mtime).strftime('%Y-%m-%d %H:%M:%S')
-
-                            # Get last accessed date
-                            adate = datetime.datetime.fromtimestamp(
-                                atime).strftime('%Y-%m-%d %H:%M:%S')
-
-                            # Get ownership
-                            owner = self.uid2user(os.lstat(file_path).st_uid)
-                            group = self.gid2group(os.lstat(file_path).st_gid)
-
-                            # Get permissions
-                            permissions = oct(os.lstat(file_path).st_mode)
-
-                            # Set tarred to No
-                            tarred = "No"
-
-                            # Tar the file if it's smaller than the specified size
-                            if is_tar and size < smallsize*1024:
-                                try:
-                                    # add to tar file
-                                    tar_file.add(file_path, arcname=file)
-
-                                    # Set didtar to True, so we know we tarred a file
-                                    didtar = True
-
-                                    # remove original file
-                                    os.remove(file_path)
-
-                                    # Set tarred to Yes
-                                    tarred = "Yes"
-                                except FileNotFoundError:
-                                    log(f"Warning: File {file_path} disappeared before tarring/removal.")
-                                    continue # Skip writing CSV row if tarring failed
-                                except Exception as e:
-                                    log(f"Warning: Failed to tar or remove {file_path}: {e}")
-                                    continue # Skip writing CSV row if tarring failed
-
-                            # Write file info to the csv file
-                            writer.writerow(
-                                [file, size, mdate, adate, owner, group, permissions, tarred])
-
-                # Check if we tarred any files
-                if not didtar:
-                    # Remove the tar file if it's empty
-                    os.remove(tar_path)
+                for (file_path, file_stat), small in zip(files, is_small):
+
+                    # Get the content of a small file, read ahead in the listing order
+                    data = error = None
+                    if small:
+                        _, data, error = next(prefetched)
+
+                    # Skip the csv file
+                    if file_path == csv_path:
+                        continue
+
+                    # Only regular files and symlinks
+                    if not (stat.S_ISREG(file_stat.st_mode) or stat.S_ISLNK(file_stat.st_mode)):
+                        continue
+
+                    file = os.path.basename(file_path)
+                    size = file_stat.st_size
+
+                    # Get last modified date
+                    mdate = datetime.datetime.fromtimestamp(
+                        file_stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
+
+                    # Get last accessed date
+                    adate = datetime.datetime.fromtimestamp(
+                        file_stat.st_atime).strftime('%Y-%m-%d %H:%M:%S')
+
+                    # Get ownership (cached names)
+                    owner = self.uid2user(file_stat.st_uid)
+                    group = self.gid2group(file_stat.st_gid)
+
+                    # Get permissions
+                    permissions = oct(file_stat.st_mode)
+
+                    # Set tarred to No
+                    tarred = "No"
+
+                    # Tar the file if it's smaller than the specified size
+                    if is_tar and size < smallsize*1024:
+                        try:
+                            # add to tar file, the header is built from the listing stat
+                            if error is not None:
+                                raise error
+
+                            tarinfo = self._tarinfo_from_stat(
+                                tar_file, file_path, file, file_stat)
+                            if tarinfo.isreg():
+                                # The file may have changed since the listing
+                                tarinfo.size = len(data)
+                                tar_file.addfile(tarinfo, io.BytesIO(data))
+                            else:
+                                tar_file.addfile(tarinfo)
+
+                            # Set didtar to True, so we know we tarred a file
+                            didtar = True
+
+                            # remove original file
+                            if tar_upload is not None:
+                                tarred_paths.append(file_path)
+                            else:
+                                os.remove(file_path)
+
+                            # Set tarred to Yes
+                            tarred = "Yes"
+                        except FileNotFoundError:
+                            log(f"Warning: File {file_path} disappeared before tarring/removal.")
+                            continue # Skip writing CSV row if tarring failed
+                        except Exception as e:
+                            log(f"Warning: Failed to tar or remove {file_path}: {e}")
+                            continue # Skip writing CSV row if tarring failed
+
+                    # Write file info to the csv file
+                    rows.append([file, size, mdate, adate,
+                                owner, group, permissions, tarred])
+                    if len(rows) >= 10000:
+                        writer.writerows(rows)
+                        rows = []
+
+                writer.writerows(rows)
+
+            prefetched.close()
+
+            if tar_upload is not None:
+                if didtar:
+                    # Complete and verify the upload, the originals are kept for now
+                    tar_upload.close()
+                else:
+                    tar_upload.abort()
+
+            # Check if we tarred any files
+            elif not didtar:
+                # Remove the tar file if it's empty
+                os.remove(tar_path)
 
             return True
 
         except Exception:
+            if tar_upload is not None:
+                tar_upload.abort()
             print_error()
             return False
 
+    def _prefetch_files(self, files):
+        '''Read the content of files with a thread pool ahead of the caller
+
+        Takes a list of (path, size) and yields (path, data, error) in the same
+        order. The bytes read ahead and not yet consumed are bounded by
+        max_tar_readahead_mib, a file larger than that is read on its own.'''
+
+        def read_file(path):
+            with open(path, 'rb') as f:
+                return f.read()
+
+        max_bytes = self.readaheadMB * 1048576
+
+        # Opening and reading small files is mostly waiting for the file server (NFS)
+        workers = min(32, max(4, 4 * int(self.args.cores)))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = collections.deque()
+            inflight = 0
+            files = iter(files)
+            next_file = next(files, None)
+
+            try:
+                while pending or next_file is not None:
+
+                    # Read ahead as long as the files fit in the budget
+                    while next_file is not None and (not pending or inflight + next_file[1] <= max_bytes):
+                        path, size = next_file
+                        pending.append((path, size, executor.submit(read_file, path)))
+                        inflight += size
+                        next_file = next(files, None)
+
+                    path, size, future = pending.popleft()
+                    inflight -= size
+
+                    try:
+                        data, error = future.result(), None
+                    except Exception as e:
+                        data, error = None, e
+
+                    yield path, data, error
+            finally:
+                # The caller stopped early, do not read the rest
+                for _, _, future in pending:
+                    future.cancel()
+
+    @staticmethod
+    def _tarinfo_from_stat(tar_file, file_path, arcname, file_stat):
+        '''Build the tar header of a regular file or symlink from its lstat result
+
+        Same as tar_file.gettarinfo(file_path, arcname) without another lstat, with
+        the owner names from the process-wide caches.'''
+
+        tarinfo = tar_file.tarinfo(arcname)
+        tarinfo.tarfile = tar_file
+
+        mode = file_stat.st_mode
+        inode = (file_stat.st_ino, file_stat.st_dev)
+
+        if stat.S_ISREG(mode):
+            if file_stat.st_nlink > 1 and inode in tar_file.inodes:
+                # Hard link of a file already in the tar
+                tarinfo.type = tarfile.LNKTYPE
+                tarinfo.linkname = tar_file.inodes[inode]
+            else:
+                tarinfo.type = tarfile.REGTYPE
+                tarinfo.size = file_stat.st_size
+                if inode[0]:
+                    tar_file.inodes[inode] = arcname
+        elif stat.S_ISLNK(mode):
+            tarinfo.type = tarfile.SYMTYPE
+            tarinfo.linkname = os.readlink(file_path)
+        else:
+            raise ValueError(f'{file_path} is not a regular file or a symlink')
+
+        tarinfo.mode = mode
+        tarinfo.uid = file_stat.st_uid
+        tarinfo.gid = file_stat.st_gid
+        tarinfo.mtime = file_stat.st_mtime
+        tarinfo.uname = user_names.get(file_stat.st_uid) or ''
+        tarinfo.gname = group_names.get(file_stat.st_gid) or ''
+
+        return tarinfo
+
     def reset_folder(self, directory, recursive=False):
         '''Remove all froster artifacts from a folder and untar small files'''
 
@@ -4925,6 +7062,13 @@ class Archiver:
                 # Get the path to the tar file
                 tar_path = os.path.join(root, self.smallfiles_tar_filename)
 
+                # Resetting the folder would lose the small files once the archive is overwritten
+                if self._is_tar_only_in_s3(root):
+                    log(f'\nError: {self.smallfiles_tar_filename} of "{root}" is only in S3, ' +
+                        'restore the folder before resetting or archiving it again:')
+                    log(f'    froster restore "{root}"\n')
+                    return False
+
                 if os.path.exists(tar_path):
                     log(
                         '    Untarring Froster.smallfiles.tar... ', end='')
@@ -4950,6 +7094,33 @@ class Archiver:
             print_error()
             return False
 
+    def _is_tar_only_in_s3(self, directory):
+        '''Check if the small files of a folder are only in the tar in S3
+
+        This is the case if the md5sums list the small files tar, it is not in the
+        folder (streamed or deleted) and the files tarred are not in the folder
+        anymore (the archive was verified).'''
+
+        if os.path.exists(os.path.join(directory, self.smallfiles_tar_filename)):
+            return False
+
+        hashfile = os.path.join(directory, self.md5sum_filename)
+        if not os.path.isfile(hashfile):
+            return False
+
+        with open(hashfile, 'r') as f:
+            if not any(line.rstrip('\n').split('  ', 1)[-1] == self.smallfiles_tar_filename
+                       for line in f):
+                return False
+
+        allfiles_csv = os.path.join(directory, self.allfiles_csv_filename)
+        if not os.path.isfile(allfiles_csv):
+            return True
+
+        with open(allfiles_csv, 'r', newline='') as f:
+            return any(row['Tarred'] == 'Yes' and not os.path.lexists(os.path.join(directory, row['File']))
+                       for row in csv.DictReader(f))
+
     def _is_small_file_in_dir(self, dir, small=1024):
         # Get all files in the specified directory
         files = [os.path.join(dir, f) for f in os.listdir(
@@ -5022,6 +7193,16 @@ class Archiver:
             # Get the path to the S3 destination
             s3_dest = archived_folder_info['archive_folder'] + subfolder_path
 
+            # Files changed after they were archived must not be deleted
+            log(f'\n    Verifying local files...')
+            ret = self._verify_manifest(folder_to_delete)
+            if ret is None:
+                log('        ...no manifest, skipped')
+            elif ret:
+                log('        ...done')
+            else:
+                return
+
             log(f'\n    Verifying checksums...')
             rclone = Rclone(self.args, self.cfg)
             ret = rclone.checksum(hashfile, s3_dest, '--max-depth', '1')
@@ -5040,7 +7221,7 @@ class Archiver:
 
                 log(f'\n    Deleting files...')
                 for file in files:
-                    if file == self.md5sum_filename or file == self.md5sum_restored_filename or file == self.allfiles_csv_filename or file == self.where_did_the_files_go_filename:
+                    if file == self.md5sum_filename or file == self.md5sum_restored_filename or file == self.manifest_filename or file == self.allfiles_csv_filename or file == self.where_did_the_files_go_filename:
                         continue
                     else:
                         file_path = os.path.join(root, file)
@@ -5323,7 +7504,9 @@ class Archiver:
                     log(f'\nUntarring Froster.smallfiles.tar... ')
                     with tarfile.open(tar_path, "r") as tar:
                         tar.extractall(path=target)
+                        untarred = [m.name for m in tar.getmembers() if m.isreg()]
                     os.remove(tar_path)
+                    self._manifest_untar(target, untarred)
                     log('    ...done\n')
 
                 where_did_file_go_full_path = os.path.join(
@@ -5337,37 +7520,8 @@ class Archiver:
             print_error()
 
 
-    def parallel_md5sum(self, file_path, chunk_size=100*1024*1024, executor=None):
-
-        file_size = os.path.getsize(file_path)
-        if file_size <= chunk_size:
-            return self.md5sum(file_path)
-
-        chunk_count = (file_size + chunk_size - 1) // chunk_size
-        
-        md5_hash = hashlib.md5()
-        
-        chunk_read = functools.partial(self.chunk_reader, file_path, chunk_size)
-        
-        with tqdm.tqdm(total=file_size, unit='B', disable=self.output_disable, unit_scale=True, desc="    " + 
-                                os.path.basename(file_path), leave=False) as pbar:
-            for chunk in executor.map(chunk_read, range(chunk_count)):
-                md5_hash.update(chunk)  # Directly update with the chunk data
-                pbar.update(len(chunk))
-        
-        return md5_hash.hexdigest()
-
-    def chunk_reader(self, file_path, chunk_size, offset):
-        with open(file_path, "rb") as f:
-            f.seek(offset * chunk_size)  # Fix the offset to correctly seek the position
-            chunk = f.read(chunk_size)
-        return chunk
-
-    def md5sum_chunk(self, chunk):
-        return hashlib.md5(chunk).digest()
-
     def md5sum(self, file_path):
-        '''Calculate md5sum of a file - use parallel_md5sum instead'''
+        '''Calculate md5sum of a file - use HashEngine for many or large files'''
 
         md5_hash = hashlib.md5()
         with open(file_path, "rb") as f:
@@ -5376,78 +7530,295 @@ class Archiver:
         return md5_hash.hexdigest()
     
     def _gen_md5sums(self, directory, hash_file):
-        '''Generate md5sums for all files in the directory and write them to a hash file'''
+        '''Generate md5sums for all files in the directory and write them to a hash file
+
+        The manifest with the fast hash of each file is written in the same pass.
+        The sizes come from a single scandir pass, at most a window of files is
+        hashed at once and the lines are written in batches.'''
 
         try:
-            for root, dirs, files in self._walker(directory):
+            # Build the path to the hash file
+            hashpath = os.path.join(directory, hash_file)
 
-                # We only want to generate the hash file in the root directory. Avoid recursion
-                if root != directory:
-                    break
+            # Set the number of workers
+            max_workers = max(4, int(self.args.cores))
 
-                # Build the path to the hash file
-                hashpath = os.path.join(root, hash_file)
+            # Files hashed at once, enough to keep all workers busy
+            window = max_workers * 256
 
-                # Set the number of workers
-                max_workers = max(4, int(self.args.cores))
+            # Lines written at once
+            batch_size = 10000
 
-                with open(hashpath, "w") as out_f:
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # MD5 for rclone and the fast hash for the local checks
+            algorithms = ('md5',) + ((self.fast_hash,) if self.fast_hash else ())
 
-                        tasks = {}
+            # Skip froster files
+            skipped = (hash_file, self.where_did_the_files_go_filename, self.md5sum_filename,
+                       self.md5sum_restored_filename, self.manifest_filename)
 
-                        for file in files:
+            # One lstat per file from the listing, symlinks are followed
+            _, entries = FileSystemScanner(
+                one_file_system=False, skipdirs=[]).list_folder(directory)
 
-                            # Get the file path
-                            file_path = os.path.join(root, file)
+            files = []
+            for file_path, file_stat in entries:
+                if os.path.basename(file_path) in skipped:
+                    continue
+                if stat.S_ISLNK(file_stat.st_mode):
+                    try:
+                        file_stat = os.stat(file_path)
+                    except FileNotFoundError:
+                        continue
+                if stat.S_ISREG(file_stat.st_mode):
+                    files.append((file_path, file_stat))
+
+            # Files that did not change since they were hashed are not read again
+            cache = self._checksum_cache()
+            unchanged = 0
+
+            lines = []
+            rows = []
+
+            def add(file_path, file_stat, checksums):
+                '''Add the lines of a hashed file, writing them once there is a batch'''
+
+                file = os.path.basename(file_path)
+                lines.append(f"{checksums['md5']}  {file}\n")
+                rows.append(self._manifest_row(file, file_stat, checksums))
+
+                if len(lines) >= batch_size:
+                    out_f.writelines(lines)
+                    manifest_writer.writerows(rows)
+                    lines.clear()
+                    rows.clear()
+
+            with open(hashpath, "w") as out_f, \
+                    open(os.path.join(directory, self.manifest_filename), 'w', newline='') as manifest_f, \
+                    HashEngine(workers=max_workers, large_workers=max(2, max_workers // 4),
+                               max_inflight=self.hashinflightMB * 1048576) as engine, \
+                    tqdm.tqdm(total=sum(file_stat.st_size for _, file_stat in files), unit='B',
+                              disable=self.output_disable, unit_scale=True, desc="    Overall Progress") as overall_pbar:
+
+                manifest_writer = csv.writer(manifest_f)
+                manifest_writer.writerow(self._manifest_header())
+
+                tasks = {}
+
+                def complete(futures):
+                    '''Add the lines of the hashed files'''
+
+                    for future in futures:
+                        file_path, file_stat, checksums = tasks.pop(future)
+                        computed = future.result()
+                        checksums.update(computed)
+                        add(file_path, file_stat, checksums)
+                        overall_pbar.update(file_stat.st_size)
+
+                        # Only cache the checksums if the file did not change while it was read
+                        if cache and self._same_file_stat(file_stat, os.stat(file_path)):
+                            for algorithm, checksum in computed.items():
+                                cache.put(file_stat, checksum, algorithm)
+
+                for file_path, file_stat in files:
+
+                    checksums = {a: cache.get(file_stat, a)
+                                 for a in algorithms} if cache else {}
+                    missing = tuple(a for a in algorithms if not checksums.get(a))
+                    if not missing:
+                        unchanged += 1
+                        add(file_path, file_stat, checksums)
+                        overall_pbar.update(file_stat.st_size)
+                        continue
 
-                            # Skip froster files
-                            if os.path.isfile(file_path) and \
-                                    file != hash_file and \
-                                    file != self.where_did_the_files_go_filename and \
-                                    file != self.md5sum_filename and \
-                                    file != self.md5sum_restored_filename:
+                    # Wait for some files to be hashed before more are submitted
+                    if len(tasks) >= window:
+                        done, _ = concurrent.futures.wait(
+                            tasks, return_when=concurrent.futures.FIRST_COMPLETED)
+                        complete(done)
 
-                                task = executor.submit(self.parallel_md5sum, file_path, executor=executor)
+                    task = engine.submit(file_path, file_stat.st_size, algorithms=missing)
+                    tasks[task] = (file_path, file_stat, checksums)
 
-                                tasks[task] = file_path
+                complete(concurrent.futures.as_completed(list(tasks)))
 
-                        total_size = sum(os.path.getsize(tasks[task]) for task in tasks)
-                        with tqdm.tqdm(total=total_size, unit='B', disable=self.output_disable, unit_scale=True, desc="    Overall Progress") as overall_pbar:
-                            for future in concurrent.futures.as_completed(tasks):
-                                file = os.path.basename(tasks[future])
-                                md5 = future.result()
-                                out_f.write(f"{md5}  {file}\n")
-                                overall_pbar.update(os.path.getsize(tasks[future]))
+                out_f.writelines(lines)
+                manifest_writer.writerows(rows)
 
-                # Check we generated the hash file
-                if os.path.getsize(hashpath) == 0:
-                    os.remove(hashpath)
-                    return False
-                else:
-                    return True
+            if cache:
+                if unchanged:
+                    log(f'        {unchanged} unchanged files were not hashed again')
+                cache.close()
+
+            # Check we generated the hash file
+            if os.path.getsize(hashpath) == 0:
+                os.remove(hashpath)
+                os.remove(os.path.join(directory, self.manifest_filename))
+                return False
+
+            return True
 
         except Exception:
             print_error()
             return False
 
-    def uid2user(self, uid):
-        '''Convert uid to username'''
+    def _manifest_header(self):
+        '''Get the header of the manifest
+
+        The manifest is a CSV file with the name, size, modification time (ns), MD5
+        and fast hash of each file. The column of the fast hash is named after its
+        algorithm, it is empty if no fast hash is used.'''
+
+        return ['file', 'size', 'mtime_ns', 'md5', self.fast_hash or '']
+
+    def _manifest_row(self, file, file_stat, checksums):
+        '''Get the manifest row of a file from its stat and checksums by algorithm'''
+
+        return (file, file_stat.st_size, file_stat.st_mtime_ns, checksums['md5'],
+                checksums.get(self.fast_hash, '') if self.fast_hash else '')
+
+    def _manifest_untar(self, directory, files):
+        '''Replace the small files tar by the files extracted from it in the manifest of a directory'''
+
+        manifest_path = os.path.join(directory, self.manifest_filename)
+        if not os.path.isfile(manifest_path):
+            return
+
+        with open(manifest_path, 'r', newline='') as f:
+            rows = [row for row in csv.reader(f)
+                    if row and row[0] != self.smallfiles_tar_filename]
+
+        # The manifest was written by this restore with the same fast hash
+        algorithms = ('md5',) + ((self.fast_hash,) if self.fast_hash else ())
+
+        with HashEngine() as engine:
+            tasks = {engine.submit(os.path.join(directory, file), algorithms=algorithms): file
+                     for file in files}
+            for future in concurrent.futures.as_completed(tasks):
+                file = tasks[future]
+                rows.append(self._manifest_row(
+                    file, os.stat(os.path.join(directory, file)), future.result()))
+
+        with open(manifest_path, 'w', newline='') as f:
+            csv.writer(f).writerows(rows)
+
+    def _verify_manifest(self, directory):
+        '''Check that the files of a directory did not change since their manifest was written
+
+        The files are read again with the fast hash of the manifest, MD5 is used if
+        there is none or if its module is not installed here. Unchanged files of the
+        checksum cache are not read. Files that are not in the manifest (except the
+        froster files) count as changed. Returns True if all files match, None if
+        there is no manifest.'''
+
+        manifest_path = os.path.join(directory, self.manifest_filename)
+        if not os.path.isfile(manifest_path):
+            return None
 
         try:
-            return pwd.getpwuid(uid)[0]
+            with open(manifest_path, 'r', newline='') as f:
+                reader = csv.reader(f)
+                header = next(reader)
+                rows = list(reader)
+
+            algorithm = header[4] if len(header) > 4 else ''
+            column = 4
+            if not algorithm or new_hash(algorithm) is None:
+                algorithm, column = 'md5', 3
+
+            cache = self._checksum_cache()
+
+            changed = []
+            tasks = {}
+
+            max_workers = max(4, int(self.args.cores))
+
+            # Files added after the archive are neither in the manifest nor in S3
+            listed = {row[0] for row in rows}
+            _, entries = FileSystemScanner(
+                one_file_system=False, skipdirs=[]).list_folder(directory)
+            for file_path, _ in entries:
+                file = os.path.basename(file_path)
+                if file not in listed and file not in self.dirmetafiles and os.path.isfile(file_path):
+                    changed.append(file)
+
+            with HashEngine(workers=max_workers, large_workers=max(2, max_workers // 4),
+                            max_inflight=self.hashinflightMB * 1048576) as engine:
+
+                for row in rows:
+                    file = row[0]
+                    try:
+                        file_stat = os.stat(os.path.join(directory, file))
+                    except FileNotFoundError:
+                        changed.append(file)
+                        continue
+
+                    if file_stat.st_size != int(row[1]):
+                        changed.append(file)
+                        continue
+
+                    checksum = cache.get(file_stat, algorithm) if cache else None
+                    if checksum:
+                        if checksum != row[column]:
+                            changed.append(file)
+                        continue
+
+                    tasks[engine.submit(os.path.join(directory, file), file_stat.st_size,
+                                        algorithms=(algorithm,))] = (file, file_stat, row[column])
+
+                for future in concurrent.futures.as_completed(tasks):
+                    file, file_stat, expected = tasks[future]
+                    checksum = future.result()[algorithm]
+                    if checksum != expected:
+                        changed.append(file)
+                    elif cache and self._same_file_stat(file_stat, os.stat(os.path.join(directory, file))):
+                        cache.put(file_stat, checksum, algorithm)
+
+            if cache:
+                cache.close()
+
+            if changed:
+                log(f'\nError: {len(changed)} files changed or were added since they were archived, for example:')
+                for file in sorted(changed)[:10]:
+                    log(f'    {file}')
+                return False
+
+            return True
+
         except Exception:
             print_error()
-            return uid
+            return False
+
+    def _checksum_cache(self):
+        '''Open the checksum cache, None if it cannot be used'''
+
+        if getattr(self.args, 'nochecksumcache', False):
+            return None
+
+        try:
+            return ChecksumCache(self.cfg.checksum_cache_file,
+                                 int(self.cfg.max_checksum_cache_entries or 10000000))
+        except Exception as e:
+            # Not fatal, all the files are hashed
+            printdbg(f'Cannot open the checksum cache {self.cfg.checksum_cache_file}: {e}')
+            return None
+
+    def _same_file_stat(self, stat1, stat2):
+        '''Check if two stat results are of the same unchanged file'''
+
+        return (stat1.st_dev, stat1.st_ino, stat1.st_size, stat1.st_mtime_ns, stat1.st_ctime_ns) == \
+            (stat2.st_dev, stat2.st_ino, stat2.st_size, stat2.st_mtime_ns, stat2.st_ctime_ns)
+
+    def uid2user(self, uid):
+        '''Convert uid to username'''
+
+        name = user_names.get(uid)
+        return name if name is not None else uid
 
     def gid2group(self, gid):
         '''Convert gid to group name'''
 
-        try:
-            return grp.getgrgid(gid)[0]
-        except Exception:
-            print_error()
-            return gid
+        name = group_names.get(gid)
+        return name if name is not None else gid
 
     def daysago(self, unixtime):
         '''Calculate the number of days ago from a given unixtime'''
@@ -5638,21 +8009,14 @@ class Archiver:
         except Exception:
             print_error()
 
-    def _walker(self, top, skipdirs=['.snapshot',]):
-        """ returns subset of os.walk  """
+    def _walker(self, top, skipdirs=None):
+        """ returns subset of os.walk, skipdirs are skipped (.snapshot by default) """
         try:
-            for root, dirs, files in os.walk(top, topdown=True, followlinks=False, onerror=self._walkerr):
-                for skipdir in skipdirs:
-                    if skipdir in dirs:
-                        dirs.remove(skipdir)  # don't visit this directory
-
-                # Move directory symlinks from dirs to files as symlinks are really files
-                symlink_dirs = [d for d in dirs if os.path.islink(os.path.join(root, d))]
-                files.extend(symlink_dirs)
-                # Remove symlinked directories from dirs list
-                for d in symlink_dirs:
-                    dirs.remove(d)
+            # Parallel os.walk, directory symlinks are in files as symlinks are really files
+            fs_scanner = FileSystemScanner(
+                one_file_system=False, skipdirs=skipdirs)
 
+            for root, dirs, files in fs_scanner.walk(top, onerror=self._walkerr):
                 yield root, dirs, files
         except Exception:
             print_error()
@@ -5663,72 +8027,41 @@ class Archiver:
         sys.stderr.write('\n')
         return 0        
 
-    def _get_newest_file_atime(self, folder_path, folder_atime=None):
-        '''Get the atime of the newest file in the folder'''
-
+    def get_hotspots_path(self, folder):
+        ''' Get a full path name of a new hotspots file'''
         try:
-            if not folder_path or not os.path.exists(folder_path):
-                log(f" Invalid folder path: {folder_path}")
-                return folder_atime
-
-            last_accessed_time = None
-
-            subobjects = os.listdir(folder_path)
-
-            for file_name in subobjects:
-                if file_name in self.dirmetafiles:
-                    continue
-                file_path = os.path.join(folder_path, file_name)
-                if os.path.isfile(file_path):
-                    accessed_time = os.path.getatime(file_path)
-                    if last_accessed_time is None or accessed_time > last_accessed_time:
-                        last_accessed_time = accessed_time
-            if last_accessed_time == None:
-                last_accessed_time = folder_atime
-            return last_accessed_time
+            # create hotspots directory if it does not exist
+            os.makedirs(self.cfg.hotspots_dir, exist_ok=True, mode=0o775)
 
-        except Exception as e:
+            # Get the full path name of the new hotspots file
+            return os.path.join(self.cfg.hotspots_dir, self._get_hotspots_filename(folder))
+        except Exception:
             print_error()
-            return folder_atime
-
-    def _get_newest_file_mtime(self, folder_path, folder_mtime=None):
-        '''Get the mtime of the newest file in the folder'''
+            return None
 
+    def get_index_store_path(self, folder):
+        ''' Get the full path name of the index store (the Parquet scan) of a folder'''
         try:
-            if not folder_path or not os.path.exists(folder_path):
-                log(f" Invalid folder path: {folder_path}")
-                return folder_mtime
-
-            last_modified_time = None
-
-            subobjects = os.listdir(folder_path)
+            hotspots_path = self.get_hotspots_path(folder)
 
-            for file_name in subobjects:
-                if file_name in self.dirmetafiles:
-                    continue
-                file_path = os.path.join(folder_path, file_name)
-                if os.path.isfile(file_path):
-                    modified_time = os.path.getmtime(file_path)
-                    if last_modified_time is None or modified_time > last_modified_time:
-                        last_modified_time = modified_time
-
-            if last_modified_time == None:
-                last_modified_time = folder_mtime
+            # Stored next to the hotspots file with the same name
+            return os.path.splitext(hotspots_path)[0] + '.parquet'
+        except Exception:
+            print_error()
+            return None
 
-            return last_modified_time
+    def _index_refreshed_marker(self, hotspots_path):
+        ''' Get the path of the file marking the index of a hotspots file as refreshed'''
 
-        except Exception as e:
-            print_error()
-            return folder_mtime
+        return os.path.splitext(hotspots_path)[0] + '.refreshed'
 
-    def get_hotspots_path(self, folder):
-        ''' Get a full path name of a new hotspots file'''
+    def get_index_stats_path(self, folder):
+        ''' Get the full path name of the stats file of the last index run of a folder'''
         try:
-            # create hotspots directory if it does not exist
-            os.makedirs(self.cfg.hotspots_dir, exist_ok=True, mode=0o775)
+            hotspots_path = self.get_hotspots_path(folder)
 
-            # Get the full path name of the new hotspots file
-            return os.path.join(self.cfg.hotspots_dir, self._get_hotspots_filename(folder))
+            # Stored next to the hotspots file with the same name
+            return os.path.splitext(hotspots_path)[0] + '.stats.json'
         except Exception:
             print_error()
             return None
@@ -5856,44 +8189,280 @@ class ScreenConfirm(ModalScreen[bool]):
         self.dismiss(result=event.button.id)
 
 
-class TableHotspots(App[list]):
+class LazyTableSource:
+    ''' Rows of a table kept in DuckDB and fetched one page at a time
 
-    BINDINGS = [("q", "request_quit", "Quit")]
+    Sorting and filtering run in DuckDB, only the rows shown on screen are
+    converted to Python, so tables of any size open instantly.'''
+
+    OPERATORS = ('>=', '<=', '!=', '=', '>', '<')
+
+    def __init__(self, csv_file=None, csv_string=None):
+        ''' Load the rows of a CSV file or of a CSV string (first line is the header)'''
+
+        self.connection = duckdb.connect(':memory:')
+
+        if csv_file is not None:
+            # Numeric columns (sizes, ages) are detected and sorted as numbers
+            self.connection.execute(f"""CREATE TABLE rows AS
+                                        SELECT * FROM read_csv({self._quote_string(csv_file)}, header=true)""")
+        elif csv_string and csv_string.strip():
+            # DuckDB reads the string from a temporary file, all columns are kept as text
+            # and short rows are padded
+            with tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', encoding='utf-8') as tmp:
+                tmp.write(csv_string)
+                tmp.flush()
+                self.connection.execute(f"""CREATE TABLE rows AS
+                                            SELECT * FROM read_csv({self._quote_string(tmp.name)}, header=true,
+                                                  delim=',', quote='"', escape='"',
+                                                  all_varchar=true, null_padding=true)""")
+
+        self.columns = []
+        self.numeric = set()
+        for name, data_type in self.connection.execute(
+                "SELECT column_name, data_type FROM duckdb_columns() WHERE table_name = 'rows'").fetchall():
+            self.columns.append(name)
+            if data_type in ('TINYINT', 'SMALLINT', 'INTEGER', 'BIGINT', 'HUGEINT',
+                             'UTINYINT', 'USMALLINT', 'UINTEGER', 'UBIGINT',
+                             'FLOAT', 'DOUBLE') or data_type.startswith('DECIMAL'):
+                self.numeric.add(name)
+
+        self.sort_column = None
+        self.descending = False
+
+        self.filter_text = ''
+        self.where = ''
+        self.params = []
+
+        self.count = self.total = self._count()
+
+    def _quote(self, name):
+        ''' Quote a column name'''
+        return '"' + str(name).replace('"', '""') + '"'
+
+    def _quote_string(self, value):
+        ''' Quote a string as a SQL literal'''
+        return "'" + str(value).replace("'", "''") + "'"
+
+    def _count(self):
+        ''' Count the rows matching the filter'''
+
+        if not self.columns:
+            return 0
+
+        return self.connection.execute(
+            f'SELECT count(*) FROM rows {self.where}', self.params).fetchone()[0]
+
+    def sort(self, column):
+        ''' Sort by the given column, sorting by it again reverses the order'''
+
+        if column == self.sort_column:
+            self.descending = not self.descending
+        else:
+            self.sort_column = column
+            # Largest and oldest first
+            self.descending = column in self.numeric
+
+    def filter(self, text):
+        ''' Filter the rows with terms separated by spaces
+
+        A term Column<op>Value compares a column, for example GiB>=100, AccD>365 or
+        User=alice (operators: >= <= != = > <). Any other term matches the text of
+        all columns.'''
+
+        try:
+            terms = shlex.split(text)
+        except ValueError:
+            terms = text.split()
 
-    def __init__(self, file): # Modified: Accept file path
+        columns = {c.lower(): c for c in self.columns}
+        pattern = '^(\\w+)(' + '|'.join(re.escape(o) for o in self.OPERATORS) + ')(.*)$'
+
+        clauses = []
+        params = []
+
+        for term in terms:
+            match = re.match(pattern, term)
+
+            if match and match.group(1).lower() in columns:
+                column = columns[match.group(1).lower()]
+                operator = match.group(2)
+                value = match.group(3)
+
+                if column in self.numeric:
+                    try:
+                        params.append(float(value))
+                        clauses.append(f'{self._quote(column)} {operator} ?')
+                        continue
+                    except ValueError:
+                        pass
+
+                clauses.append(
+                    f'lower(CAST({self._quote(column)} AS VARCHAR)) {operator} lower(?)')
+                params.append(value)
+            else:
+                clauses.append('(' + ' OR '.join(
+                    [f'CAST({self._quote(c)} AS VARCHAR) ILIKE ?' for c in self.columns]) + ')')
+                params.extend([f'%{term}%'] * len(self.columns))
+
+        self.filter_text = text
+        self.where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        self.params = params
+
+        self.count = self._count()
+
+    def fetch(self, offset, limit):
+        ''' Get a page of rows as lists of strings'''
+
+        if not self.columns:
+            return []
+
+        if self.sort_column:
+            order = f"{self._quote(self.sort_column)} {'DESC' if self.descending else 'ASC'} NULLS LAST, rowid"
+        else:
+            # Order of the file
+            order = 'rowid'
+
+        rows = self.connection.execute(f'''SELECT {', '.join(self._quote(c) for c in self.columns)}
+                                           FROM rows {self.where}
+                                           ORDER BY {order}
+                                           LIMIT {int(limit)} OFFSET {int(offset)}''', self.params).fetchall()
+
+        return [['' if v is None else str(v) for v in row] for row in rows]
+
+    def status(self, loaded):
+        ''' Describe the rows shown, the sort order and the filter'''
+
+        status = f'{self.count} of {self.total} rows'
+        if loaded < self.count:
+            status += f' ({loaded} loaded)'
+        if self.sort_column:
+            status += f", sorted by {self.sort_column} {'descending' if self.descending else 'ascending'}"
+        if self.filter_text:
+            status += f', filter: {self.filter_text}'
+
+        return status + '  -  click a column to sort, "/" to filter'
+
+
+class LazyTableApp(App[list]):
+    ''' Table that pages its rows in from a LazyTableSource as the user scrolls'''
+
+    BINDINGS = [("q", "request_quit", "Quit"),
+                ("/", "focus_filter", "Filter")]
+
+    # Rows fetched at once
+    PAGE_SIZE = 200
+
+    def __init__(self):
         super().__init__()
-        self.myrow = []
-        self.file = file # Added: Store file path
+        self.source = None
+        self.loaded = 0
 
     def compose(self) -> ComposeResult:
-        table = DataTable()
-        table.focus()
-        table.zebra_stripes = True
-        table.cursor_type = "row"
-        table.styles.max_height = "99vh"
-        yield table
-        # yield Footer()
+        with Vertical():
+            filter_input = Input(
+                placeholder='Filter, e.g. GiB>=100 AccD>365 User=alice or any text, Enter to apply, Esc to return')
+            filter_input.display = False
+            yield filter_input
+            table = DataTable()
+            table.focus()
+            table.zebra_stripes = True
+            table.cursor_type = "row"
+            table.styles.max_height = "95vh"
+            yield table
+            yield Label('', id='status')
 
-    def on_mount(self) -> None:
+    def load_source(self, source):
+        ''' Show the columns and the first page of the source'''
+
+        self.source = source
+        table = self.query_one(DataTable)
+        table.add_columns(*source.columns)
+        self.watch(table, 'scroll_y', self._on_table_scroll, init=False)
+        self.reload()
+
+    def reload(self):
+        ''' Show the first page again after a sort or filter change'''
+
+        table = self.query_one(DataTable)
+        table.clear()
+        self.loaded = 0
+        self.load_more()
+
+    def load_more(self):
+        ''' Append the next page of rows'''
+
+        if self.source is None or self.loaded >= self.source.count:
+            return
+
+        rows = self.source.fetch(self.loaded, self.PAGE_SIZE)
+        if rows:
+            self.query_one(DataTable).add_rows(rows)
+            self.loaded += len(rows)
+
+        self.query_one('#status', Label).update(
+            self.source.status(self.loaded))
+
+    def _on_table_scroll(self, scroll_y) -> None:
         table = self.query_one(DataTable)
+        # Less than a screen left below the view
+        if scroll_y >= table.max_scroll_y - table.size.height:
+            self.load_more()
+
+    def on_data_table_row_highlighted(self, event: DataTable.RowHighlighted) -> None:
+        if event.cursor_row >= self.loaded - 20:
+            self.load_more()
+
+    def on_data_table_header_selected(self, event: DataTable.HeaderSelected) -> None:
+        self.source.sort(self.source.columns[event.column_index])
+        self.reload()
+
+    def on_input_submitted(self, event: Input.Submitted) -> None:
+        self.source.filter(event.value)
+        self.reload()
+        event.input.display = False
+        self.query_one(DataTable).focus()
+
+    def on_key(self, event) -> None:
+        filter_input = self.query_one(Input)
+        if event.key == 'escape' and filter_input.has_focus:
+            filter_input.display = False
+            self.query_one(DataTable).focus()
+
+    def action_focus_filter(self) -> None:
+        filter_input = self.query_one(Input)
+        filter_input.display = True
+        filter_input.focus()
+
+    def action_request_quit(self) -> None:
+        self.app.exit()
+
+
+class TableHotspots(LazyTableApp):
+
+    def __init__(self, file, filter_text=''): # Modified: Accept file path
+        super().__init__()
+        self.myrow = []
+        self.file = file # Added: Store file path
+        self.filter_text = filter_text
+
+    def on_mount(self) -> None:
         try: # Added try-except block
-            with open(self.file, 'r', newline='') as fh: # Modified: Use self.file, add newline=''
-                rows = csv.reader(fh)
-                header = next(rows, None)
-                if header:
-                    table.add_columns(*header)
-                    # Read remaining rows, limiting to MAXHOTSPOTS
-                    data_rows = list(itertools.islice(rows, MAXHOTSPOTS))
-                    if data_rows:
-                         table.add_rows(data_rows)
-                    else:
-                         # Handle case where file only has a header
-                         log(f"Warning: Hotspot file contains no data rows: {self.file}")
-                         # Optionally add a message to the table or just leave it empty
-                else:
-                    log(f"Warning: Hotspot file is empty or has no header: {self.file}")
-                    self.exit([]) # Exit if file is empty or has no header
-        except FileNotFoundError:
+            # Rows are paged in from DuckDB as the user scrolls, there is no row limit
+            source = LazyTableSource(csv_file=self.file)
+            if not source.columns:
+                log(f"Warning: Hotspot file is empty or has no header: {self.file}")
+                self.exit([]) # Exit if file is empty or has no header
+                return
+            if not source.total:
+                # Handle case where file only has a header
+                log(f"Warning: Hotspot file contains no data rows: {self.file}")
+            if self.filter_text:
+                # Initial filter, it can be changed with "/"
+                source.filter(self.filter_text)
+                self.query_one(Input).value = self.filter_text
+            self.load_source(source)
+        except duckdb.IOException:
             log(f"Error: Hotspot file not found: {self.file}", file=sys.stderr)
             self.exit([]) # Exit if file not found
         except Exception as e:
@@ -5951,36 +8520,23 @@ class TextualStringListSelector(App[list]):
         self.app.exit()
 
 
-class TableArchive(App[list]):
-
-    BINDINGS = [("q", "request_quit", "Quit")]
+class TableArchive(LazyTableApp):
 
     def __init__(self, files):
         super().__init__()
         self.files = files
 
     def compose(self) -> ComposeResult:
-        table = DataTable()
-        table.focus()
-        table.zebra_stripes = True
-        table.cursor_type = "row"
-        table.styles.max_height = "99vh"
-        # table.fixed_rows = 1
-        yield table
+        yield from super().compose()
         yield Footer()
 
     def on_mount(self) -> None:
-        table = self.query_one(DataTable)
-        rows = csv.reader(io.StringIO(self.files))
-        table.add_columns(*next(rows))
-        table.add_rows(itertools.islice(rows, MAXHOTSPOTS))
+        # Rows are paged in from DuckDB as the user scrolls, there is no row limit
+        self.load_source(LazyTableSource(csv_string=self.files))
 
     def on_data_table_row_selected(self, event: DataTable.RowSelected) -> None:
         self.exit(self.query_one(DataTable).get_row(event.row_key))
 
-    def action_request_quit(self) -> None:
-        self.app.exit()
-
 
 class TableNIHGrants(App[list]):
 
@@ -6282,6 +8838,209 @@ class TableStorageTierSelector(App[str]):
         self.exit(None)
 
 
+class S3MultipartUpload:
+    ''' Write-only file object that uploads what is written to an S3 object
+
+    The data is sent as a multipart upload while it is written, at most
+    max_inflight parts at a time from background threads, so the memory use is
+    bounded. Each part is sent with its Content-MD5 and its ETag is checked, the
+    MD5 of the whole object is computed on the fly. Once complete, the object is
+    copied in place to its storage class with the MD5 in the md5chksum metadata
+    that rclone uses, so rclone verifies it like any file it uploaded. An object
+    smaller than a part is sent with a single request, without copy.'''
+
+    def __init__(self, s3_client, bucket, key, storage_class=None, part_size=64*1048576, max_inflight=4,
+                 metadata=None):
+        ''' Initialize the upload of the object key to bucket with the given user metadata'''
+
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.storage_class = storage_class
+        self.metadata = dict(metadata or {})
+        self.part_size = part_size
+        self.max_inflight = max_inflight
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_inflight)
+        self.pending = collections.deque()
+        self.parts = []
+
+        self.upload_id = None
+        self.is_completed = False
+        self.is_aborted = False
+        self.closed = False
+
+        self.buffer = bytearray()
+        self.part_number = 0
+        self.size = 0
+        self.md5_hash = hashlib.md5()
+
+        # MD5 (hex) of the object once the upload is complete
+        self.md5 = None
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        ''' Add data to the object, full parts are uploaded in the background'''
+
+        self.buffer += data
+        self.md5_hash.update(data)
+        self.size += len(data)
+
+        while len(self.buffer) >= self.part_size:
+            part = bytes(self.buffer[:self.part_size])
+            del self.buffer[:self.part_size]
+            self._submit(part)
+
+        return len(data)
+
+    def _submit(self, part):
+        ''' Upload a part in the background, waiting for the oldest one if too many are in flight'''
+
+        if self.upload_id is None:
+            self.upload_id = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key)['UploadId']
+
+        self.part_number += 1
+        self.pending.append(self.executor.submit(
+            self._upload_part, self.part_number, part))
+
+        # S3 allows 10000 parts, larger parts keep huge objects below that
+        if self.part_number % 1000 == 0:
+            self.part_size *= 2
+
+        if len(self.pending) >= self.max_inflight:
+            self.parts.append(self.pending.popleft().result())
+
+    def _upload_part(self, part_number, part):
+        ''' Upload a part, returns its entry for the completion and its MD5 digest'''
+
+        digest = hashlib.md5(part).digest()
+
+        response = self.s3_client.upload_part(Bucket=self.bucket, Key=self.key,
+                                              UploadId=self.upload_id, PartNumber=part_number,
+                                              Body=part, ContentMD5=base64.b64encode(digest).decode())
+
+        # The ETag of an encrypted part (SSE-KMS) is not its MD5, S3 checked the Content-MD5 anyway
+        etag = response['ETag'].strip('"')
+        if re.fullmatch('[0-9a-f]{32}', etag) and etag != digest.hex():
+            raise ValueError(
+                f'ETag of part {part_number} of {self.key} does not match its MD5')
+
+        return {'PartNumber': part_number, 'ETag': response['ETag']}, digest
+
+    def close(self):
+        ''' Upload the last part, complete the upload and verify the object'''
+
+        if self.closed:
+            return
+
+        self.closed = True
+
+        try:
+            if self.upload_id is None:
+                self._put()
+                return
+
+            if self.buffer:
+                self._submit(bytes(self.buffer))
+                self.buffer.clear()
+
+            while self.pending:
+                self.parts.append(self.pending.popleft().result())
+
+            response = self.s3_client.complete_multipart_upload(Bucket=self.bucket, Key=self.key,
+                                                                UploadId=self.upload_id,
+                                                                MultipartUpload={'Parts': [part for part, _ in self.parts]})
+            self.is_completed = True
+
+            # The ETag of a multipart object is the MD5 of the part digests and the number of parts
+            etag = response['ETag'].strip('"')
+            expected = hashlib.md5(
+                b''.join(digest for _, digest in self.parts)).hexdigest() + f'-{len(self.parts)}'
+            if re.fullmatch('[0-9a-f]{32}-[0-9]+', etag) and etag != expected:
+                raise ValueError(
+                    f'ETag of {self.key} does not match the uploaded parts')
+
+            self.md5 = self.md5_hash.hexdigest()
+
+            # Add the MD5 for rclone and move the object to its storage class
+            extra_args = {'Metadata': self._metadata(),
+                          'MetadataDirective': 'REPLACE'}
+            if self.storage_class:
+                extra_args['StorageClass'] = self.storage_class
+            self.s3_client.copy({'Bucket': self.bucket, 'Key': self.key},
+                                self.bucket, self.key, ExtraArgs=extra_args)
+
+            header = self.s3_client.head_object(
+                Bucket=self.bucket, Key=self.key)
+            if header['ContentLength'] != self.size:
+                raise ValueError(
+                    f'Size of {self.key} is {header["ContentLength"]} instead of {self.size} bytes')
+
+            self.executor.shutdown()
+
+        except Exception:
+            self.abort()
+            raise
+
+    def _metadata(self):
+        ''' User metadata of the object with its MD5 for rclone'''
+
+        return {**self.metadata, 'md5chksum': base64.b64encode(self.md5_hash.digest()).decode()}
+
+    def _put(self):
+        ''' Upload an object smaller than a part with a single request'''
+
+        data = bytes(self.buffer)
+        self.buffer.clear()
+
+        digest = self.md5_hash.digest()
+
+        put_args = {'Bucket': self.bucket, 'Key': self.key, 'Body': data,
+                    'ContentMD5': base64.b64encode(digest).decode(),
+                    'Metadata': self._metadata()}
+        if self.storage_class:
+            put_args['StorageClass'] = self.storage_class
+
+        response = self.s3_client.put_object(**put_args)
+        self.is_completed = True
+
+        etag = response['ETag'].strip('"')
+        if re.fullmatch('[0-9a-f]{32}', etag) and etag != digest.hex():
+            raise ValueError(f'ETag of {self.key} does not match its MD5')
+
+        self.md5 = digest.hex()
+
+        self.executor.shutdown()
+
+    def abort(self):
+        ''' Stop the upload and remove what was uploaded'''
+
+        if self.is_aborted:
+            return
+
+        self.is_aborted = True
+        self.closed = True
+
+        # Parts being uploaded must be finished before the upload is aborted
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.pending.clear()
+
+        try:
+            if self.is_completed:
+                self.s3_client.delete_object(Bucket=self.bucket, Key=self.key)
+            elif self.upload_id is not None:
+                self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key,
+                                                      UploadId=self.upload_id)
+        except Exception:
+            printdbg(f'Cannot remove the failed upload of {self.key}')
+
+        self.md5 = None
+
+
 class Rclone:
     def __init__(self, args: argparse.Namespace, cfg: ConfigManager):
         '''Initialize Rclone object'''
@@ -7172,8 +9931,11 @@ class Commands:
         '''Initialize Commands object'''
 
         # parse arguments using python's internal module argparse.py
+        global cli_parser
+
         self.parser = self.parse_arguments()
         self.args = self.parser.parse_args()
+        cli_parser = self.parser
 
         if self.args.debug or self.args.log_print:
             os.environ['DEBUG'] = '1'
@@ -7356,6 +10118,22 @@ class Commands:
             print_error()
             return False
 
+    def subcmd_hotspots(self, arch: Archiver):
+        '''Query the hotspots of indexed folders.'''
+
+        try:
+            # Check if all the provided folders exist
+            for folder in self.args.folders:
+                if not os.path.isdir(folder):
+                    log(f'\nError: The folder {folder} does not exist.\n', file=sys.stderr)
+                    return False
+
+            return arch.hotspots(self.args.folders)
+
+        except Exception:
+            print_error()
+            return False
+
     def subcmd_archive(self, arch: Archiver, aws: AWSBoto):
         '''Check command for archiving folders for Froster.'''
 
@@ -7372,6 +10150,12 @@ class Commands:
                     arch.reset_folder(folder, self.args.recursive)
                 return True
 
+            if self.args.batch:
+                if self.args.folders:
+                    log('\nError: The --batch flag selects the folders from the hotspots, do not pass folders.\n', file=sys.stderr)
+                    return False
+                return arch.archive_batch()
+
             if not self.args.folders:
                 return arch.archive_select_hotspots()
             else:
@@ -7678,6 +10462,8 @@ class Commands:
             self.args.folders = [folder_path]
             self.args.permissions = False
             self.args.pwalkcopy = None
+            self.args.refresh = False
+            self.args.scanner = 'pwalk'
 
             # Running index command
             if not self.subcmd_index(cfg, arch):
@@ -7689,6 +10475,8 @@ class Commands:
             self.args.older = 0
             self.args.newer = 0
             self.args.reset = False
+            self.args.batch = False
+            self.args.stream = False
             self.args.recursive = False
             self.args.nih = False
             self.args.nihref = None
@@ -7867,8 +10655,8 @@ class Commands:
     def parse_arguments(self):
         '''Gather and parse command-line arguments'''
 
-        parser = argparse.ArgumentParser(prog='froster ',
-                                         description='A user-friendly archiving tool for teams that move data between high-cost POSIX file systems and low-cost S3-like object storage systems')
+        parser = CommandLineParser(prog='froster ',
+                                   description='A user-friendly archiving tool for teams that move data between high-cost POSIX file systems and low-cost S3-like object storage systems')
 
         # ***
         cpucores = int(os.getenv('SLURM_CPUS_ON_NODE',4))
@@ -7938,21 +10726,92 @@ class Commands:
                 Scan a file system folder tree using 'pwalk' and generate a hotspots CSV file
                 that lists the largest folders. As this process is compute intensive the
                 index job will be automatically submitted to Slurm if the Slurm tools are
-                found.
+                found. The full scan is stored as a Parquet file next to the hotspots file,
+                running 'froster index' again on an indexed folder regenerates the hotspots
+                from it with the current thresholds, without scanning the folder again.
             '''), formatter_class=argparse.RawTextHelpFormatter)
 
         parser_index.add_argument('folders', action='store', default=[],  nargs='*',
                                   help='Folders you would like to index (separated by space), ' +
                                   'using the pwalk file system crawler ')
 
+        parser_index.add_argument('--from-file', dest='fromfile', action='store', default='',
+                                  help="Read the folders from this file ('-' for standard input), one per line " +
+                                  "or NUL-separated (e.g. find -print0)")
+
         parser_index.add_argument('-f', '--force', dest='force', action='store_true',
                                   help="Force indexing")
 
+        parser_index.add_argument('-r', '--refresh', dest='refresh', action='store_true',
+                                  help="Refresh the index, only rescanning the folders that changed " +
+                                  "since the last index. File reads and changes of file contents do not " +
+                                  "change the folder modification time, they are only picked up with --force. " +
+                                  "'archive --batch' does not use refreshed indexes")
+
+        parser_index.add_argument('-s', '--scanner', dest='scanner', action='store', default='pwalk',
+                                  choices=['pwalk', 'python'],
+                                  help="File system scanner: 'pwalk' (default) or the built-in parallel " +
+                                  "'python' scanner, which is also used if pwalk is not installed")
+
         parser_index.add_argument('-p', '--permissions', dest='permissions', action='store_true',
                                   help="Print read and write permissions for the provided folder(s)")
 
         parser_index.add_argument('-y', '--pwalk-copy', dest='pwalkcopy', action='store', default='',
-                                  help='Directory where the pwalk CSV file should be copied to.')
+                                  help='Directory where the pwalk CSV file should be exported to.')
+
+        # ***
+
+        parser_hotspots = subparsers.add_parser('hotspots', aliases=['hsp'],
+                                                description=textwrap.dedent(f'''
+                Query the hotspots of indexed folders with any thresholds, without indexing
+                again. The folders are read from the index stores written by 'froster index'
+                and printed as CSV (same columns as the hotspots files) or JSON, for example
+                to select the folders to archive in a batch.
+            '''), formatter_class=argparse.RawTextHelpFormatter)
+
+        parser_hotspots.add_argument('folders', action='store', default=[], nargs='*',
+                                     help='Indexed folders to query (separated by space), ' +
+                                     'all indexed folders if none')
+
+        parser_hotspots.add_argument('-l', '--larger', dest='larger', type=float, action='store', default=None,
+                                     help="Folders with at least <GiB> (default: min_index_folder_size_gib)")
+
+        parser_hotspots.add_argument('-a', '--avg', dest='avg', type=float, action='store', default=None,
+                                     help="Folders with an average file size of at least <MiB> " +
+                                     "(default: min_index_folder_size_avg_mib)")
+
+        parser_hotspots.add_argument('-o', '--older', dest='older', type=int, action='store', default=0,
+                                     help="Folders that have not been accessed for more than <days>")
+
+        parser_hotspots.add_argument('-w', '--newer', dest='newer', type=int, action='store', default=0,
+                                     help="Folders that have been accessed within the last <days>")
+
+        parser_hotspots.add_argument('-m', '--mtime', dest='agemtime', action='store_true',
+                                     help="Use modified file time (mtime) instead of accessed time (atime)")
+
+        parser_hotspots.add_argument('-u', '--user', dest='user', action='store', default='',
+                                     help="Folders owned by this user (name or uid)")
+
+        parser_hotspots.add_argument('-g', '--group', dest='group', action='store', default='',
+                                     help="Folders owned by this group (name or gid)")
+
+        parser_hotspots.add_argument('-s', '--sort', dest='sort', action='store', default='size',
+                                     choices=['size', 'avg', 'age', 'files', 'folder'],
+                                     help="Sort by total size (default), average file size, age, " +
+                                     "number of files or folder name")
+
+        parser_hotspots.add_argument('-r', '--reverse', dest='reverse', action='store_true',
+                                     help="Reverse the sort order (largest, oldest and A-Z first by default)")
+
+        parser_hotspots.add_argument('-t', '--limit', dest='limit', type=int, action='store', default=0,
+                                     help="Print at most <N> hotspots")
+
+        parser_hotspots.add_argument('-f', '--format', dest='format', action='store', default='csv',
+                                     choices=['csv', 'json'],
+                                     help="Output format (default: csv)")
+
+        parser_hotspots.add_argument('-O', '--output', dest='output', action='store', default='',
+                                     help="Write the hotspots to this file instead of the standard output")
 
         # ***
 
@@ -7968,6 +10827,10 @@ class Commands:
                                     help='folders you would like to archive (separated by space), ' +
                                     'the last folder in this list is the target   ')
 
+        parser_archive.add_argument('--from-file', dest='fromfile', action='store', default='',
+                                    help="Read the folders from this file ('-' for standard input), one per line " +
+                                    "or NUL-separated (e.g. find -print0)")
+
         parser_archive.add_argument('-f', '--force', dest='force', action='store_true',
                                     help="Force archiving of a folder that contains the .froster.md5sum file")
 
@@ -7998,6 +10861,17 @@ class Commands:
                 allows you to archive all matching folders at once.
             '''))
 
+        parser_archive.add_argument('-b', '--batch', dest='batch', action='store_true',
+                                    help=textwrap.dedent(f'''
+                Archive all writable hotspot folders matching --larger,
+                --older and --newer at once, without selecting them in the
+                table (e.g. --batch --larger 1024 --older 1095). Use
+                --dry-run to only list the matching folders.
+            '''))
+
+        parser_archive.add_argument('--hotspots-file', dest='hotspotsfile', action='store', default='',
+                                    help="Hotspots file evaluated by --batch (default: all hotspots files)")
+
         parser_archive.add_argument('-n', '--nih', dest='nih', action='store_true',
                                     help="Search and Link Metadata from NIH Reporter")
 
@@ -8020,6 +10894,15 @@ class Commands:
         parser_archive.add_argument('-t', '--no-tar', dest='notar', action='store_true',
                                     help="Do not move small files to tar file before archiving")
 
+        parser_archive.add_argument('--stream', dest='stream', action='store_true',
+                                    help="Stream the tar of the small files straight to S3 instead of writing " +
+                                    "it to the folder first, the small files are only removed once all the checksums " +
+                                    "of the archive are verified at the end. " +
+                                    "Files are hashed while they are uploaded, each file is read only once")
+
+        parser_archive.add_argument('--no-checksum-cache', dest='nochecksumcache', action='store_true',
+                                    help="Hash all files again, also the ones that did not change since they were hashed")
+
         parser_archive.add_argument('-d', '--dry-run', dest='dryrun', action='store_true',
                                     help="Execute a test archive without actually copying the data")
 
@@ -8035,6 +10918,10 @@ class Commands:
                                    help='folders (separated by space) from which you would like to delete files, ' +
                                    'you can only delete files that have been archived')
 
+        parser_delete.add_argument('--from-file', dest='fromfile', action='store', default='',
+                                   help="Read the folders from this file ('-' for standard input), one per line " +
+                                   "or NUL-separated (e.g. find -print0)")
+
         # Delete given bucket. Not shown in help. Only available in debug mode
         parser_delete.add_argument('-b', '--bucket', dest='bucket', action='store', default='',
                                    help=argparse.SUPPRESS)
@@ -8073,6 +10960,10 @@ class Commands:
         parser_restore.add_argument('folders', action='store', default=[],  nargs='*',
                                     help='folders you would like to to restore (separated by space)')
 
+        parser_restore.add_argument('--from-file', dest='fromfile', action='store', default='',
+                                    help="Read the folders from this file ('-' for standard input), one per line " +
+                                    "or NUL-separated (e.g. find -print0)")
+
         parser_restore.add_argument('-a', '--aws', dest='aws', action='store_true',
                                     help="Restore folder on new AWS EC2 instance instead of local machine")
 
@@ -8121,6 +11012,9 @@ class Commands:
                 (Costs in Summer 2024)
                 '''))
 
+        parser_restore.add_argument('--no-checksum-cache', dest='nochecksumcache', action='store_true',
+                                    help="Hash all restored files again, also the ones that did not change since they were hashed")
+
         parser_restore.add_argument('-r', '--recursive', dest='recursive', action='store_true',
                                     help="Restore the current archived folder and all archived sub-folders")
 
@@ -8193,20 +11087,127 @@ def clean_path_list(paths):
 
     cleaned_paths = []
 
-    for path in paths:
-        try:
-            # Expand user and symlinks, and remove trailing slashes only if path is not empty
-            if path:
-                # Split the path into its components
-                cleaned_paths.append(clean_path(path))
+    # Resolving the symlinks waits for the file system (NFS), long lists are resolved
+    # in parallel, batch by batch so paths can be streamed from a file
+    paths = iter(paths)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+        while batch := list(itertools.islice(paths, 1024)):
+            try:
+                # Expand user and symlinks, and remove trailing slashes only if path is not empty
+                cleaned_paths.extend(executor.map(
+                    clean_path, [path for path in batch if path]))
 
-        except Exception:
-            print_error()
-            sys.exit(1)
+            except Exception:
+                print_error()
+                sys.exit(1)
 
     return cleaned_paths
 
 
+def read_path_list(path_list):
+    '''Read paths from a file ('-' for stdin), one per line or separated by NUL characters'''
+
+    f = sys.stdin.buffer if path_list == '-' else open(path_list, 'rb')
+
+    try:
+        separator = None
+        rest = b''
+
+        while chunk := f.read(1024 * 1024):
+            data = rest + chunk
+
+            # NUL separated (find -print0) if there is any NUL, else one path per line
+            if separator is None:
+                if b'\0' in data:
+                    separator = b'\0'
+                elif b'\n' in data:
+                    separator = b'\n'
+                else:
+                    rest = data
+                    continue
+
+            *paths, rest = data.split(separator)
+            for path in paths:
+                if separator == b'\n':
+                    path = path.rstrip(b'\r')
+                if path:
+                    yield os.fsdecode(path)
+
+        if separator == b'\n':
+            rest = rest.rstrip(b'\r')
+        if rest:
+            yield os.fsdecode(rest)
+
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+
+
+class CommandLineParser(argparse.ArgumentParser):
+    '''Argument parser that keeps its arguments and subcommands, so a command line can
+    be rebuilt from the parsed arguments (see args_to_argv)'''
+
+    def __init__(self, *args, **kwargs):
+        # The help argument is added by the base class
+        self.arguments = []
+        self.subcommands = None
+        super().__init__(*args, **kwargs)
+
+    def add_argument(self, *args, **kwargs):
+        action = super().add_argument(*args, **kwargs)
+        self.arguments.append(action)
+        return action
+
+    def add_subparsers(self, **kwargs):
+        # The subcommand parsers are created with the class of this parser
+        self.subcommands = super().add_subparsers(**kwargs)
+        return self.subcommands
+
+
+def args_to_argv(parser, args, exclude=()):
+    '''Rebuild a command line (without the program name) from the arguments parsed by a
+    CommandLineParser
+
+    The positional arguments come after "--", a folder named like an option (-old)
+    is not taken for one.'''
+
+    argv = []
+    positionals = []
+
+    for action in parser.arguments:
+        # The help and the unset arguments are not in args
+        if action.dest in exclude or not hasattr(args, action.dest):
+            continue
+
+        value = getattr(args, action.dest)
+
+        if not action.option_strings:
+            positionals += value if isinstance(value, list) else [value]
+
+        elif action.nargs == 0:
+            # A flag (store_true)
+            if value != action.default:
+                argv.append(action.option_strings[-1])
+
+        elif value is not None and value != action.default:
+            if isinstance(value, list):
+                argv += [action.option_strings[-1]] + [str(v) for v in value]
+            elif str(value).startswith('-'):
+                argv.append(f'{action.option_strings[-1]}={value}')
+            else:
+                argv += [action.option_strings[-1], str(value)]
+
+    subcommands = parser.subcommands
+    if subcommands is not None and getattr(args, subcommands.dest, None) in subcommands.choices:
+        name = getattr(args, subcommands.dest)
+        argv += [name] + args_to_argv(subcommands.choices[name], args, exclude)
+
+    if positionals:
+        argv += ['--'] + [str(p) for p in positionals]
+
+    return argv
+
+
 def is_slurm_installed():
     if shutil.which('sbatch'):
         return True
@@ -8347,6 +11348,16 @@ def get_caller_class():
 def log(*args, **kwargs):
 
     try:
+        # Output captured by the current thread is logged later as a single block,
+        # each part is kept with its stream (stdout or stderr)
+        buffer = getattr(log_capture, 'buffer', None)
+        if buffer is not None:
+            stream = kwargs.pop('file', None) or sys.stdout
+            text = io.StringIO()
+            print(*args, **kwargs, file=text)
+            buffer.append((stream, text.getvalue()))
+            return True
+
         print(*args, **kwargs, flush=True)
 
         global logger
@@ -8356,6 +11367,7 @@ def log(*args, **kwargs):
             os.makedirs(logger_dir, exist_ok=True, mode=0o775)
 
             # Write entry into logger
+            kwargs.pop('file', None)
             with open(logger, 'a') as f:
                 print(*args, **kwargs, file=f)
         return True
@@ -8389,7 +11401,6 @@ def main():
         # Declaring variables
         TABLECSV = ''  # CSV string for DataTable
         SELECTEDFILE = ''  # CSV filename to open in hotspots
-        MAXHOTSPOTS = 0
 
         # Init Commands class
         cmd = Commands()
@@ -8445,11 +11456,22 @@ def main():
         if hasattr(cmd.args, "folders"):
             cmd.args.folders = clean_path_list(cmd.args.folders)
 
+        # Add the paths of the folder list file (if any)
+        if getattr(cmd.args, "fromfile", ""):
+            try:
+                cmd.args.folders += clean_path_list(
+                    read_path_list(cmd.args.fromfile))
+            except OSError as e:
+                log(f'\nError: Cannot read the folder list {cmd.args.fromfile}: {e}\n')
+                sys.exit(1)
+
         # CLI commands that do NOT need credentials or configuration
         if args.subcmd in ['config', 'cnf']:
             res = cmd.subcmd_config(cfg, aws)
         elif args.subcmd in ['index', 'ind']:
             res = cmd.subcmd_index(cfg, arch)
+        elif args.subcmd in ['hotspots', 'hsp']:
+            res = cmd.subcmd_hotspots(arch)
         elif args.subcmd in ['umount']:
             res = cmd.subcmd_umount(arch, aws)
         elif args.subcmd in ['credentials', 'crd']:
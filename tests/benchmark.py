@@ -0,0 +1,301 @@
+'''Benchmarks of the froster building blocks on a generated folder tree
+
+Usage:
+    python -m tests.benchmark scanner [--pwalk /path/to/pwalk]
+    python -m tests.benchmark allfiles [--files 100000]
+    python -m tests.benchmark hashing [--large 4 --large-size 1024]
+'''
+
+import argparse
+import concurrent.futures
+import grp
+import hashlib
+import os
+import pwd
+import shutil
+import stat
+import subprocess
+import tarfile
+import tempfile
+import time
+
+from froster.froster import Archiver, FileSystemScanner, HashEngine, FAST_HASH_ALGORITHMS, new_hash, user_names, group_names
+
+
+def generate_tree(base_dir, folders=20, depth=3, files=50, size=4096):
+    '''Generate a tree of folders^depth folders below base_dir with files small files each'''
+
+    count = 0
+    level = [base_dir]
+
+    for _ in range(depth):
+        next_level = []
+        for parent in level:
+            for i in range(folders):
+                folder = os.path.join(parent, f'dir{i:03d}')
+                os.mkdir(folder)
+                next_level.append(folder)
+
+                for j in range(files):
+                    with open(os.path.join(folder, f'file{j:04d}.dat'), 'wb') as f:
+                        f.truncate(size)
+                    count += 1
+        level = next_level
+
+    return count
+
+
+def timed(label, func, *args):
+    '''Run func and print how long it took'''
+
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+
+    print(f'{label:<40} {elapsed:8.3f} s')
+
+    return result
+
+
+def run_pwalk(pwalk, folder):
+    with open(os.devnull, 'wb') as devnull:
+        subprocess.run([pwalk, '--NoSnap', '--one-file-system', '--header', folder],
+                       stdout=devnull, stderr=subprocess.DEVNULL, check=True)
+
+
+def run_scanner(threads, folder):
+    with open(os.devnull, 'wb') as devnull:
+        FileSystemScanner(threads=threads).scan(folder, devnull)
+
+
+def run_os_walk(folder):
+    return sum(len(files) for _, _, files in os.walk(folder))
+
+
+def run_walk(threads, folder):
+    return sum(len(files) for _, _, files in FileSystemScanner(threads=threads, one_file_system=False).walk(folder))
+
+
+def benchmark_scanner(args):
+    '''Compare pwalk, the built-in scanner and os.walk'''
+
+    pwalk = args.pwalk or shutil.which('pwalk')
+
+    with tempfile.TemporaryDirectory(prefix='froster-benchmark-', dir=args.dir) as tree:
+
+        count = timed('Generating the tree', generate_tree, tree,
+                      args.folders, args.depth, args.files)
+        print(f'{count} files\n')
+
+        if pwalk:
+            timed('pwalk', run_pwalk, pwalk, tree)
+        else:
+            print('pwalk not found, use --pwalk to compare with it')
+
+        for threads in args.threads:
+            timed(f'FileSystemScanner.scan ({threads} threads)',
+                  run_scanner, threads, tree)
+
+        timed('os.walk', run_os_walk, tree)
+
+        for threads in args.threads:
+            timed(f'FileSystemScanner.walk ({threads} threads)',
+                  run_walk, threads, tree)
+
+
+def generate_files(folder, files=100000, size=1024):
+    '''Generate files small files in folder'''
+
+    for i in range(files):
+        with open(os.path.join(folder, f'file{i:07d}.dat'), 'wb') as f:
+            f.truncate(size)
+
+    return files
+
+
+def run_metadata_per_file(folder):
+    '''Metadata calls of each file as done before the single pass listing'''
+
+    count = 0
+    for file in os.listdir(folder):
+        file_path = os.path.join(folder, file)
+        if os.path.isfile(file_path) or os.path.islink(file_path):
+            st = os.lstat(file_path)
+            st.st_size, st.st_mtime, st.st_atime
+            pwd.getpwuid(os.lstat(file_path).st_uid)
+            grp.getgrgid(os.lstat(file_path).st_gid)
+            oct(os.lstat(file_path).st_mode)
+            count += 1
+    return count
+
+
+def run_metadata_scandir(folder):
+    '''Metadata of the single pass listing, one lstat per file and cached names'''
+
+    count = 0
+    _, files = FileSystemScanner(one_file_system=False, skipdirs=[]).list_folder(folder)
+    for _, st in files:
+        if stat.S_ISREG(st.st_mode) or stat.S_ISLNK(st.st_mode):
+            st.st_size, st.st_mtime, st.st_atime
+            user_names.get(st.st_uid)
+            group_names.get(st.st_gid)
+            oct(st.st_mode)
+            count += 1
+    return count
+
+
+def run_tar_add(folder, tar_path):
+    with tarfile.open(tar_path, 'w') as tar_file:
+        for file in sorted(os.listdir(folder)):
+            tar_file.add(os.path.join(folder, file), arcname=file)
+
+
+def run_tar_from_stat(folder, tar_path):
+    _, files = FileSystemScanner(one_file_system=False, skipdirs=[]).list_folder(folder)
+    with tarfile.open(tar_path, 'w') as tar_file:
+        for file_path, st in sorted(files):
+            tarinfo = Archiver._tarinfo_from_stat(
+                tar_file, file_path, os.path.basename(file_path), st)
+            with open(file_path, 'rb') as f:
+                tar_file.addfile(tarinfo, f)
+
+
+def benchmark_allfiles(args):
+    '''Compare the per-file metadata cost of the small files tar stage'''
+
+    with tempfile.TemporaryDirectory(prefix='froster-benchmark-', dir=args.dir) as folder:
+
+        files = os.path.join(folder, 'files')
+        os.mkdir(files)
+
+        count = timed('Generating the files', generate_files, files, args.files, args.size)
+        print(f'{count} files\n')
+
+        for label, func in (('Metadata, per file calls', run_metadata_per_file),
+                            ('Metadata, single scandir pass', run_metadata_scandir)):
+            start = time.perf_counter()
+            func(files)
+            elapsed = time.perf_counter() - start
+            print(f'{label:<40} {elapsed:8.3f} s {1e6 * elapsed / count:8.1f} us/file')
+
+        tar_path = os.path.join(folder, 'files.tar')
+        timed('tar, TarFile.add', run_tar_add, files, tar_path)
+        timed('tar, header from the listing stat', run_tar_from_stat, files, tar_path)
+
+
+def generate_hashing_tree(folder, small=2000, small_size=65536, large=4, large_size=1024):
+    '''Generate small files of small_size bytes and large files of large_size MiB, returns their paths'''
+
+    paths = []
+    block = os.urandom(1048576)
+
+    for i in range(small):
+        path = os.path.join(folder, f'small{i:05d}.dat')
+        with open(path, 'wb') as f:
+            f.write(block[:small_size])
+        paths.append(path)
+
+    for i in range(large):
+        path = os.path.join(folder, f'large{i:02d}.dat')
+        with open(path, 'wb') as f:
+            for _ in range(large_size):
+                f.write(block)
+        paths.append(path)
+
+    return paths
+
+
+def run_hashlib(paths):
+    '''One file after the other'''
+
+    for path in paths:
+        md5_hash = hashlib.md5()
+        with open(path, 'rb') as f:
+            while chunk := f.read(1048576):
+                md5_hash.update(chunk)
+
+
+def run_hash_engine(paths, workers, algorithms=('md5',)):
+    with HashEngine(workers=workers, large_workers=max(2, workers // 4)) as engine:
+        for future in concurrent.futures.as_completed([engine.submit(path, algorithms=algorithms)
+                                                       for path in paths]):
+            future.result()
+
+
+def benchmark_hashing(args):
+    '''Sustained throughput of the HashEngine on a mix of small and large files, MD5 and the fast hashes'''
+
+    with tempfile.TemporaryDirectory(prefix='froster-benchmark-', dir=args.dir) as folder:
+
+        paths = timed('Generating the files', generate_hashing_tree, folder,
+                      args.small, args.small_size, args.large, args.large_size)
+        total = sum(os.path.getsize(path) for path in paths)
+        print(f'{len(paths)} files, {total / 1e9:.2f} GB\n')
+
+        def report(label, func, *func_args):
+            start = time.perf_counter()
+            func(*func_args)
+            elapsed = time.perf_counter() - start
+            print(f'{label:<40} {elapsed:8.3f} s {total / 1e9 / elapsed:8.2f} GB/s')
+
+        report('hashlib, one file at a time', run_hashlib, paths)
+        for workers in args.workers:
+            report(f'HashEngine ({workers} workers)', run_hash_engine, paths, workers)
+
+        # The fast hashes whose module is installed, alone and with MD5 in the same pass
+        for algorithm in [a for a in FAST_HASH_ALGORITHMS if new_hash(a) is not None]:
+            workers = args.workers[-1]
+            report(f'HashEngine {algorithm} ({workers} workers)',
+                   run_hash_engine, paths, workers, (algorithm,))
+            report(f'HashEngine md5+{algorithm} ({workers} workers)',
+                   run_hash_engine, paths, workers, ('md5', algorithm))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='froster benchmarks')
+    parser.add_argument('--dir', default=None,
+                        help='Folder to generate the test data in, e.g. on NFS (default: system temp)')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    parser_scanner = subparsers.add_parser(
+        'scanner', help='pwalk against the built-in scanner')
+    parser_scanner.add_argument('--pwalk', default=None,
+                                help='Path to the pwalk binary (default: pwalk in PATH)')
+    parser_scanner.add_argument('--folders', type=int, default=20,
+                                help='Subfolders per folder')
+    parser_scanner.add_argument('--depth', type=int, default=3,
+                                help='Depth of the tree')
+    parser_scanner.add_argument('--files', type=int, default=10,
+                                help='Files per folder')
+    parser_scanner.add_argument('--threads', type=int, nargs='+', default=[1, 8, 32],
+                                help='Thread counts of the built-in scanner')
+    parser_scanner.set_defaults(func=benchmark_scanner)
+
+    parser_allfiles = subparsers.add_parser(
+        'allfiles', help='Per-file metadata cost of the small files tar and allfiles CSV')
+    parser_allfiles.add_argument('--files', type=int, default=100000,
+                                 help='Files in the folder')
+    parser_allfiles.add_argument('--size', type=int, default=1024,
+                                 help='Size of each file in bytes')
+    parser_allfiles.set_defaults(func=benchmark_allfiles)
+
+    parser_hashing = subparsers.add_parser(
+        'hashing', help='MD5 and fast hash throughput of the HashEngine')
+    parser_hashing.add_argument('--small', type=int, default=2000,
+                                help='Number of small files')
+    parser_hashing.add_argument('--small-size', type=int, default=65536,
+                                help='Size of the small files in bytes')
+    parser_hashing.add_argument('--large', type=int, default=4,
+                                help='Number of large files')
+    parser_hashing.add_argument('--large-size', type=int, default=1024,
+                                help='Size of the large files in MiB')
+    parser_hashing.add_argument('--workers', type=int, nargs='+', default=[4, 16],
+                                help='Worker counts of the HashEngine')
+    parser_hashing.set_defaults(func=benchmark_hashing)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+import argparse
+import os
+import types
+
+from froster.froster import Archiver
+
+
+def local_archiver(data_dir, **kwargs):
+    '''Archiver with a minimal configuration below data_dir, for the tests that do not use S3'''
+
+    cfg = types.SimpleNamespace(
+        archive_json=os.path.join(data_dir, 'froster-archives.json'),
+        data_dir=data_dir,
+        froster_dir=data_dir,
+        hotspots_dir=os.path.join(data_dir, 'hotspots'),
+        slurm_dir=os.path.join(data_dir, 'slurm'),
+        checksum_cache_file=os.path.join(data_dir, 'checksums.db'),
+        max_checksum_cache_entries=None,
+        max_small_file_size_kib=None,
+        max_tar_readahead_mib=None,
+        max_hash_inflight_mib=None,
+        min_index_folder_size_gib=None,
+        min_index_folder_size_avg_mib=None,
+        max_hotspots_display_entries=None,
+        fast_hash_algorithm=kwargs.pop('fast_hash_algorithm', None))
+
+    args = dict(cores=4, debug=False, noslurm=True, force=False, recursive=False,
+                nochecksumcache=False, scanner='python', refresh=False, pwalkcopy='')
+    args.update(kwargs)
+
+    return Archiver(argparse.Namespace(**args), cfg)
@@ -0,0 +1,213 @@
+import csv
+import io
+import os
+import shlex
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import froster.froster as froster
+from froster.froster import Commands, args_to_argv
+from tests.helpers import local_archiver
+
+GiB = 1073741824
+
+
+def cli_parser():
+    '''- The froster command line parser, without parsing sys.argv.'''
+
+    return Commands.__new__(Commands).parse_arguments()
+
+
+class TestArgsToArgv(unittest.TestCase):
+    '''Test rebuilding a command line from the parsed arguments.'''
+
+    def test_round_trip(self):
+        '''- Parsing the rebuilt command line gives the same arguments.'''
+
+        parser = cli_parser()
+        for argv in (['archive', '/data/a', '/data/b c'],
+                     ['-n', '-c', '8', 'archive', '-fr', '--nih-ref', 'R01', '--', '-old', '--force'],
+                     ['archive', '-b', '--larger', '5', '--older', '30', '--hotspots-file', '/tmp/h.csv'],
+                     ['archive', '--nih-ref=-odd', '/data/a'],
+                     ['index', '--force', '/data'],
+                     ['delete', '--', '-x']):
+            with self.subTest(argv=argv):
+                args = parser.parse_args(argv)
+                rebuilt = args_to_argv(parser, args)
+                self.assertEqual(parser.parse_args(rebuilt), args)
+
+    def test_options_before_folders(self):
+        '''- The folders come after "--", the excluded arguments are left out.'''
+
+        parser = cli_parser()
+        args = parser.parse_args(['-n', 'archive', '-f', '--from-file', 'list.txt', '--', '-old', '/data/a'])
+
+        self.assertEqual(args_to_argv(parser, args, exclude=('fromfile',)),
+                         ['--no-slurm', 'archive', '--force', '--', '-old', '/data/a'])
+
+
+class TestArchiveBatch(unittest.TestCase):
+    '''Test selecting the hotspots to archive with the batch policy.'''
+
+    def setUp(self):
+        '''- Create folders and a hotspots file listing them.'''
+
+        self.data_dir = tempfile.mkdtemp(prefix='froster_data_')
+        self.folder = tempfile.mkdtemp(prefix='froster_')
+
+        # Folder name, size in GiB, days since the last access
+        self.hotspots = [('a', 5, 400), ('a/sub', 2, 400), ('b', 1, 10), ('-old', 3, 900), ('gone', 4, 400)]
+
+        self.paths = {}
+        for name, _, _ in self.hotspots:
+            self.paths[name] = os.path.join(self.folder, name)
+            if name != 'gone':
+                os.makedirs(self.paths[name])
+
+        self.hotspots_file = os.path.join(self.data_dir, 'hotspots', 'folder.csv')
+        os.makedirs(os.path.dirname(self.hotspots_file))
+        with open(self.hotspots_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['User', 'AccD', 'ModD', 'GiB', 'MiBAvg', 'Folder', 'Group', 'TiB', 'FileCount', 'DirSize'])
+            for name, size, accd in self.hotspots:
+                writer.writerow(['user', accd, accd, size, 100, self.paths[name], 'group', 0, 10, size * GiB])
+
+    def tearDown(self):
+        '''- Remove the temporary folders.'''
+
+        shutil.rmtree(self.folder)
+        shutil.rmtree(self.data_dir)
+
+    def batch(self, argv, writable=None):
+        '''- Run archive --batch with the given arguments, returns the result, the archived folders and the output.
+
+        The folders in writable (all by default) are writable.'''
+
+        parser = cli_parser()
+        args = parser.parse_args(['--no-slurm', 'archive', '--batch'] + argv)
+        arch = local_archiver(self.data_dir, **vars(args))
+        arch.cfg.whoami = 'tester'
+
+        access = os.access if writable is None else (lambda path, mode: path in writable)
+
+        with patch.object(arch, 'archive', return_value=True) as archive, \
+                patch('os.access', side_effect=access), \
+                patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            res = arch.archive_batch()
+
+        folders = archive.call_args.args[0] if archive.called else None
+        return res, folders, stdout.getvalue()
+
+    def test_policy(self):
+        '''- The writable folders larger than the size and older than the age are archived.'''
+
+        res, folders, _ = self.batch(['--larger', '2', '--older', '100'])
+        self.assertTrue(res)
+        self.assertEqual(folders, sorted(self.paths[name] for name in ('a', 'a/sub', '-old')))
+
+        res, folders, _ = self.batch(['--newer', '100'])
+        self.assertEqual(folders, [self.paths['b']])
+
+    def test_no_policy(self):
+        '''- A batch without a policy is refused.'''
+
+        res, folders, output = self.batch([])
+        self.assertFalse(res)
+        self.assertIsNone(folders)
+        self.assertIn('Set the batch policy', output)
+
+    def test_refreshed_index(self):
+        '''- The hotspots of a refreshed index are not archived in batch.'''
+
+        arch = local_archiver(self.data_dir)
+        with open(arch._index_refreshed_marker(self.hotspots_file), 'w') as f:
+            f.write('2026-01-01T00:00:00\n')
+
+        res, folders, output = self.batch(['--older', '100'])
+        self.assertFalse(res)
+        self.assertIsNone(folders)
+        self.assertIn('refreshed index', output)
+
+    def test_live_write_check(self):
+        '''- A folder that is not writable anymore is left out, even if the user hotspots file lists it.'''
+
+        res, folders, _ = self.batch(['--older', '100'])
+        self.assertIn(self.paths['a'], folders)
+
+        # The user hotspots file is reused, the folders are still checked
+        writable = {self.paths[name] for name in ('a/sub', '-old')}
+        res, folders, _ = self.batch(['--older', '100'], writable)
+        self.assertTrue(res)
+        self.assertEqual(folders, sorted(writable))
+
+    def test_recursive(self):
+        '''- A recursive batch does not archive the subfolders of the archived folders.'''
+
+        res, folders, output = self.batch(['--older', '100', '--recursive'])
+        self.assertEqual(folders, sorted(self.paths[name] for name in ('a', '-old')))
+        self.assertIn(f'Skipping {self.paths["a/sub"]}', output)
+
+    def test_slurm_command_line(self):
+        '''- The Slurm job archives the selected folders without evaluating the policy again.'''
+
+        parser = cli_parser()
+        args = parser.parse_args(['-c', '2', 'archive', '-fb', '--older', '100', '--hotspots-file', self.hotspots_file])
+        arch = local_archiver(self.data_dir, **vars(args))
+        arch.cfg.whoami = 'tester'
+
+        with patch.object(froster, 'cli_parser', parser), \
+                patch.object(froster, 'use_slurm', return_value=True), \
+                patch.object(sys, 'argv', ['froster']), \
+                patch.object(arch, 'archive', return_value=True), \
+                patch('sys.stdout', new_callable=io.StringIO):
+            self.assertTrue(arch.archive_batch())
+            argv = sys.argv
+
+        job_args = parser.parse_args(argv[1:])
+        self.assertFalse(job_args.batch)
+        self.assertEqual(job_args.hotspotsfile, '')
+        self.assertTrue(job_args.force)
+        self.assertEqual(job_args.cores, 2)
+        self.assertEqual(job_args.folders, sorted(self.paths[name] for name in ('a', 'a/sub', '-old')))
+
+
+class TestSlurmCommand(unittest.TestCase):
+    '''Test the command line of the Slurm jobs.'''
+
+    def setUp(self):
+        '''- Create the Slurm folder.'''
+
+        self.data_dir = tempfile.mkdtemp(prefix='froster_data_')
+        os.mkdir(os.path.join(self.data_dir, 'slurm'))
+
+    def tearDown(self):
+        '''- Remove the temporary folder.'''
+
+        shutil.rmtree(self.data_dir)
+
+    def test_folder_list_file(self):
+        '''- A long folder list given after "--" is passed in a file, the options stay options.'''
+
+        parser = cli_parser()
+        folders = ['-old'] + [f'/data/folder{i}' for i in range(11)]
+        argv = ['froster', '-c', '2', 'archive', '-f', '--', *folders]
+        arch = local_archiver(self.data_dir, **vars(parser.parse_args(argv[1:])))
+
+        with patch.object(froster, 'Slurm') as slurm, patch.object(sys, 'argv', argv):
+            slurm.return_value.submit_job.return_value = True
+            self.assertTrue(arch._slurm_cmd(folders, 'archive'))
+
+        command, remove = slurm.return_value.submit_job.call_args.kwargs['cmd'].split('\n')
+        job_args = parser.parse_args(shlex.split(command)[1:])
+        self.assertEqual((job_args.folders, job_args.force, job_args.cores), ([], True, 2))
+        self.assertTrue(remove.startswith('rm -f '))
+
+        with open(job_args.fromfile, 'rb') as f:
+            self.assertEqual(f.read().split(b'\0')[:-1], [os.fsencode(folder) for folder in folders])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
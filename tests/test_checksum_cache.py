@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from froster.froster import ChecksumCache
+
+
+class TestChecksumCache(unittest.TestCase):
+    '''Test the persistent checksum cache.'''
+
+    def setUp(self):
+        '''- Create a temporary folder with the cache database and some files.'''
+
+        self.folder = tempfile.mkdtemp(prefix='froster_')
+        self.db = os.path.join(self.folder, 'cache', 'checksums.db')
+        self.files = []
+        for i in range(3):
+            path = os.path.join(self.folder, f'file{i}')
+            with open(path, 'wb') as f:
+                f.write(b'x' * (i + 1))
+            self.files.append(path)
+
+    def tearDown(self):
+        '''- Remove the temporary folder.'''
+
+        shutil.rmtree(self.folder)
+
+    def test_hit_and_miss(self):
+        '''- A cached checksum is found, an unknown file or algorithm is not.'''
+
+        cache = ChecksumCache(self.db)
+        cache.put(os.stat(self.files[0]), 'abc')
+        cache.flush()
+
+        self.assertEqual(cache.get(os.stat(self.files[0])), 'abc')
+        self.assertIsNone(cache.get(os.stat(self.files[1])))
+        self.assertIsNone(cache.get(os.stat(self.files[0]), algorithm='sha256'))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        cache.close()
+
+        # The checksums are kept when the cache is opened again
+        cache = ChecksumCache(self.db)
+        self.assertEqual(cache.get(os.stat(self.files[0])), 'abc')
+        cache.close()
+
+    def test_batched_entries_are_not_found_before_flush(self):
+        '''- The entries added with put are written by flush or close.'''
+
+        cache = ChecksumCache(self.db)
+        cache.put(os.stat(self.files[0]), 'abc')
+        self.assertIsNone(cache.get(os.stat(self.files[0])))
+        cache.close()
+
+        cache = ChecksumCache(self.db)
+        self.assertEqual(cache.get(os.stat(self.files[0])), 'abc')
+        cache.close()
+
+    def test_ctime_invalidation(self):
+        '''- A file changed with the same size and its mtime set back is hashed again.'''
+
+        path = self.files[2]
+        file_stat = os.stat(path)
+
+        cache = ChecksumCache(self.db)
+        cache.put(file_stat, 'abc')
+        cache.flush()
+        self.assertEqual(cache.get(os.stat(path)), 'abc')
+
+        # Make sure the change time moves forward
+        time.sleep(0.01)
+        with open(path, 'r+b') as f:
+            f.write(b'y')
+        os.utime(path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+
+        new_stat = os.stat(path)
+        self.assertEqual((new_stat.st_size, new_stat.st_mtime_ns),
+                         (file_stat.st_size, file_stat.st_mtime_ns))
+        self.assertIsNone(cache.get(new_stat))
+
+        # A metadata only change (chmod) also changes the ctime
+        cache.put(new_stat, 'def')
+        cache.flush()
+        time.sleep(0.01)
+        os.chmod(path, 0o600)
+        self.assertIsNone(cache.get(os.stat(path)))
+        cache.close()
+
+    def test_eviction(self):
+        '''- The least recently used entries above max_entries are evicted on close.'''
+
+        cache = ChecksumCache(self.db, max_entries=2)
+        for i, path in enumerate(self.files):
+            cache.put(os.stat(path), f'sum{i}')
+            cache.flush()
+            time.sleep(0.01)
+
+        # Using the oldest entry makes the second one the least recently used
+        self.assertEqual(cache.get(os.stat(self.files[0])), 'sum0')
+        cache.close()
+
+        cache = ChecksumCache(self.db, max_entries=2)
+        self.assertEqual(cache.get(os.stat(self.files[0])), 'sum0')
+        self.assertIsNone(cache.get(os.stat(self.files[1])))
+        self.assertEqual(cache.get(os.stat(self.files[2])), 'sum2')
+        cache.close()
+
+    def test_database_error_disables_the_cache(self):
+        '''- After a database error the cache finds nothing and does not raise.'''
+
+        cache = ChecksumCache(self.db)
+        cache.put(os.stat(self.files[0]), 'abc')
+        cache.flush()
+        cache.connection.close()
+
+        self.assertIsNone(cache.get(os.stat(self.files[0])))
+        self.assertTrue(cache.is_disabled)
+        cache.put(os.stat(self.files[1]), 'def')
+        cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
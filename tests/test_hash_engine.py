@@ -0,0 +1,92 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from froster.froster import HashEngine
+
+CHUNK_SIZE = 4096
+
+SIZES = [0, 1, CHUNK_SIZE - 1, CHUNK_SIZE, CHUNK_SIZE + 1,
+         2 * CHUNK_SIZE, 3 * CHUNK_SIZE + 17, 12345]
+
+
+class TestHashEngine(unittest.TestCase):
+    '''Test the checksums of the hash engine against hashlib.'''
+
+    @classmethod
+    def setUpClass(cls):
+        '''- Create files of sizes around the chunk size.'''
+
+        cls.folder = tempfile.mkdtemp(prefix='froster_')
+        cls.files = {}
+        for size in SIZES:
+            path = os.path.join(cls.folder, f'file{size}')
+            with open(path, 'wb') as f:
+                f.write(os.urandom(size))
+            cls.files[path] = size
+
+    @classmethod
+    def tearDownClass(cls):
+        '''- Remove the temporary folder.'''
+
+        shutil.rmtree(cls.folder)
+
+    def expected(self, path, algorithm):
+        with open(path, 'rb') as f:
+            return hashlib.new(algorithm, f.read()).hexdigest()
+
+    def check(self, engine, algorithms=('md5',)):
+        '''- Hash all the files at once and compare with hashlib, and the progress with the size.'''
+
+        lock = threading.Lock()
+        progress = {path: 0 for path in self.files}
+
+        def counter(path):
+            def add(n):
+                with lock:
+                    progress[path] += n
+            return add
+
+        futures = {path: engine.submit(path, size, counter(path), algorithms)
+                   for path, size in self.files.items()}
+
+        for path, future in futures.items():
+            checksums = future.result(timeout=60)
+            for algorithm in algorithms:
+                self.assertEqual(checksums[algorithm], self.expected(path, algorithm),
+                                 f'{algorithm} of {self.files[path]} bytes')
+            self.assertEqual(progress[path], self.files[path])
+
+    def test_small_files(self):
+        '''- Files below large_file_size are hashed whole.'''
+
+        with HashEngine(workers=2, chunk_size=CHUNK_SIZE, large_file_size=1 << 30) as engine:
+            self.check(engine)
+
+    def test_large_files_tiny_inflight(self):
+        '''- Files hashed chunk by chunk with a tiny read ahead budget do not deadlock.'''
+
+        with HashEngine(workers=2, large_workers=2, chunk_size=CHUNK_SIZE, readahead=3,
+                        max_inflight=1, large_file_size=0) as engine:
+            self.check(engine)
+
+    def test_several_algorithms(self):
+        '''- Each file is read once for all the algorithms.'''
+
+        with HashEngine(workers=2, large_workers=1, chunk_size=CHUNK_SIZE,
+                        large_file_size=CHUNK_SIZE) as engine:
+            self.check(engine, algorithms=('md5', 'sha256'))
+
+    def test_md5sum(self):
+        '''- md5sum waits for the MD5 of a single file.'''
+
+        path = max(self.files, key=self.files.get)
+        with HashEngine(chunk_size=CHUNK_SIZE, large_file_size=CHUNK_SIZE) as engine:
+            self.assertEqual(engine.md5sum(path), self.expected(path, 'md5'))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
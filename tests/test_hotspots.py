@@ -0,0 +1,136 @@
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from tests.helpers import local_archiver
+
+MiB = 1048576
+
+
+class TestHotspots(unittest.TestCase):
+    '''Test the hotspots queries of a stored index.'''
+
+    @classmethod
+    def setUpClass(cls):
+        '''- Create and index a folder tree with hotspots of different sizes and ages.'''
+
+        cls.data_dir = tempfile.mkdtemp(prefix='froster_data_')
+        cls.folder = tempfile.mkdtemp(prefix='froster_')
+
+        # big: 2 files of 1 MiB, small: 1 file of 10 KiB, old: 1 file of 1 MiB not used for 400 days
+        for name, sizes in (('big', [MiB, MiB]), ('small', [10240]), ('old', [MiB])):
+            os.mkdir(os.path.join(cls.folder, name))
+            for i, size in enumerate(sizes):
+                with open(os.path.join(cls.folder, name, f'file{i}'), 'wb') as f:
+                    f.write(b'x' * size)
+
+        old_time = time.time() - 400 * 86400
+        os.utime(os.path.join(cls.folder, 'old', 'file0'), (old_time, old_time))
+
+        with patch('sys.stdout', new_callable=io.StringIO):
+            if not local_archiver(cls.data_dir).index([cls.folder]):
+                raise RuntimeError(f'Cannot index {cls.folder}')
+
+    @classmethod
+    def tearDownClass(cls):
+        '''- Remove the temporary folders.'''
+
+        shutil.rmtree(cls.folder)
+        shutil.rmtree(cls.data_dir)
+
+    def archiver(self, **kwargs):
+        '''- Archiver with the hotspots command arguments.'''
+
+        args = dict(larger=0, avg=0.001, agemtime=False, older=0, newer=0, user='', group='',
+                    sort='size', reverse=False, limit=0, format='json', output='')
+        args.update(kwargs)
+        return local_archiver(self.data_dir, **args)
+
+    def query(self, **kwargs):
+        '''- Run a hotspots query and return the parsed output.'''
+
+        arch = self.archiver(**kwargs)
+
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout, \
+                patch('sys.stderr', new_callable=io.StringIO):
+            self.assertTrue(arch.hotspots([self.folder]))
+
+        if arch.args.format == 'csv':
+            return list(csv.reader(io.StringIO(stdout.getvalue())))
+        return json.loads(stdout.getvalue())
+
+    def folders(self, **kwargs):
+        return [os.path.basename(hotspot['Folder']) for hotspot in self.query(**kwargs)]
+
+    def test_json_rows(self):
+        '''- Each hotspot is a JSON object with the columns of the CSV output.'''
+
+        hotspots = self.query()
+        self.assertEqual(len(hotspots), 3)
+
+        big = next(h for h in hotspots if h['Folder'] == os.path.join(self.folder, 'big'))
+        self.assertEqual((big['FileCount'], big['DirSize'], big['MiBAvg']), (2, 2 * MiB, 1))
+
+        header = self.query(format='csv')[0]
+        self.assertEqual(header, list(big.keys()))
+
+    def test_size_filters(self):
+        '''- --larger and --avg select the hotspots by total and average file size.'''
+
+        self.assertEqual(self.folders(), ['big', 'old', 'small'])
+        self.assertEqual(self.folders(larger=0.0001), ['big', 'old'])
+        self.assertEqual(self.folders(larger=1.5 * MiB / 1073741824), ['big'])
+        self.assertEqual(self.folders(avg=0.5), ['big', 'old'])
+        self.assertEqual(self.folders(larger=1), [])
+
+    def test_age_filters(self):
+        '''- --older and --newer select the hotspots by the newest access in the folder.'''
+
+        self.assertEqual(self.folders(older=365), ['old'])
+        self.assertEqual(self.folders(older=365, agemtime=True), ['old'])
+        self.assertEqual(self.folders(newer=30), ['big', 'small'])
+        self.assertEqual(self.folders(older=500), [])
+
+    def test_owner_filters(self):
+        '''- --user and --group take names or ids.'''
+
+        self.assertEqual(len(self.folders(user=str(os.getuid()))), 3)
+        self.assertEqual(len(self.folders(group=str(os.getgid()))), 3)
+        self.assertEqual(self.folders(user=str(os.getuid() + 12345)), [])
+
+        arch = self.archiver(user='no-such-froster-user')
+        with patch('sys.stdout', new_callable=io.StringIO), \
+                patch('sys.stderr', new_callable=io.StringIO):
+            self.assertFalse(arch.hotspots([self.folder]))
+
+    def test_sort_and_limit(self):
+        '''- The hotspots are sorted and limited.'''
+
+        self.assertEqual(self.folders(sort='folder'), ['big', 'old', 'small'])
+        self.assertEqual(self.folders(sort='folder', reverse=True), ['small', 'old', 'big'])
+        self.assertEqual(self.folders(sort='age'), ['old', 'big', 'small'])
+        self.assertEqual(self.folders(limit=1), ['big'])
+
+    def test_output_file(self):
+        '''- The hotspots are written to the output file, an empty result is an empty list.'''
+
+        for larger, count in ((0, 3), (1, 0)):
+            output = os.path.join(self.data_dir, 'hotspots.json')
+            arch = self.archiver(larger=larger, output=output)
+
+            with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+                self.assertTrue(arch.hotspots([self.folder]))
+            self.assertIn(f'{count} hotspots', stdout.getvalue())
+
+            with open(output) as f:
+                self.assertEqual(len(json.load(f)), count)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
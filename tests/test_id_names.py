@@ -0,0 +1,159 @@
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import froster.froster as froster
+from froster.froster import IDNameCache
+from tests.helpers import local_archiver
+
+PASSWD = ('root:x:0:0:root:/root:/bin/bash\n'
+          'alice:x:1000:1000::/home/alice:/bin/sh\n'
+          'bob:x:1001:1001::/home/bob:/bin/sh\n'
+          'broken line\n'
+          '+nis:x:::::\n')
+
+
+def fake_lookup(names):
+    '''- A pwd.getpwuid like lookup of the given names that counts the calls.'''
+
+    def lookup(id):
+        if id not in names:
+            raise KeyError(f'getpwuid(): uid not found: {id}')
+        return (names[id],)
+
+    return MagicMock(side_effect=lookup)
+
+
+def getent(stdout, returncode=0):
+    '''- Result of a getent call.'''
+
+    return subprocess.CompletedProcess(['getent'], returncode, stdout=stdout, stderr='')
+
+
+class TestIDNameCache(unittest.TestCase):
+    '''Test the uid/gid to name cache.'''
+
+    def test_lookup_once(self):
+        '''- A name is looked up once, then served from the cache.'''
+
+        lookup = fake_lookup({1000: 'alice'})
+        cache = IDNameCache(lookup, 'passwd')
+
+        self.assertEqual([cache.get(1000) for _ in range(3)], ['alice'] * 3)
+        lookup.assert_called_once_with(1000)
+
+    def test_unknown_id(self):
+        '''- An unknown id is None and the miss is cached, an id that is not a number as well.'''
+
+        lookup = fake_lookup({})
+        cache = IDNameCache(lookup, 'passwd')
+
+        self.assertIsNone(cache.get(4242424))
+        self.assertIsNone(cache.get(4242424))
+        self.assertEqual(lookup.call_count, 1)
+
+        lookup.side_effect = OverflowError('uid too large')
+        self.assertIsNone(cache.get(2 ** 64))
+        self.assertIsNone(cache.get(2 ** 64))
+        self.assertEqual(lookup.call_count, 2)
+
+    def test_lru_eviction(self):
+        '''- The least recently used ids are evicted past maxsize.'''
+
+        lookup = fake_lookup({1: 'a', 2: 'b', 3: 'c', 4: 'd'})
+        cache = IDNameCache(lookup, 'passwd', maxsize=3)
+
+        for id in (1, 2, 3):
+            cache.get(id)
+
+        # 1 becomes the most recently used, 2 is evicted by 4
+        cache.get(1)
+        cache.get(4)
+        self.assertEqual(list(cache.names), [3, 1, 4])
+
+        lookup.reset_mock()
+        self.assertEqual(cache.get(1), 'a')
+        lookup.assert_not_called()
+
+        # 2 is looked up again and evicts 3
+        self.assertEqual(cache.get(2), 'b')
+        lookup.assert_called_once_with(2)
+        self.assertEqual(list(cache.names), [4, 1, 2])
+
+    def test_preload(self):
+        '''- The preload reads the getent database once, the names are then not looked up.'''
+
+        lookup = fake_lookup({})
+        cache = IDNameCache(lookup, 'passwd')
+
+        with patch('subprocess.run', return_value=getent(PASSWD)) as run:
+            self.assertTrue(cache.preload())
+            self.assertTrue(cache.preload())
+
+        run.assert_called_once()
+        self.assertEqual(run.call_args.args[0], ['getent', 'passwd'])
+        self.assertEqual(dict(cache.names), {0: 'root', 1000: 'alice', 1001: 'bob'})
+
+        self.assertEqual((cache.get(0), cache.get(1001)), ('root', 'bob'))
+        lookup.assert_not_called()
+
+        # An id missing from the database is still looked up
+        self.assertIsNone(cache.get(1002))
+        lookup.assert_called_once_with(1002)
+
+    def test_preload_eviction(self):
+        '''- A preload larger than maxsize keeps the last entries.'''
+
+        cache = IDNameCache(fake_lookup({}), 'passwd', maxsize=2)
+        with patch('subprocess.run', return_value=getent(PASSWD)):
+            self.assertTrue(cache.preload())
+
+        self.assertEqual(list(cache.names), [1000, 1001])
+
+    def test_preload_failure(self):
+        '''- A failed getent leaves the cache to the single lookups and can be retried.'''
+
+        lookup = fake_lookup({1000: 'alice'})
+        cache = IDNameCache(lookup, 'passwd')
+
+        with patch('subprocess.run', return_value=getent('', returncode=2)):
+            self.assertFalse(cache.preload())
+        with patch('subprocess.run', side_effect=FileNotFoundError('getent')):
+            self.assertFalse(cache.preload())
+
+        self.assertFalse(cache.is_preloaded)
+        self.assertEqual(cache.get(1000), 'alice')
+
+        with patch('subprocess.run', return_value=getent(PASSWD)) as run:
+            self.assertTrue(cache.preload())
+        run.assert_called_once()
+
+
+class TestArchiverNames(unittest.TestCase):
+    '''Test the owner names of the archiver.'''
+
+    def setUp(self):
+        '''- Create the archiver.'''
+
+        self.data_dir = tempfile.mkdtemp(prefix='froster_data_')
+        self.arch = local_archiver(self.data_dir)
+
+    def tearDown(self):
+        '''- Remove the temporary folder.'''
+
+        shutil.rmtree(self.data_dir)
+
+    def test_unknown_ids(self):
+        '''- An id without a name stays a number.'''
+
+        with patch.object(froster, 'user_names', IDNameCache(fake_lookup({1000: 'alice'}), 'passwd')), \
+                patch.object(froster, 'group_names', IDNameCache(fake_lookup({}), 'group')):
+            self.assertEqual(self.arch.uid2user(1000), 'alice')
+            self.assertEqual(self.arch.uid2user(4242424), 4242424)
+            self.assertEqual(self.arch.gid2group(4242424), 4242424)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
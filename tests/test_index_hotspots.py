@@ -0,0 +1,218 @@
+import csv
+import datetime
+import io
+import os
+import shutil
+import stat
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from tests.helpers import local_archiver
+
+GiB = 1073741824
+MiB = 1048576
+DAY = 86400
+
+TOP = '/fixture'
+
+# User and group ids, an id without a name stays a number
+UNKNOWN_ID = 4242424
+
+PWALK_HEADER = b'inode,parent-inode,directory-depth,"filename","fileExtension",UID,GID,st_size,st_dev,st_blocks,st_nlink,"st_mode",st_atime,st_mtime,st_ctime,pw_fcount,pw_dirsum\n'
+
+
+def pwalk_fixture(now):
+    '''Folders and files of the fixed pwalk output, times are days ago
+
+    Folders are (inode, parent inode, name, uid, atime, mtime, file count, size),
+    files are (inode, parent inode, name, atime, mtime).'''
+
+    folders = [
+        # Too small
+        (1, 0, TOP, 0, 1, 1, 1, 1000),
+        # Ages of the newest file access and modification: 40 and 500 days
+        (2, 1, f'{TOP}/big', 0, 1, 1, 2, 5 * GiB),
+        # Files too small on average
+        (3, 1, f'{TOP}/many', 0, 1, 1, 100, 2 * GiB),
+        # The froster files do not count for the ages
+        (4, 1, f'{TOP}/old', UNKNOWN_ID, 1, 1, 1, GiB + GiB // 2),
+        # Only froster files, the ages are those of the folder
+        (5, 1, f'{TOP}/archived', 0, 200, 300, 1, 3 * GiB),
+        # Exactly the size threshold, a name that is not UTF-8
+        (6, 1, f'{TOP}/caf\xe9', UNKNOWN_ID, 1, 1, 1, GiB),
+        # Just below the size threshold
+        (7, 1, f'{TOP}/tiny', 0, 1, 1, 1, GiB - 1),
+    ]
+    files = [
+        (100, 1, f'{TOP}/readme.txt', 5, 5),
+        (200, 2, f'{TOP}/big/a.dat', 400, 500),
+        (201, 2, f'{TOP}/big/b.dat', 40, 800),
+        (300, 3, f'{TOP}/many/c.dat', 2, 2),
+        (400, 4, f'{TOP}/old/d.dat', 4000, 4000),
+        (401, 4, f'{TOP}/old/Froster.allfiles.csv', 0, 0),
+        (500, 5, f'{TOP}/archived/.froster.md5sum', 0, 0),
+        (600, 6, f'{TOP}/caf\xe9/e.dat', 10, 3000),
+        (700, 7, f'{TOP}/tiny/f.dat', 6000, 6000),
+    ]
+
+    def ago(days):
+        return int(now - days * DAY - 3600)
+
+    lines = [PWALK_HEADER]
+    for inode, parent, name, uid, atime, mtime, fcount, dirsum in folders:
+        depth = name.count('/') - 1
+        lines.append(f'{inode},{parent},{depth},"{name}","",{uid},{uid},4096,1,8,2,"40755",'
+                     f'{ago(atime)},{ago(mtime)},{ago(mtime)},{fcount},{dirsum}\n'.encode('latin-1'))
+    for inode, parent, name, atime, mtime in files:
+        depth = name.count('/') - 2
+        ext = os.path.splitext(name)[1].lstrip('.')
+        lines.append(f'{inode},{parent},{depth},"{name}","{ext}",0,0,100,1,8,1,"100644",'
+                     f'{ago(atime)},{ago(mtime)},{ago(mtime)},-1,0\n'.encode('latin-1'))
+
+    return b''.join(lines)
+
+
+def legacy_hotspots(arch, pwalk_csv, now):
+    '''Hotspots computed like the indexing before DuckDB did the analysis
+
+    Every folder is read back, filtered on the thresholds row by row, and the ages
+    come from the newest file times of each folder (the folder times if none).'''
+
+    rows = list(csv.reader(io.StringIO(pwalk_csv.decode('latin-1'))))[1:]
+    folders = [r for r in rows if int(r[15]) > -1 and int(r[16]) > 0]
+    files = [r for r in rows if int(r[15]) == -1]
+
+    def daysago(unixtime):
+        return (datetime.datetime.fromtimestamp(now) - datetime.datetime.fromtimestamp(unixtime)).days
+
+    def owner(lookup, owner_id):
+        return str(lookup(int(owner_id)))
+
+    hotspots = []
+    for r in sorted(folders, key=lambda r: -int(r[16])):
+        dirsum, fcount = int(r[16]), int(r[15])
+        if dirsum / GiB < arch.thresholdGB or dirsum / MiB / fcount < arch.thresholdMB:
+            continue
+
+        folder_files = [f for f in files if f[1] == r[0] and os.path.basename(f[3]) not in arch.dirmetafiles]
+        atime = max((int(f[12]) for f in folder_files), default=int(r[12]))
+        mtime = max((int(f[13]) for f in folder_files), default=int(r[13]))
+
+        hotspots.append([owner(arch.uid2user, r[5]), str(daysago(atime)), str(daysago(mtime)),
+                         str(dirsum // GiB), str(dirsum // MiB // fcount), r[3],
+                         owner(arch.gid2group, r[6]), str(dirsum // (1024 * GiB)), r[15], r[16]])
+
+    return len(folders), hotspots
+
+
+class TestIndexHotspots(unittest.TestCase):
+    '''Test the hotspots written from a fixed pwalk output.'''
+
+    def setUp(self):
+        '''- Install a pwalk that prints the fixture and index it.'''
+
+        self.data_dir = tempfile.mkdtemp(prefix='froster_data_')
+        self.now = time.time()
+        self.pwalk_csv = pwalk_fixture(self.now)
+
+        fixture = os.path.join(self.data_dir, 'pwalk.csv')
+        with open(fixture, 'wb') as f:
+            f.write(self.pwalk_csv)
+
+        pwalk = os.path.join(self.data_dir, 'pwalk')
+        with open(pwalk, 'w') as f:
+            f.write(f'#!/bin/sh\ncat "{fixture}"\n')
+        os.chmod(pwalk, os.stat(pwalk).st_mode | stat.S_IXUSR)
+
+        self.pwalkcopy = os.path.join(self.data_dir, 'pwalkcopy')
+        os.mkdir(self.pwalkcopy)
+
+        self.arch = local_archiver(self.data_dir, scanner='pwalk', pwalkcopy=self.pwalkcopy)
+        self.arch.thresholdGB = 1
+        self.arch.thresholdMB = 100
+
+        self.summary = {}
+        with patch('sys.stdout', new_callable=io.StringIO), patch('time.time', return_value=self.now):
+            self.assertTrue(self.arch._index_locally(TOP, summary=self.summary))
+
+    def tearDown(self):
+        '''- Remove the temporary folder.'''
+
+        shutil.rmtree(self.data_dir)
+
+    def read_hotspots(self):
+        '''- Rows of the hotspots CSV file, header first.'''
+
+        with open(self.arch.get_hotspots_path(TOP), newline='') as f:
+            return list(csv.reader(f))
+
+    def test_columns(self):
+        '''- The hotspots file has the columns of the pandas era file.'''
+
+        self.assertEqual(self.read_hotspots()[0],
+                         ['User', 'AccD', 'ModD', 'GiB', 'MiBAvg', 'Folder', 'Group', 'TiB', 'FileCount', 'DirSize'])
+
+    def test_rows(self):
+        '''- The thresholds, ages, owners and order are those of the row by row processing.'''
+
+        numfolders, expected = legacy_hotspots(self.arch, self.pwalk_csv, self.now)
+        rows = self.read_hotspots()[1:]
+
+        self.assertEqual(rows, expected)
+        self.assertEqual([os.path.basename(row[5]) for row in rows], ['big', 'archived', 'old', 'caf\xe9'])
+
+        big, archived, old, cafe = rows
+        self.assertEqual(big[1:5], ['40', '500', '5', '2560'])
+        self.assertEqual(archived[1:3], ['200', '300'])
+        self.assertEqual(old[1:3], ['4000', '4000'])
+        self.assertEqual((old[0], old[6]), (str(UNKNOWN_ID), str(UNKNOWN_ID)))
+        self.assertEqual(cafe[3:5], ['1', '1024'])
+
+        self.assertEqual(self.summary['folders'], numfolders)
+        self.assertEqual(self.summary['hotspots'], 4)
+        self.assertEqual(self.summary['totalbytes'], sum(int(row[9]) for row in expected))
+
+    def test_aged_bytes(self):
+        '''- The bytes not accessed for each age are the sizes of the hotspots older than the age.'''
+
+        _, expected = legacy_hotspots(self.arch, self.pwalk_csv, self.now)
+        self.assertEqual(self.summary['agedbytes'],
+                         [sum(int(row[9]) for row in expected if int(row[1]) > days)
+                          for days in self.arch.daysaged])
+
+    def test_hotspots_query(self):
+        '''- The hotspots command gives the same rows from the stored index, with other thresholds.'''
+
+        output = os.path.join(self.data_dir, 'query.csv')
+        arch = local_archiver(self.data_dir, larger=2, avg=0, agemtime=False, older=0, newer=0, user='',
+                              group='', sort='size', reverse=False, limit=0, format='csv', output=output)
+        arch.thresholdGB = 2
+        arch.thresholdMB = 0.001
+
+        with patch('sys.stdout', new_callable=io.StringIO), patch('time.time', return_value=self.now):
+            self.assertTrue(arch.hotspots([TOP]))
+
+        with open(output, newline='') as f:
+            rows = list(csv.reader(f))
+
+        _, expected = legacy_hotspots(arch, self.pwalk_csv, self.now)
+        self.assertEqual(rows[0], self.read_hotspots()[0])
+        self.assertEqual(rows[1:], expected)
+        self.assertEqual([os.path.basename(row[5]) for row in rows[1:]], ['big', 'archived', 'many'])
+
+    def test_pwalk_copy(self):
+        '''- The exported copy of the index has the rows of the pwalk output, as UTF-8.'''
+
+        copy_path = os.path.join(self.pwalkcopy, TOP.replace('/', '+') + '.csv')
+        with open(copy_path, newline='', encoding='utf-8') as f:
+            copy = list(csv.reader(f))
+
+        expected = list(csv.reader(io.StringIO(self.pwalk_csv.decode('latin-1'))))
+        self.assertEqual(copy[0], expected[0])
+        self.assertEqual(sorted(copy[1:]), sorted(expected[1:]))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,125 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import duckdb
+
+from froster.froster import FileSystemScanner, IndexStats
+from tests.helpers import local_archiver
+
+
+class TestIndexRefresh(unittest.TestCase):
+    '''Test that refreshing an index gives the same store as a full scan.'''
+
+    def setUp(self):
+        '''- Create a tree of folders and index it.'''
+
+        self.data_dir = tempfile.mkdtemp(prefix='froster_data_')
+        self.folder = tempfile.mkdtemp(prefix='froster_')
+
+        for path, size in (('a/f1', 10), ('a/f2', 20), ('a/sub/f3', 30), ('b/f4', 40),
+                           ('b/deep/deeper/f5', 50), ('c/f6', 60), ('a/a "quoted", name/f9', 90)):
+            self.write(path, size)
+
+        # The stored modification times are in seconds, the changes are made later
+        past = time.time() - 3600
+        for root, dirs, files in os.walk(self.folder):
+            for name in dirs + files:
+                os.utime(os.path.join(root, name), (past, past))
+        os.utime(self.folder, (past, past))
+
+        self.arch = local_archiver(self.data_dir)
+        self.index_store = os.path.join(self.data_dir, 'index.parquet')
+        self.scan(self.index_store)
+
+    def tearDown(self):
+        '''- Remove the temporary folders.'''
+
+        shutil.rmtree(self.folder)
+        shutil.rmtree(self.data_dir)
+
+    def write(self, path, size):
+        '''- Write a file of the given size below the folder.'''
+
+        path = os.path.join(self.folder, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+
+    def scan(self, index_store):
+        '''- Scan the folder into the index store, returns the stats of the scan.'''
+
+        stats = IndexStats(self.folder, os.path.join(self.data_dir, 'scan.json'))
+        with patch('sys.stdout', new_callable=io.StringIO):
+            self.assertEqual(self.arch._index_scan(self.folder, index_store, 1, stats), (True, False))
+        return stats
+
+    def refresh(self):
+        '''- Refresh the index store, returns the stats and the folders that were listed again.'''
+
+        stats = IndexStats(self.folder, os.path.join(self.data_dir, 'refresh.json'))
+        with patch('sys.stdout', new_callable=io.StringIO), \
+                patch.object(FileSystemScanner, 'list_folder', autospec=True,
+                             side_effect=FileSystemScanner.list_folder) as list_folder:
+            self.assertEqual(self.arch._index_refresh(self.folder, self.index_store, stats), (True, False))
+        return stats, sorted(os.path.relpath(call.args[1], self.folder) for call in list_folder.call_args_list)
+
+    def rows(self, index_store):
+        '''- Rows of an index store, without the access times.'''
+
+        connection = duckdb.connect(':memory:')
+        rows = connection.execute(f"""SELECT filename, inode, parent_inode, depth, st_size, st_mtime,
+                                             pw_fcount, pw_dirsum
+                                      FROM read_parquet('{index_store}')
+                                      ORDER BY filename""").fetchall()
+        connection.close()
+        return rows
+
+    def check_refresh(self):
+        '''- Refresh the index and compare it and its stats with a full scan (--force).'''
+
+        stats, listed = self.refresh()
+
+        full_scan = os.path.join(self.data_dir, 'full.parquet')
+        full_stats = self.scan(full_scan)
+
+        self.assertEqual(self.rows(self.index_store), self.rows(full_scan))
+        self.assertEqual((stats.dirs, stats.files, stats.bytes),
+                         (full_stats.dirs, full_stats.files, full_stats.bytes))
+        return listed
+
+    def test_unchanged(self):
+        '''- A tree without changes is not listed again.'''
+
+        self.assertEqual(self.check_refresh(), [])
+
+    def test_changed_folders(self):
+        '''- Changed, new and removed folders are rescanned, the unchanged ones are reused.'''
+
+        # A new file, a removed subtree and a new subfolder
+        self.write('a/f7', 70)
+        shutil.rmtree(os.path.join(self.folder, 'b', 'deep'))
+        self.write('c/new/f8', 80)
+
+        self.assertEqual(self.check_refresh(), ['a', 'b', 'c', 'c/new'])
+
+        names = [os.path.relpath(row[0], self.folder) for row in self.rows(self.index_store)]
+        self.assertIn('a/f7', names)
+        self.assertIn('c/new/f8', names)
+        self.assertNotIn('b/deep', names)
+        self.assertNotIn('b/deep/deeper/f5', names)
+
+    def test_removed_top_folder(self):
+        '''- A removed subtree below the top folder is dropped with all its rows.'''
+
+        shutil.rmtree(os.path.join(self.folder, 'b'))
+
+        self.assertEqual(self.check_refresh(), ['.'])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,119 @@
+import csv
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from froster.froster import get_fast_hash
+from tests.helpers import local_archiver
+
+
+class TestManifest(unittest.TestCase):
+    '''Test the manifest written with the md5sums and its verification.'''
+
+    def setUp(self):
+        '''- Create a folder with some files and a data folder for the checksum cache.'''
+
+        self.data_dir = tempfile.mkdtemp(prefix='froster_data_')
+        self.folder = tempfile.mkdtemp(prefix='froster_')
+        for i in range(20):
+            with open(os.path.join(self.folder, f'file{i:02d}'), 'wb') as f:
+                f.write(os.urandom(100 * i))
+
+    def tearDown(self):
+        '''- Remove the temporary folders.'''
+
+        shutil.rmtree(self.folder)
+        shutil.rmtree(self.data_dir)
+
+    def write_manifest(self, arch):
+        '''- Write the md5sums and the manifest of the folder.'''
+
+        self.assertTrue(arch._gen_md5sums(self.folder, arch.md5sum_filename))
+        self.assertTrue(os.path.isfile(
+            os.path.join(self.folder, arch.manifest_filename)))
+
+    def test_manifest_rows(self):
+        '''- The manifest lists each file with its size and checksums, not the froster files.'''
+
+        arch = local_archiver(self.data_dir, fast_hash_algorithm='sha256')
+        self.write_manifest(arch)
+
+        with open(os.path.join(self.folder, arch.manifest_filename), newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            rows = {row[0]: row for row in reader}
+
+        self.assertEqual(header[4], 'sha256')
+        self.assertEqual(sorted(rows), [f'file{i:02d}' for i in range(20)])
+        self.assertEqual(rows['file03'][1], '300')
+
+    def test_unchanged(self):
+        '''- A folder that did not change is verified, with and without the checksum cache.'''
+
+        for nochecksumcache in (False, True):
+            arch = local_archiver(self.data_dir, fast_hash_algorithm='sha256',
+                                  nochecksumcache=nochecksumcache)
+            self.write_manifest(arch)
+            self.assertTrue(arch._verify_manifest(self.folder))
+
+    def test_no_manifest(self):
+        '''- A folder without a manifest cannot be verified.'''
+
+        arch = local_archiver(self.data_dir)
+        self.assertIsNone(arch._verify_manifest(self.folder))
+
+    def test_same_size_change_with_mtime_restored(self):
+        '''- A change of the content keeping the size and the mtime is detected.'''
+
+        for fast_hash_algorithm in ('sha256', 'none'):
+            arch = local_archiver(self.data_dir, fast_hash_algorithm=fast_hash_algorithm)
+            self.write_manifest(arch)
+
+            # The files were hashed and cached, the verification reads them from the cache
+            self.assertTrue(arch._verify_manifest(self.folder))
+
+            path = os.path.join(self.folder, 'file05')
+            file_stat = os.stat(path)
+            time.sleep(0.01)
+            with open(path, 'r+b') as f:
+                first = f.read(1)
+                f.seek(0)
+                f.write(bytes([first[0] ^ 0xff]))
+            os.utime(path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+
+            self.assertFalse(arch._verify_manifest(self.folder))
+
+            # Put the original content back for the next algorithm
+            with open(path, 'r+b') as f:
+                f.write(first)
+
+    def test_added_and_removed_files(self):
+        '''- Files added or removed after the manifest was written are detected.'''
+
+        arch = local_archiver(self.data_dir, fast_hash_algorithm='sha256')
+        self.write_manifest(arch)
+
+        with open(os.path.join(self.folder, 'new_file'), 'wb') as f:
+            f.write(b'new')
+        self.assertFalse(arch._verify_manifest(self.folder))
+
+        os.remove(os.path.join(self.folder, 'new_file'))
+        self.assertTrue(arch._verify_manifest(self.folder))
+
+        os.remove(os.path.join(self.folder, 'file07'))
+        self.assertFalse(arch._verify_manifest(self.folder))
+
+    def test_fast_hash_setting(self):
+        '''- The fast hash setting falls back to sha256 for unknown names, auto never picks sha256.'''
+
+        self.assertIsNone(get_fast_hash('none'))
+        self.assertIsNone(get_fast_hash(''))
+        self.assertEqual(get_fast_hash('sha256'), 'sha256')
+        self.assertEqual(get_fast_hash('blake'), 'sha256')
+        self.assertIn(get_fast_hash('auto'), ('blake3', 'xxh3', 'crc32c', None))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,103 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from froster.froster import HashEngine
+from tests.helpers import local_archiver
+
+
+class TestMd5sums(unittest.TestCase):
+    '''Test the md5sums file written for the archived folders.'''
+
+    def setUp(self):
+        '''- Create a folder with more files than hashed at once, a subfolder and symlinks.'''
+
+        self.data_dir = tempfile.mkdtemp(prefix='froster_data_')
+        self.folder = tempfile.mkdtemp(prefix='froster_')
+
+        self.expected = {}
+        for i in range(1500):
+            data = os.urandom(i % 300)
+            with open(os.path.join(self.folder, f'file{i:04d}'), 'wb') as f:
+                f.write(data)
+            self.expected[f'file{i:04d}'] = hashlib.md5(data).hexdigest()
+
+        os.mkdir(os.path.join(self.folder, 'subfolder'))
+        with open(os.path.join(self.folder, 'subfolder', 'nested'), 'wb') as f:
+            f.write(b'nested')
+
+        # A symlink to a file is hashed with the content of its target, a broken one is skipped
+        os.symlink('file0001', os.path.join(self.folder, 'link'))
+        self.expected['link'] = self.expected['file0001']
+        os.symlink('missing', os.path.join(self.folder, 'broken'))
+
+    def tearDown(self):
+        '''- Remove the temporary folders.'''
+
+        shutil.rmtree(self.folder)
+        shutil.rmtree(self.data_dir)
+
+    def read_md5sums(self, arch):
+        '''- Read the md5sums file as a dictionary of file names and checksums.'''
+
+        with open(os.path.join(self.folder, arch.md5sum_filename)) as f:
+            lines = [line.rstrip('\n').split('  ', 1) for line in f]
+        self.assertEqual(len(lines), len({file for _, file in lines}))
+        return {file: checksum for checksum, file in lines}
+
+    def test_md5sums(self):
+        '''- Each file of the folder is listed once with its MD5, not the subfolders or the froster files.'''
+
+        arch = local_archiver(self.data_dir, cores=1, nochecksumcache=True)
+
+        with patch('sys.stdout', new_callable=io.StringIO):
+            self.assertTrue(arch._gen_md5sums(self.folder, arch.md5sum_filename))
+            # The froster files written by the first run are not listed by the second
+            self.assertTrue(arch._gen_md5sums(self.folder, arch.md5sum_filename))
+
+        self.assertEqual(self.read_md5sums(arch), self.expected)
+
+    def test_no_size_lookups(self):
+        '''- The sizes come from the folder listing, not one getsize per file.'''
+
+        arch = local_archiver(self.data_dir, nochecksumcache=True)
+
+        with patch('os.path.getsize', wraps=os.path.getsize) as getsize, \
+                patch('sys.stdout', new_callable=io.StringIO):
+            self.assertTrue(arch._gen_md5sums(self.folder, arch.md5sum_filename))
+
+        self.assertLessEqual(getsize.call_count, 1)
+
+    def test_unchanged_files_are_not_hashed_again(self):
+        '''- With the checksum cache a second run does not read the unchanged files.'''
+
+        arch = local_archiver(self.data_dir)
+
+        with patch('sys.stdout', new_callable=io.StringIO):
+            self.assertTrue(arch._gen_md5sums(self.folder, arch.md5sum_filename))
+
+            with patch.object(HashEngine, 'submit', wraps=None) as submit:
+                self.assertTrue(arch._gen_md5sums(self.folder, arch.md5sum_filename))
+
+        submit.assert_not_called()
+        self.assertEqual(self.read_md5sums(arch), self.expected)
+
+    def test_empty_folder(self):
+        '''- A folder without files has no md5sums file.'''
+
+        empty = os.path.join(self.folder, 'subfolder', 'empty')
+        os.mkdir(empty)
+        arch = local_archiver(self.data_dir, nochecksumcache=True)
+
+        with patch('sys.stdout', new_callable=io.StringIO):
+            self.assertFalse(arch._gen_md5sums(empty, arch.md5sum_filename))
+
+        self.assertFalse(os.path.exists(os.path.join(empty, arch.md5sum_filename)))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,66 @@
+import io
+import random
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from tests.helpers import local_archiver
+
+
+class TestNestedFolders(unittest.TestCase):
+    '''Test the detection of folders inside other folders.'''
+
+    @classmethod
+    def setUpClass(cls):
+        '''- Create the archiver.'''
+
+        cls.data_dir = tempfile.mkdtemp(prefix='froster_data_')
+        cls.arch = local_archiver(cls.data_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        '''- Remove the data folder.'''
+
+        shutil.rmtree(cls.data_dir)
+
+    def test_closest_ancestor_in_any_order(self):
+        '''- Each nested folder is reported once with its closest ancestor, whatever the input order.'''
+
+        folders = ['/data/a', '/data/a/b', '/data/a/b/c', '/data/a/d', '/data/e']
+        expected = [('/data/a', '/data/a/b'), ('/data/a/b', '/data/a/b/c'), ('/data/a', '/data/a/d')]
+
+        for _ in range(10):
+            random.shuffle(folders)
+            self.assertEqual(sorted(self.arch._nested_folders(folders)), sorted(expected))
+
+    def test_common_name_prefix_is_not_nested(self):
+        '''- Folders sharing a name prefix are siblings, not nested.'''
+
+        folders = ['/data/a', '/data/ab', '/data/a-b', '/data/a.b', '/data/a b', '/data/a0']
+        self.assertEqual(self.arch._nested_folders(folders), [])
+
+        # The characters sorted before and after the separator do not split a subtree
+        folders += ['/data/a/b', '/data/a/b0', '/data/a/b/c']
+        self.assertEqual(sorted(self.arch._nested_folders(folders)),
+                         [('/data/a', '/data/a/b'), ('/data/a', '/data/a/b0'), ('/data/a/b', '/data/a/b/c')])
+
+    def test_trailing_separator(self):
+        '''- A trailing separator does not change the nesting.'''
+
+        self.assertEqual(self.arch._nested_folders(['/data/a/', '/data/a/b']),
+                         [('/data/a/', '/data/a/b')])
+        self.assertEqual(self.arch._nested_folders(['/', '/data']), [('/', '/data')])
+
+    def test_recursive_collision(self):
+        '''- Any nested folder is a collision for recursive operations, and it is reported.'''
+
+        with patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            self.assertFalse(self.arch._is_recursive_collision(['/data/a', '/data/b']))
+            self.assertTrue(self.arch._is_recursive_collision(['/data/b/c', '/data/a', '/data/b']))
+
+        self.assertIn('Folder /data/b/c is a subdirectory of folder /data/b.', stderr.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
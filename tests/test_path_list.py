@@ -0,0 +1,73 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from froster.froster import read_path_list
+
+
+class TestPathList(unittest.TestCase):
+    '''Test reading folder lists from a file or the standard input.'''
+
+    def setUp(self):
+        '''- Create a temporary folder for the list files.'''
+
+        self.folder = tempfile.mkdtemp(prefix='froster_')
+
+    def tearDown(self):
+        '''- Remove the temporary folder.'''
+
+        shutil.rmtree(self.folder)
+
+    def read(self, data):
+        '''- Write data to a list file and read it back.'''
+
+        path = os.path.join(self.folder, 'folders.txt')
+        with open(path, 'wb') as f:
+            f.write(data)
+        return list(read_path_list(path))
+
+    def test_one_path_per_line(self):
+        '''- Lines are paths, empty lines and carriage returns are dropped.'''
+
+        self.assertEqual(self.read(b'/data/a\n/data/b c\r\n\n/data/d'),
+                         ['/data/a', '/data/b c', '/data/d'])
+        self.assertEqual(self.read(b'/data/a\n'), ['/data/a'])
+        self.assertEqual(self.read(b'/data/a'), ['/data/a'])
+        self.assertEqual(self.read(b''), [])
+
+    def test_nul_separated(self):
+        '''- With any NUL character the paths are NUL separated and may contain newlines.'''
+
+        self.assertEqual(self.read(b'/data/a\n b\0/data/c\r\0\0/data/d\0'),
+                         ['/data/a\n b', '/data/c\r', '/data/d'])
+        self.assertEqual(self.read(b'/data/a\0'), ['/data/a'])
+
+    def test_undecodable_names(self):
+        '''- Names that are not UTF-8 are read as the file system names.'''
+
+        name = b'/data/caf\xe9'
+        self.assertEqual(self.read(name + b'\0'), [os.fsdecode(name)])
+        self.assertEqual(os.fsencode(self.read(name + b'\n')[0]), name)
+
+    def test_long_list(self):
+        '''- Paths split between the read chunks are joined again.'''
+
+        paths = [f'/data/folder{i:07d}' for i in range(100000)]
+        for separator in ('\n', '\0'):
+            data = separator.join(paths).encode()
+            self.assertGreater(len(data), 1024 * 1024)
+            self.assertEqual(self.read(data), paths)
+
+    def test_stdin(self):
+        '''- The list is read from the standard input with '-'.'''
+
+        stdin = io.TextIOWrapper(io.BytesIO(b'/data/a\0/data/b\0'))
+        with patch('sys.stdin', stdin):
+            self.assertEqual(list(read_path_list('-')), ['/data/a', '/data/b'])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,145 @@
+import csv
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import duckdb
+
+from froster.froster import PermissionEvaluator
+from tests.helpers import local_archiver
+
+# uid and groups of the evaluated user
+UID = 1000
+GROUPS = {100, 200}
+
+# mode, uid, gid, can read, can write
+CASES = [
+    ('0700', UID, 300, True, True),     # owner
+    ('0500', UID, 300, True, False),
+    ('0077', UID, 100, False, False),   # the owner bits apply even if the group ones allow it
+    ('0070', 2000, 100, True, True),    # group
+    ('0750', 2000, 200, True, False),
+    ('0707', 2000, 100, False, False),  # the group bits apply even if the other ones allow it
+    ('0776', 2000, 300, True, True),    # other
+    ('0774', 2000, 300, True, False),
+    ('0003', 2000, 300, False, True),
+    ('40755', 2000, 300, True, False),  # a folder mode of pwalk
+    ('40777', 2000, 300, True, True),
+]
+
+
+def evaluator(uid=UID, groups=GROUPS):
+    '''- Evaluator of a given user, independent of the user running the tests.'''
+
+    permission_evaluator = PermissionEvaluator()
+    permission_evaluator.uid = uid
+    permission_evaluator.groups = set(groups)
+    return permission_evaluator
+
+
+class TestPermissionEvaluator(unittest.TestCase):
+    '''Test the read and write access evaluated from the mode bits.'''
+
+    def test_mode_bits(self):
+        '''- The owner, group or other bits apply depending on the uid and gid.'''
+
+        permission_evaluator = evaluator()
+        for mode, uid, gid, can_read, can_write in CASES:
+            with self.subTest(mode=mode, uid=uid, gid=gid):
+                self.assertEqual(permission_evaluator.can_read(mode, uid, gid), can_read)
+                self.assertEqual(permission_evaluator.can_write(mode, uid, gid), can_write)
+
+                # The mode of os.stat is an integer
+                self.assertEqual(permission_evaluator.can_write(int(mode, 8), uid, gid), can_write)
+
+    def test_sql_can_write(self):
+        '''- The SQL expression gives the same write access as can_write.'''
+
+        permission_evaluator = evaluator()
+        connection = duckdb.connect(':memory:')
+        connection.execute('CREATE TABLE store (st_mode VARCHAR, UID BIGINT, GID BIGINT)')
+        connection.executemany('INSERT INTO store VALUES (?, ?, ?)',
+                               [(mode, uid, gid) for mode, uid, gid, _, _ in CASES])
+
+        rows = connection.execute(f'SELECT st_mode, UID, GID, {permission_evaluator.sql_can_write()} FROM store').fetchall()
+        connection.close()
+
+        self.assertEqual(rows, [(mode, uid, gid, can_write) for mode, uid, gid, _, can_write in CASES])
+
+    def test_root(self):
+        '''- root can read and write everything.'''
+
+        permission_evaluator = evaluator(uid=0, groups={0})
+        self.assertTrue(permission_evaluator.can_read('0000', UID, 100))
+        self.assertTrue(permission_evaluator.can_write('0000', UID, 100))
+        self.assertEqual(permission_evaluator.sql_can_write(), 'TRUE')
+
+
+class TestStoredWriteAccess(unittest.TestCase):
+    '''Test filtering the hotspot folders with the stat data of the index store.'''
+
+    def setUp(self):
+        '''- Create a hotspots file and its index store, a folder writable from the mode bits and one not.'''
+
+        self.data_dir = tempfile.mkdtemp(prefix='froster_data_')
+        self.arch = local_archiver(self.data_dir)
+        self.arch.cfg.whoami = 'tester'
+
+        self.hotspot_csv = os.path.join(self.data_dir, 'hotspots', 'folders.csv')
+        os.makedirs(os.path.dirname(self.hotspot_csv))
+        self.folders = {'/data/writable': '40700', '/data/acl': '40500', '/data/unknown': None}
+
+        with open(self.hotspot_csv, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['User', 'AccD', 'ModD', 'GiB', 'MiBAvg', 'Folder', 'Group', 'TiB', 'FileCount', 'DirSize'])
+            for folder in self.folders:
+                writer.writerow(['tester', 100, 100, 1, 1, folder, 'group', 0.001, 1, 1073741824])
+
+        connection = duckdb.connect(':memory:')
+        connection.execute('CREATE TABLE store (filename VARCHAR, st_mode VARCHAR, UID BIGINT, GID BIGINT, pw_fcount BIGINT)')
+        connection.executemany('INSERT INTO store VALUES (?, ?, ?, ?, ?)',
+                               [(folder, mode, UID, 300, 1)
+                                for folder, mode in self.folders.items() if mode])
+        connection.execute(f"COPY store TO '{os.path.splitext(self.hotspot_csv)[0]}.parquet' (FORMAT PARQUET)")
+        connection.close()
+
+    def tearDown(self):
+        '''- Remove the temporary folder.'''
+
+        shutil.rmtree(self.data_dir)
+
+    def filter(self, writable):
+        '''- Filter the hotspots as the user UID, os.access grants write access to the given folders.'''
+
+        with patch('os.geteuid', return_value=UID), patch('os.getegid', return_value=100), \
+                patch('os.getgroups', return_value=sorted(GROUPS)), \
+                patch('os.access', side_effect=lambda path, mode: path in writable) as access, \
+                patch('sys.stdout', new_callable=io.StringIO):
+            user_csv, _ = self.arch._filter_hotspots_by_write_access(self.hotspot_csv)
+
+        with open(user_csv, newline='') as f:
+            folders = [row['Folder'] for row in csv.DictReader(f)]
+        return folders, sorted(call.args[0] for call in access.call_args_list)
+
+    def test_acl_fallback(self):
+        '''- A folder not writable from its mode bits is checked live, as an ACL may allow writing.'''
+
+        folders, checked = self.filter({'/data/acl', '/data/unknown'})
+        self.assertEqual(folders, list(self.folders))
+
+        # The folder writable from its mode bits is not checked again
+        self.assertEqual(checked, ['/data/acl', '/data/unknown'])
+
+    def test_not_writable(self):
+        '''- The folders that are not writable live are dropped.'''
+
+        folders, checked = self.filter(set())
+        self.assertEqual(folders, ['/data/writable'])
+        self.assertEqual(checked, ['/data/acl', '/data/unknown'])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
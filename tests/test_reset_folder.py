@@ -0,0 +1,140 @@
+import hashlib
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from tests.helpers import local_archiver
+
+
+class FakeUpload(io.RawIOBase):
+    '''In memory stand-in for the streamed upload of the small files tar'''
+
+    def __init__(self):
+        self.data = io.BytesIO()
+        self.md5 = None
+        self.is_aborted = False
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        return self.data.write(b)
+
+    def close(self):
+        self.md5 = hashlib.md5(self.data.getvalue()).hexdigest()
+        super().close()
+
+    def abort(self):
+        self.is_aborted = True
+
+
+class TestResetFolder(unittest.TestCase):
+    '''Test resetting a folder before it is archived again.'''
+
+    def setUp(self):
+        '''- Create a folder with small and large files.'''
+
+        self.data_dir = tempfile.mkdtemp(prefix='froster_data_')
+        self.folder = tempfile.mkdtemp(prefix='froster_')
+        self.small = {f'small{i}': os.urandom(100) for i in range(5)}
+        for name, data in self.small.items():
+            with open(os.path.join(self.folder, name), 'wb') as f:
+                f.write(data)
+        with open(os.path.join(self.folder, 'large'), 'wb') as f:
+            f.write(os.urandom(2 * 1048576))
+
+        self.arch = local_archiver(self.data_dir, force=True, stream=True)
+
+    def tearDown(self):
+        '''- Remove the temporary folders.'''
+
+        shutil.rmtree(self.folder)
+        shutil.rmtree(self.data_dir)
+
+    def stream_tar(self):
+        '''- Tar the small files into a streamed upload and list the tar in the md5sums.'''
+
+        upload = FakeUpload()
+        tarred_paths = []
+        with patch('sys.stdout', new_callable=io.StringIO):
+            self.assertTrue(self.arch._gen_allfiles_and_tar(
+                self.folder, self.arch.thresholdKB, True, upload, tarred_paths))
+
+        self.assertEqual(sorted(os.path.basename(p) for p in tarred_paths), sorted(self.small))
+        with open(os.path.join(self.folder, self.arch.md5sum_filename), 'w') as f:
+            f.write(f'{upload.md5}  {self.arch.smallfiles_tar_filename}\n')
+
+        return upload, tarred_paths
+
+    def reset(self):
+        '''- Reset the folder, returns the result and the output.'''
+
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            res = self.arch.reset_folder(self.folder)
+        return res, stdout.getvalue()
+
+    def test_streamed_tar_only_in_s3(self):
+        '''- A folder whose small files are only in the streamed tar is not reset.'''
+
+        _, tarred_paths = self.stream_tar()
+
+        # The archive was verified, the tarred small files were removed
+        for file_path in tarred_paths:
+            os.remove(file_path)
+
+        res, output = self.reset()
+        self.assertFalse(res)
+        self.assertIn('is only in S3', output)
+
+        # Nothing was removed, so the folder can still be restored
+        for file in (self.arch.md5sum_filename, self.arch.allfiles_csv_filename):
+            self.assertTrue(os.path.isfile(os.path.join(self.folder, file)))
+
+        # archive --force stops before anything is uploaded
+        with patch('sys.stdout', new_callable=io.StringIO), \
+                patch.object(self.arch, '_s3_upload') as s3_upload:
+            self.assertFalse(self.arch._archive_locally(
+                self.folder, ':s3:bucket/folder', True, True))
+        s3_upload.assert_not_called()
+
+    def test_failed_streamed_archive(self):
+        '''- A streamed archive that was not verified keeps its small files and can be reset.'''
+
+        self.stream_tar()
+
+        res, _ = self.reset()
+        self.assertTrue(res)
+
+        for name, data in self.small.items():
+            with open(os.path.join(self.folder, name), 'rb') as f:
+                self.assertEqual(f.read(), data)
+        for file in self.arch.dirmetafiles:
+            self.assertFalse(os.path.exists(os.path.join(self.folder, file)))
+
+    def test_local_tar(self):
+        '''- The small files of a local tar are untarred.'''
+
+        arch = local_archiver(self.data_dir)
+        with patch('sys.stdout', new_callable=io.StringIO):
+            self.assertTrue(arch._gen_allfiles_and_tar(self.folder, arch.thresholdKB, True))
+
+        tar_path = os.path.join(self.folder, arch.smallfiles_tar_filename)
+        with tarfile.open(tar_path) as tar:
+            self.assertEqual(sorted(tar.getnames()), sorted(self.small))
+        with open(os.path.join(self.folder, arch.md5sum_filename), 'w') as f:
+            f.write(f'0123  {arch.smallfiles_tar_filename}\n')
+
+        res, _ = self.reset()
+        self.assertTrue(res)
+        self.assertFalse(os.path.exists(tar_path))
+        for name, data in self.small.items():
+            with open(os.path.join(self.folder, name), 'rb') as f:
+                self.assertEqual(f.read(), data)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,286 @@
+import base64
+import hashlib
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+import boto3
+from botocore.stub import ANY, Stubber
+
+from froster.froster import S3MultipartUpload
+from tests.helpers import local_archiver
+
+
+def md5sum(path):
+    '''MD5 (hex) of a file with the md5sum command, or hashlib if it is not installed'''
+
+    if shutil.which('md5sum'):
+        return subprocess.run(['md5sum', path], stdout=subprocess.PIPE, text=True,
+                              check=True).stdout.split()[0]
+    with open(path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def content_md5(data):
+    return base64.b64encode(hashlib.md5(data).digest()).decode()
+
+
+class FakeS3Client:
+    '''In memory S3 client with the calls used by S3MultipartUpload'''
+
+    def __init__(self, fail_key=None):
+        self.lock = threading.Lock()
+        self.objects = {}
+        self.uploads = {}
+        self.aborted = []
+        self.fail_key = fail_key
+
+    def create_multipart_upload(self, Bucket, Key):
+        with self.lock:
+            upload_id = f'upload{len(self.uploads)}'
+            self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, ContentMD5):
+        if Key == self.fail_key:
+            raise ConnectionError(f'Cannot upload {Key}')
+        if ContentMD5 != content_md5(Body):
+            raise ValueError('BadDigest')
+        self.uploads[UploadId][PartNumber] = Body
+        return {'ETag': f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        uploaded = self.uploads.pop(UploadId)
+        parts = [uploaded[part['PartNumber']] for part in MultipartUpload['Parts']]
+        self.objects[(Bucket, Key)] = {'Body': b''.join(parts), 'Metadata': {}}
+        digests = b''.join(hashlib.md5(part).digest() for part in parts)
+        return {'ETag': f'"{hashlib.md5(digests).hexdigest()}-{len(parts)}"'}
+
+    def put_object(self, Bucket, Key, Body, ContentMD5, Metadata, StorageClass=None):
+        if Key == self.fail_key:
+            raise ConnectionError(f'Cannot upload {Key}')
+        if ContentMD5 != content_md5(Body):
+            raise ValueError('BadDigest')
+        self.objects[(Bucket, Key)] = {'Body': Body, 'Metadata': Metadata,
+                                       'StorageClass': StorageClass}
+        return {'ETag': f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    def copy(self, CopySource, Bucket, Key, ExtraArgs):
+        source = self.objects[(CopySource['Bucket'], CopySource['Key'])]
+        self.objects[(Bucket, Key)] = {'Body': source['Body'], 'Metadata': ExtraArgs['Metadata'],
+                                       'StorageClass': ExtraArgs.get('StorageClass')}
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': len(self.objects[(Bucket, Key)]['Body'])}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId, None)
+        self.aborted.append(Key)
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+        self.aborted.append(Key)
+
+
+class TestS3MultipartUpload(unittest.TestCase):
+    '''Test the streamed upload of an object with the S3 calls it makes.'''
+
+    def setUp(self):
+        '''- Create a stubbed S3 client.'''
+
+        self.s3_client = boto3.client('s3', region_name='us-west-2', aws_access_key_id='test',
+                                      aws_secret_access_key='test')
+        self.stubber = Stubber(self.s3_client)
+        self.stubber.activate()
+
+    def tearDown(self):
+        '''- Deactivate the stubbed client.'''
+
+        self.stubber.deactivate()
+
+    def test_multipart_upload(self):
+        '''- Full parts are uploaded with their MD5, the object is copied in place with its MD5 metadata.'''
+
+        data = os.urandom(20)
+        parts = [data[:8], data[8:16], data[16:]]
+        key = {'Bucket': 'bucket', 'Key': 'archive/Froster.smallfiles.tar'}
+        md5chksum = content_md5(data)
+
+        self.stubber.add_response('create_multipart_upload', {'UploadId': 'id'}, key)
+        for number, part in enumerate(parts, 1):
+            self.stubber.add_response('upload_part', {'ETag': f'"{hashlib.md5(part).hexdigest()}"'},
+                                      {**key, 'UploadId': 'id', 'PartNumber': number, 'Body': part,
+                                       'ContentMD5': content_md5(part)})
+        digests = b''.join(hashlib.md5(part).digest() for part in parts)
+        self.stubber.add_response('complete_multipart_upload',
+                                  {'ETag': f'"{hashlib.md5(digests).hexdigest()}-3"'},
+                                  {**key, 'UploadId': 'id',
+                                   'MultipartUpload': {'Parts': [{'PartNumber': number, 'ETag': ANY}
+                                                                 for number in (1, 2, 3)]}})
+
+        # The in place copy reads the size of the object, then copies it with the new metadata
+        self.stubber.add_response('head_object', {'ContentLength': 20})
+        self.stubber.add_response('copy_object', {},
+                                  {**key, 'CopySource': ANY, 'Metadata': {'mtime': '1.0', 'md5chksum': md5chksum},
+                                   'MetadataDirective': 'REPLACE', 'StorageClass': 'DEEP_ARCHIVE'})
+        self.stubber.add_response('head_object', {'ContentLength': 20}, key)
+
+        upload = S3MultipartUpload(self.s3_client, 'bucket', key['Key'], storage_class='DEEP_ARCHIVE',
+                                   part_size=8, max_inflight=1, metadata={'mtime': '1.0'})
+        for i in range(0, len(data), 3):
+            upload.write(data[i:i + 3])
+        upload.close()
+
+        self.stubber.assert_no_pending_responses()
+        self.assertEqual(upload.md5, hashlib.md5(data).hexdigest())
+        self.assertFalse(upload.is_aborted)
+
+    def test_single_request(self):
+        '''- An object smaller than a part is sent with a single request and its MD5 metadata.'''
+
+        data = os.urandom(5)
+        self.stubber.add_response('put_object', {'ETag': f'"{hashlib.md5(data).hexdigest()}"'},
+                                  {'Bucket': 'bucket', 'Key': 'file', 'Body': data,
+                                   'ContentMD5': content_md5(data),
+                                   'Metadata': {'md5chksum': content_md5(data)}})
+
+        upload = S3MultipartUpload(self.s3_client, 'bucket', 'file', part_size=8)
+        upload.write(data)
+        upload.close()
+
+        self.stubber.assert_no_pending_responses()
+        self.assertEqual(upload.md5, hashlib.md5(data).hexdigest())
+
+    def test_abort_on_bad_etag(self):
+        '''- A part whose ETag is not its MD5 aborts the upload.'''
+
+        data = os.urandom(16)
+        self.stubber.add_response('create_multipart_upload', {'UploadId': 'id'})
+        self.stubber.add_response('upload_part', {'ETag': f'"{"0" * 32}"'})
+        self.stubber.add_response('abort_multipart_upload', {},
+                                  {'Bucket': 'bucket', 'Key': 'file', 'UploadId': 'id'})
+
+        upload = S3MultipartUpload(self.s3_client, 'bucket', 'file', part_size=8, max_inflight=1)
+        with self.assertRaises(ValueError):
+            upload.write(data)
+            upload.close()
+        upload.abort()
+
+        self.stubber.assert_no_pending_responses()
+        self.assertTrue(upload.is_aborted)
+        self.assertIsNone(upload.md5)
+
+    def test_abort_on_error(self):
+        '''- A failed request aborts the upload when it is closed.'''
+
+        self.stubber.add_response('create_multipart_upload', {'UploadId': 'id'})
+        self.stubber.add_response('upload_part', {'ETag': f'"{hashlib.md5(b"12345678").hexdigest()}"'})
+        self.stubber.add_client_error('upload_part', service_error_code='InternalError')
+        self.stubber.add_response('abort_multipart_upload', {},
+                                  {'Bucket': 'bucket', 'Key': 'file', 'UploadId': 'id'})
+
+        upload = S3MultipartUpload(self.s3_client, 'bucket', 'file', part_size=8, max_inflight=1)
+        upload.write(b'12345678')
+        upload.write(b'abc')
+        with self.assertRaises(Exception):
+            upload.close()
+
+        self.stubber.assert_no_pending_responses()
+        self.assertTrue(upload.is_aborted)
+
+    def test_part_size_grows(self):
+        '''- The part size doubles every 1000 parts, so large objects stay below 10000 parts.'''
+
+        s3_client = FakeS3Client()
+        data = os.urandom(1100)
+        upload = S3MultipartUpload(s3_client, 'bucket', 'file', part_size=1)
+        upload.write(data)
+        upload.close()
+
+        self.assertEqual(len(upload.parts), 1000 + 50)
+        self.assertEqual(s3_client.objects[('bucket', 'file')]['Body'], data)
+        self.assertEqual(s3_client.objects[('bucket', 'file')]['Metadata']['md5chksum'], content_md5(data))
+
+
+class TestStreamFiles(unittest.TestCase):
+    '''Test uploading the files of a folder while they are hashed.'''
+
+    def setUp(self):
+        '''- Create a folder with files larger and smaller than a part, a symlink and froster files.'''
+
+        self.data_dir = tempfile.mkdtemp(prefix='froster_data_')
+        self.folder = tempfile.mkdtemp(prefix='froster_')
+
+        self.files = {'empty': b'', 'small': os.urandom(1000), 'large': os.urandom(40 * 1048576 + 17),
+                      'tarred': os.urandom(10)}
+        for name, data in self.files.items():
+            with open(os.path.join(self.folder, name), 'wb') as f:
+                f.write(data)
+        os.symlink('small', os.path.join(self.folder, 'link'))
+
+        self.arch = local_archiver(self.data_dir)
+        self.arch.cfg.storage_class = 'DEEP_ARCHIVE'
+
+    def tearDown(self):
+        '''- Remove the temporary folders.'''
+
+        shutil.rmtree(self.folder)
+        shutil.rmtree(self.data_dir)
+
+    def stream(self, s3_client):
+        '''- Stream the folder with the given S3 client.'''
+
+        self.arch.s3_client = s3_client
+        with patch('sys.stdout', new_callable=io.StringIO):
+            return self.arch._stream_files(self.folder, ':s3:bucket/archive/folder',
+                                           self.arch.md5sum_filename,
+                                           ['0123  Froster.smallfiles.tar\n'], ('tarred',))
+
+    def test_stream_files(self):
+        '''- The files are uploaded with their MD5 metadata, and their MD5 matches md5sum.'''
+
+        s3_client = FakeS3Client()
+        self.assertTrue(self.stream(s3_client))
+
+        with open(os.path.join(self.folder, self.arch.md5sum_filename)) as f:
+            md5sums = {file: checksum for checksum, file in
+                       (line.rstrip('\n').split('  ', 1) for line in f)}
+
+        # The symlink is only hashed, the excluded files are skipped
+        self.assertEqual(sorted(md5sums), ['Froster.smallfiles.tar', 'empty', 'large', 'link', 'small'])
+        self.assertEqual(md5sums['Froster.smallfiles.tar'], '0123')
+        for file in ('empty', 'large', 'link', 'small'):
+            self.assertEqual(md5sums[file], md5sum(os.path.join(self.folder, file)))
+
+        self.assertEqual(sorted(key for _, key in s3_client.objects),
+                         ['archive/folder/empty', 'archive/folder/large', 'archive/folder/small'])
+        for file in ('empty', 'large', 'small'):
+            obj = s3_client.objects[('bucket', f'archive/folder/{file}')]
+            self.assertEqual(obj['Body'], self.files[file])
+            self.assertEqual(obj['StorageClass'], 'DEEP_ARCHIVE')
+            self.assertEqual(base64.b64decode(obj['Metadata']['md5chksum']).hex(), md5sums[file])
+
+            # The modification time in the rclone format
+            mtime_ns = os.stat(os.path.join(self.folder, file)).st_mtime_ns
+            self.assertEqual(obj['Metadata']['mtime'],
+                             f'{mtime_ns // 1000000000}.{mtime_ns % 1000000000:09d}')
+
+        self.assertTrue(os.path.isfile(os.path.join(self.folder, self.arch.manifest_filename)))
+
+    def test_failed_upload_is_aborted(self):
+        '''- A failed upload is aborted and the folder is not reported as uploaded.'''
+
+        s3_client = FakeS3Client(fail_key='archive/folder/large')
+        self.assertFalse(self.stream(s3_client))
+        self.assertIn('archive/folder/large', s3_client.aborted)
+        self.assertNotIn(('bucket', 'archive/folder/large'), s3_client.objects)
+        self.assertEqual(s3_client.uploads, {})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,224 @@
+import csv
+import io
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import froster.froster as froster
+from froster.froster import FileSystemScanner
+from tests.helpers import local_archiver
+
+
+class ScannerTestCase(unittest.TestCase):
+    '''Tree of folders with a snapshot folder and symlinks.'''
+
+    def setUp(self):
+        '''- Create the tree and a folder outside of it, linked from it.'''
+
+        self.data_dir = tempfile.mkdtemp(prefix='froster_data_')
+        self.folder = tempfile.mkdtemp(prefix='froster_')
+        self.outside = tempfile.mkdtemp(prefix='froster_outside_')
+
+        for path, size in (('f1', 10), ('a/f2', 20), ('a/b/f3', 30), ('c/f4', 40), ('.snapshot/f5', 50)):
+            self.write(os.path.join(self.folder, path), size)
+        self.write(os.path.join(self.outside, 'target'), 60)
+
+        os.symlink(self.outside, os.path.join(self.folder, 'a', 'dirlink'))
+        os.symlink('f1', os.path.join(self.folder, 'filelink'))
+
+    def tearDown(self):
+        '''- Remove the temporary folders.'''
+
+        for folder in (self.folder, self.outside, self.data_dir):
+            shutil.rmtree(folder)
+
+    def write(self, path, size):
+        '''- Write a file of the given size.'''
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+
+    def relative(self, walk):
+        '''- Walk results relative to the folder, sorted.'''
+
+        return sorted((os.path.relpath(root, self.folder), sorted(dirs), sorted(files))
+                      for root, dirs, files in walk)
+
+
+class TestWalk(ScannerTestCase):
+    '''Test the parallel os.walk.'''
+
+    def test_walk(self):
+        '''- Every folder is listed once, .snapshot is skipped, symlinks to folders are files.'''
+
+        self.assertEqual(self.relative(FileSystemScanner().walk(self.folder)),
+                         [('.', ['a', 'c'], ['f1', 'filelink']),
+                          ('a', ['b'], ['dirlink', 'f2']),
+                          ('a/b', [], ['f3']),
+                          ('c', [], ['f4'])])
+
+    def test_top_first(self):
+        '''- A folder is yielded before its subfolders, the dirs list prunes the walk.'''
+
+        seen = []
+        for root, dirs, files in FileSystemScanner().walk(self.folder):
+            seen.append(os.path.relpath(root, self.folder))
+            if root == self.folder:
+                dirs.remove('a')
+
+        self.assertEqual(seen, ['.', 'c'])
+
+    def test_skipdirs(self):
+        '''- The skipped folder names can be changed, the default is not shared.'''
+
+        walk = self.relative(FileSystemScanner(skipdirs=['b']).walk(self.folder))
+        self.assertIn(('.snapshot', [], ['f5']), walk)
+        self.assertNotIn('a/b', [root for root, _, _ in walk])
+
+        self.assertEqual(FileSystemScanner().skipdirs, {'.snapshot'})
+
+    def test_unreadable_folder(self):
+        '''- A folder that cannot be listed is reported and the walk goes on.'''
+
+        locked = os.path.join(self.folder, 'a')
+        scandir = os.scandir
+
+        def deny(path):
+            if path == locked:
+                raise PermissionError(13, 'Permission denied', path)
+            return scandir(path)
+
+        errors = []
+        with patch('os.scandir', side_effect=deny):
+            walk = self.relative(FileSystemScanner().walk(self.folder, onerror=errors.append))
+
+        self.assertEqual([root for root, _, _ in walk], ['.', 'c'])
+        self.assertEqual([e.filename for e in errors], [locked])
+
+    def test_one_file_system(self):
+        '''- Subfolders on another device are left out, unless one_file_system is off.'''
+
+        lstat = os.lstat
+        top_stat = lstat(self.folder)
+
+        def other_device(path):
+            if path == self.folder:
+                return os.stat_result(top_stat[:2] + (top_stat.st_dev + 1,) + top_stat[3:])
+            return lstat(path)
+
+        with patch('os.lstat', side_effect=other_device):
+            self.assertEqual(self.relative(FileSystemScanner().walk(self.folder)),
+                             [('.', [], ['f1', 'filelink'])])
+            self.assertEqual(len(self.relative(FileSystemScanner(one_file_system=False).walk(self.folder))), 4)
+
+        subfolders, files = FileSystemScanner().list_folder(self.folder, dev=top_stat.st_dev + 1)
+        self.assertEqual(subfolders, [])
+        self.assertEqual(sorted(os.path.basename(path) for path, _ in files), ['f1', 'filelink'])
+
+
+class TestScan(ScannerTestCase):
+    '''Test the pwalk CSV written by the scanner.'''
+
+    def scan(self, scanner):
+        '''- Scan the folder, returns the rows by path relative to the folder.'''
+
+        out = io.BytesIO()
+        scanner.scan(self.folder, out)
+        rows = list(csv.DictReader(io.StringIO(out.getvalue().decode())))
+        return {os.path.relpath(row['filename'], self.folder): row for row in rows}
+
+    def test_scan(self):
+        '''- Folders have the number and size of their files, symlinks are files that are not followed.'''
+
+        rows = self.scan(FileSystemScanner())
+
+        self.assertEqual(sorted(rows), ['.', 'a', 'a/b', 'a/b/f3', 'a/dirlink', 'a/f2', 'c', 'c/f4',
+                                        'f1', 'filelink'])
+
+        self.assertEqual((rows['.']['pw_fcount'], rows['a']['pw_fcount'], rows['a/b']['pw_fcount']), ('2', '2', '1'))
+        self.assertEqual(int(rows['a']['pw_dirsum']),
+                         20 + os.lstat(os.path.join(self.folder, 'a', 'dirlink')).st_size)
+
+        dirlink = rows['a/dirlink']
+        self.assertEqual((dirlink['pw_fcount'], dirlink['pw_dirsum']), ('-1', '0'))
+        self.assertTrue(stat.S_ISLNK(int(dirlink['st_mode'], 8)))
+        self.assertEqual(dirlink['parent-inode'], rows['a']['inode'])
+        self.assertEqual(rows['a/b/f3']['directory-depth'], '2')
+
+    def test_locked_folder(self):
+        '''- A folder that cannot be listed is reported as locked and left out.'''
+
+        locked = os.path.join(self.folder, 'a')
+        scandir = os.scandir
+
+        def deny(path):
+            if path == locked:
+                raise PermissionError(13, 'Permission denied', path)
+            return scandir(path)
+
+        scanner = FileSystemScanner()
+        with patch('os.scandir', side_effect=deny):
+            rows = self.scan(scanner)
+
+        self.assertEqual(sorted(rows), ['.', 'c', 'c/f4', 'f1', 'filelink'])
+        self.assertEqual(scanner.errors, [f'Locked Dir: {locked}'])
+
+
+class TestDirectorySymlinks(ScannerTestCase):
+    '''Test that the folder operations do not follow symlinks to folders.'''
+
+    def test_walker(self):
+        '''- The walker skips .snapshot by default and lists symlinks to folders as files.'''
+
+        arch = local_archiver(self.data_dir)
+
+        self.assertEqual(self.relative(arch._walker(self.folder)),
+                         self.relative(FileSystemScanner().walk(self.folder)))
+        self.assertIn('.snapshot', [root for root, _, _ in self.relative(arch._walker(self.folder, skipdirs=[]))])
+
+    def test_delete(self):
+        '''- Deleting the archived files removes a symlink to a folder, not the folder it points to.'''
+
+        top = os.path.join(self.folder, 'a')
+        arch = local_archiver(self.data_dir)
+        arch.cfg.email = 'user@example.com'
+        with open(os.path.join(top, arch.md5sum_filename), 'w') as f:
+            f.write('0123  f2\n')
+
+        entry = dict(local_folder=top, archive_folder=':s3:bucket/a', provider='AWS', endpoint='',
+                     s3_storage_class='DEEP_ARCHIVE', archive_mode='Single', profile='default', user='user')
+
+        with patch.object(arch, 'froster_archives_get_entry', return_value=entry), \
+                patch.object(froster, 'Rclone') as rclone, \
+                patch('sys.stdout', new_callable=io.StringIO):
+            rclone.return_value.checksum.return_value = True
+            arch._delete_locally(top)
+
+        self.assertEqual(sorted(os.listdir(top)),
+                         sorted(['b', arch.md5sum_filename, arch.where_did_the_files_go_filename]))
+        self.assertEqual(os.listdir(os.path.join(top, 'b')), ['f3'])
+        self.assertEqual(os.listdir(self.outside), ['target'])
+
+    def test_reset(self):
+        '''- Resetting a folder removes its froster files, not those of a folder linked from it.'''
+
+        top = os.path.join(self.folder, 'a')
+        arch = local_archiver(self.data_dir)
+        for folder in (top, self.outside):
+            with open(os.path.join(folder, arch.allfiles_csv_filename), 'w') as f:
+                f.write('File,Tarred\n')
+
+        with patch('sys.stdout', new_callable=io.StringIO):
+            self.assertTrue(arch.reset_folder(top))
+
+        self.assertFalse(os.path.exists(os.path.join(top, arch.allfiles_csv_filename)))
+        self.assertTrue(os.path.islink(os.path.join(top, 'dirlink')))
+        self.assertEqual(sorted(os.listdir(self.outside)), sorted(['target', arch.allfiles_csv_filename]))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from froster.froster import LazyTableSource
+
+HEADER = 'User,AccD,GiB,Folder\n'
+
+ROWS = [('alice', 400, 1.5, '/data/a'),
+        ('bob', 30, 120.0, '/data/b'),
+        ('carol', 1000, 12.25, '/data/c, "old"'),
+        ('alice', 90, 0.5, '/data/d')]
+
+
+def csv_text(rows):
+    lines = []
+    for user, accd, gib, folder in rows:
+        folder = folder.replace('"', '""')
+        lines.append(f'{user},{accd},{gib},"{folder}"\n')
+    return HEADER + ''.join(lines)
+
+
+class TestLazyTableSource(unittest.TestCase):
+    '''Test the rows of the tables paged in from DuckDB.'''
+
+    def setUp(self):
+        '''- Write the rows to a CSV file.'''
+
+        self.tmpdir = tempfile.mkdtemp(prefix='froster_')
+        self.csv_file = os.path.join(self.tmpdir, 'hotspots.csv')
+        with open(self.csv_file, 'w') as f:
+            f.write(csv_text(ROWS))
+
+    def tearDown(self):
+        '''- Remove the temporary folder.'''
+
+        shutil.rmtree(self.tmpdir)
+
+    def test_paging(self):
+        '''- Pages of rows are fetched in the order of the file.'''
+
+        source = LazyTableSource(csv_file=self.csv_file)
+
+        self.assertEqual(source.columns, ['User', 'AccD', 'GiB', 'Folder'])
+        self.assertEqual((source.count, source.total), (4, 4))
+        self.assertEqual(source.fetch(0, 2), [['alice', '400', '1.5', '/data/a'],
+                                              ['bob', '30', '120.0', '/data/b']])
+        self.assertEqual(source.fetch(2, 10), [['carol', '1000', '12.25', '/data/c, "old"'],
+                                               ['alice', '90', '0.5', '/data/d']])
+        self.assertEqual(source.fetch(4, 10), [])
+
+    def test_sort(self):
+        '''- Numeric columns sort as numbers, largest first, sorting again reverses the order.'''
+
+        source = LazyTableSource(csv_file=self.csv_file)
+        self.assertEqual(source.numeric, {'AccD', 'GiB'})
+
+        source.sort('GiB')
+        self.assertEqual([row[2] for row in source.fetch(0, 10)], ['120.0', '12.25', '1.5', '0.5'])
+
+        source.sort('GiB')
+        self.assertEqual([row[2] for row in source.fetch(0, 10)], ['0.5', '1.5', '12.25', '120.0'])
+
+        # Text columns sort ascending, equal values keep the order of the file
+        source.sort('User')
+        self.assertEqual([(row[0], row[3]) for row in source.fetch(0, 10)],
+                         [('alice', '/data/a'), ('alice', '/data/d'),
+                          ('bob', '/data/b'), ('carol', '/data/c, "old"')])
+
+        # A page of the sorted rows
+        source.sort('AccD')
+        self.assertEqual([row[1] for row in source.fetch(1, 2)], ['400', '90'])
+
+    def test_filter_count(self):
+        '''- The count is the number of rows matching the filter, the total is unchanged.'''
+
+        source = LazyTableSource(csv_file=self.csv_file)
+
+        source.filter('AccD>=90 user=alice')
+        self.assertEqual((source.count, source.total), (2, 4))
+        self.assertEqual([row[3] for row in source.fetch(0, 10)], ['/data/a', '/data/d'])
+        self.assertIn('2 of 4 rows', source.status(2))
+
+        source.filter('OLD')
+        self.assertEqual(source.count, 1)
+
+        source.filter('')
+        self.assertEqual(source.count, 4)
+
+    def test_csv_string(self):
+        '''- The rows of a CSV string are text, short rows are padded.'''
+
+        source = LazyTableSource(csv_string=csv_text(ROWS) + 'dave,5\n')
+
+        self.assertEqual(source.numeric, set())
+        self.assertEqual(source.total, 5)
+        self.assertEqual(source.fetch(2, 1), [['carol', '1000', '12.25', '/data/c, "old"']])
+        self.assertEqual(source.fetch(4, 1), [['dave', '5', '', '']])
+
+        # As text, 1000 sorts before 30
+        source.sort('AccD')
+        self.assertEqual([row[1] for row in source.fetch(0, 3)], ['1000', '30', '400'])
+
+    def test_empty(self):
+        '''- An empty CSV string or one with a header only has no rows.'''
+
+        source = LazyTableSource(csv_string='')
+        self.assertEqual((source.columns, source.total, source.fetch(0, 10)), ([], 0, []))
+
+        source = LazyTableSource(csv_string=HEADER)
+        self.assertEqual(source.columns, ['User', 'AccD', 'GiB', 'Folder'])
+        self.assertEqual((source.total, source.fetch(0, 10)), (0, []))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
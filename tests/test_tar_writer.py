@@ -0,0 +1,258 @@
+import concurrent.futures
+import csv
+import datetime
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from tests.helpers import local_archiver
+
+CSV_HEADER = ['File', 'Size(bytes)', 'Date-Modified', 'Date-Accessed', 'Owner', 'Group', 'Permissions', 'Tarred']
+
+
+class TarWriterTestCase(unittest.TestCase):
+    '''Folder with small and large files, symlinks and a subfolder.'''
+
+    def setUp(self):
+        '''- Create the folder.'''
+
+        self.data_dir = tempfile.mkdtemp(prefix='froster_data_')
+        self.folder = tempfile.mkdtemp(prefix='froster_')
+        self.arch = local_archiver(self.data_dir)
+
+        self.contents = {}
+        for i in range(20):
+            self.write(f'small{i:02d}.txt', 100 + i)
+        self.write('large.dat', 4096)
+        self.write('sub/nested.txt', 10)
+        os.symlink('small00.txt', os.path.join(self.folder, 'link'))
+        os.link(os.path.join(self.folder, 'small01.txt'), os.path.join(self.folder, 'hardlink'))
+        self.contents['hardlink'] = self.contents['small01.txt']
+
+    def tearDown(self):
+        '''- Remove the temporary folders.'''
+
+        shutil.rmtree(self.folder)
+        shutil.rmtree(self.data_dir)
+
+    def write(self, name, size):
+        '''- Write a file of the given size below the folder.'''
+
+        path = os.path.join(self.folder, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.contents[name] = os.urandom(size)
+        with open(path, 'wb') as f:
+            f.write(self.contents[name])
+
+
+class TestGenAllfilesAndTar(TarWriterTestCase):
+    '''Test the small files tar and the allfiles CSV written from one listing.'''
+
+    def gen(self):
+        '''- Tar the files smaller than 1 KiB, returns the listing before, the CSV rows and the tar members.'''
+
+        listing = [entry.name for entry in os.scandir(self.folder) if not entry.is_dir(follow_symlinks=False)]
+        stats = {name: os.lstat(os.path.join(self.folder, name)) for name in listing}
+
+        with patch('sys.stdout', new_callable=io.StringIO):
+            self.assertTrue(self.arch._gen_allfiles_and_tar(self.folder, smallsize=1))
+
+        with open(os.path.join(self.folder, self.arch.allfiles_csv_filename), newline='') as f:
+            rows = list(csv.reader(f))
+
+        with tarfile.open(os.path.join(self.folder, self.arch.smallfiles_tar_filename)) as tar:
+            members = [(member, tar.extractfile(member).read() if member.isreg() else None)
+                       for member in tar.getmembers()]
+
+        return listing, stats, rows, members
+
+    def test_member_order(self):
+        '''- The tar members and the CSV rows follow the order of the directory listing.'''
+
+        listing, _, rows, members = self.gen()
+
+        self.assertEqual(rows[0], CSV_HEADER)
+        self.assertEqual([row[0] for row in rows[1:]], listing)
+        self.assertEqual([member.name for member, _ in members],
+                         [name for name in listing if name != 'large.dat'])
+
+    def test_contents(self):
+        '''- The small files are in the tar and removed, the large file and the subfolder are left.'''
+
+        _, _, _, members = self.gen()
+
+        for member, data in members:
+            if member.isreg():
+                self.assertEqual(data, self.contents[member.name])
+
+        self.assertEqual(sorted(os.listdir(self.folder)),
+                         sorted([self.arch.allfiles_csv_filename, self.arch.smallfiles_tar_filename,
+                                 'large.dat', 'sub']))
+        self.assertEqual(os.listdir(os.path.join(self.folder, 'sub')), ['nested.txt'])
+
+    def test_allfiles_csv(self):
+        '''- The CSV rows have the size, dates, owner, group and mode of each file.'''
+
+        _, stats, rows, _ = self.gen()
+
+        for row in rows[1:]:
+            file_stat = stats[row[0]]
+            with self.subTest(name=row[0]):
+                self.assertEqual(row[1:], [
+                    str(file_stat.st_size),
+                    datetime.datetime.fromtimestamp(file_stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
+                    datetime.datetime.fromtimestamp(file_stat.st_atime).strftime('%Y-%m-%d %H:%M:%S'),
+                    str(self.arch.uid2user(file_stat.st_uid)),
+                    str(self.arch.gid2group(file_stat.st_gid)),
+                    oct(file_stat.st_mode),
+                    'No' if row[0] == 'large.dat' else 'Yes'])
+
+    def test_links(self):
+        '''- A symlink is tarred as a symlink, the second name of a hard link as a link to the first.'''
+
+        listing, _, _, members = self.gen()
+        members = {member.name: member for member, _ in members}
+
+        self.assertTrue(members['link'].issym())
+        self.assertEqual(members['link'].linkname, 'small00.txt')
+
+        first, second = sorted(('small01.txt', 'hardlink'), key=listing.index)
+        self.assertTrue(members[first].isreg())
+        self.assertTrue(members[second].islnk())
+        self.assertEqual(members[second].linkname, first)
+
+    def test_existing_tar(self):
+        '''- A folder that already has a tar file is left alone.'''
+
+        tar_path = os.path.join(self.folder, self.arch.smallfiles_tar_filename)
+        with open(tar_path, 'wb'):
+            pass
+
+        self.assertTrue(self.arch._gen_allfiles_and_tar(self.folder, smallsize=1))
+        self.assertFalse(os.path.exists(os.path.join(self.folder, self.arch.allfiles_csv_filename)))
+        self.assertTrue(os.path.exists(os.path.join(self.folder, 'small00.txt')))
+
+
+class TestTarinfoFromStat(TarWriterTestCase):
+    '''Test the tar headers built from the listing stat.'''
+
+    def test_same_as_gettarinfo(self):
+        '''- The headers are those of tarfile.gettarinfo for files, symlinks and hard links.'''
+
+        fields = ('name', 'type', 'mode', 'uid', 'gid', 'uname', 'gname', 'mtime', 'size', 'linkname')
+
+        with tarfile.open(fileobj=io.BytesIO(), mode='w') as expected, \
+                tarfile.open(fileobj=io.BytesIO(), mode='w') as built:
+            for name in ('small00.txt', 'small01.txt', 'hardlink', 'link', 'large.dat'):
+                path = os.path.join(self.folder, name)
+                with self.subTest(name=name):
+                    tarinfo = expected.gettarinfo(path, name)
+                    built_info = self.arch._tarinfo_from_stat(built, path, name, os.lstat(path))
+                    self.assertEqual({field: getattr(built_info, field) for field in fields},
+                                     {field: getattr(tarinfo, field) for field in fields})
+
+            # Both know the inodes of the regular files, for the next hard links
+            self.assertEqual(built.inodes, expected.inodes)
+
+    def test_not_a_file(self):
+        '''- A folder has no header.'''
+
+        path = os.path.join(self.folder, 'sub')
+        with tarfile.open(fileobj=io.BytesIO(), mode='w') as tar:
+            with self.assertRaises(ValueError):
+                self.arch._tarinfo_from_stat(tar, path, 'sub', os.lstat(path))
+
+
+class TestPrefetchFiles(TarWriterTestCase):
+    '''Test reading the small files ahead of the tar writer.'''
+
+    def prefetch(self, files):
+        '''- Consume the read ahead files, returns them and the files submitted when each was yielded.'''
+
+        submit = concurrent.futures.ThreadPoolExecutor.submit
+        submitted = []
+
+        def record(executor, fn, path):
+            submitted.append(os.path.basename(path))
+            return submit(executor, fn, path)
+
+        results = []
+        with patch.object(concurrent.futures.ThreadPoolExecutor, 'submit', autospec=True, side_effect=record):
+            for path, data, error in self.arch._prefetch_files(files):
+                results.append((os.path.basename(path), data, error, list(submitted)))
+
+        return results
+
+    def test_order(self):
+        '''- The files are yielded in the given order, even when the first ones are read last.'''
+
+        names = [f'small{i:02d}.txt' for i in range(20)]
+        real_open = open
+
+        def slow_open(path, *args, **kwargs):
+            # The first files take longer to read than the others
+            if os.path.basename(path) in names[:3]:
+                time.sleep(0.05)
+            return real_open(path, *args, **kwargs)
+
+        with patch('builtins.open', side_effect=slow_open):
+            results = self.prefetch([(os.path.join(self.folder, name), len(self.contents[name])) for name in names])
+
+        self.assertEqual([(name, data, error) for name, data, error, _ in results],
+                         [(name, self.contents[name], None) for name in names])
+
+    def test_readahead_budget(self):
+        '''- The files read ahead fit in max_tar_readahead_mib, a larger file is read on its own.'''
+
+        self.arch.readaheadMB = 1
+        MiB = 1048576
+        sizes = [('small00.txt', MiB // 2 - 1), ('small01.txt', MiB // 2 - 1), ('large.dat', 2 * MiB),
+                 ('small02.txt', MiB // 4), ('small03.txt', MiB // 4)]
+
+        results = self.prefetch([(os.path.join(self.folder, name), size) for name, size in sizes])
+
+        self.assertEqual([(name, submitted) for name, _, _, submitted in results], [
+            ('small00.txt', ['small00.txt', 'small01.txt']),
+            ('small01.txt', ['small00.txt', 'small01.txt']),
+            ('large.dat', ['small00.txt', 'small01.txt', 'large.dat']),
+            ('small02.txt', ['small00.txt', 'small01.txt', 'large.dat', 'small02.txt', 'small03.txt']),
+            ('small03.txt', ['small00.txt', 'small01.txt', 'large.dat', 'small02.txt', 'small03.txt'])])
+
+    def test_errors(self):
+        '''- A file that cannot be read is yielded with its error, the others are read.'''
+
+        names = ['small00.txt', 'missing.txt', 'small01.txt']
+        results = self.prefetch([(os.path.join(self.folder, name), 100) for name in names])
+
+        self.assertEqual([name for name, _, _, _ in results], names)
+        self.assertIsInstance(results[1][2], FileNotFoundError)
+        self.assertIsNone(results[1][1])
+        self.assertEqual((results[0][1], results[2][1]), (self.contents['small00.txt'], self.contents['small01.txt']))
+
+    def test_stop_early(self):
+        '''- Closing the generator does not read the files not yet submitted.'''
+
+        self.arch.readaheadMB = 1
+        names = [f'small{i:02d}.txt' for i in range(20)]
+        opened = []
+        real_open = open
+
+        def record_open(path, *args, **kwargs):
+            opened.append(os.path.basename(path))
+            return real_open(path, *args, **kwargs)
+
+        with patch('builtins.open', side_effect=record_open):
+            prefetched = self.arch._prefetch_files([(os.path.join(self.folder, name), 262144) for name in names])
+            self.assertEqual(next(prefetched)[0], os.path.join(self.folder, names[0]))
+            prefetched.close()
+
+        self.assertLessEqual(set(opened), set(names[:4]))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)